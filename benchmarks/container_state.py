@@ -0,0 +1,206 @@
+"""
+Memory and load / save time of the course state, old models vs slotted ones
+
+A synthetic course (20 sections, one downloaded resource per item) is saved
+and loaded the way course_info does. The old side replays the models as they
+were: plain objects serialised from their __dict__ with the json module, every
+item built on load. The new side is src.container with src.serial (orjson when
+installed), a section builds its items on first use.
+
+    python benchmarks/container_state.py [items] [rounds]
+"""
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from time import perf_counter, time
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import serial  # noqa: E402
+from src.container import resource_table, section_info  # noqa: E402
+from src.fingerprint import fingerprint  # noqa: E402
+
+SECTIONS = 20
+TYPES = ["resource", "resource", "resource", "page", "folder", "lti"]
+
+
+def course_json(items: int) -> Dict:
+    contents = dict()
+    resources = dict()
+    per_section = items // SECTIONS
+    for section in range(SECTIONS):
+        section_items = dict()
+        for index in range(section * per_section, (section + 1) * per_section):
+            item_id = str(100000 + index)
+            mod = TYPES[index % len(TYPES)]
+            link = f"https://umass.moonami.com/mod/{mod}/view.php?id={item_id}"
+            detail = dict()
+            if mod == "folder":
+                detail = {"post_params": {"id": item_id, "sesskey": "a1b2c3d4e5"}}
+            section_items[item_id] = {
+                "id": item_id,
+                "title": f"Lecture {index} notes",
+                "type": mod,
+                "link": link,
+                "detail": detail,
+                "content": [f"Reading for week {section}, chapters 1-3."],
+                "checksum": fingerprint(link),
+                "expirey": time() + 86400,
+                "detail_expirey": None,
+                "detail_validator": None,
+            }
+            resources[link] = {
+                "url": link,
+                "final_url": f"https://umass.moonami.com/pluginfile.php/{item_id}/notes.pdf",
+                "revision": fingerprint(link),
+                "content_length": 1048576 + index,
+                "content_type": "application/pdf",
+                "etag": f'"{fingerprint(item_id)}"',
+                "last_modified": "Wed, 01 Feb 2023 00:00:00 GMT",
+                "accept_ranges": "bytes",
+                "not_modified": False,
+                "local_path": f"course/{section:02d}-Week {section}/{index:04d}-notes.pdf",
+                "local_etag": f'"{fingerprint(item_id)}"',
+                "local_last_modified": "Wed, 01 Feb 2023 00:00:00 GMT",
+                "digest": fingerprint(item_id) * 2,
+                "expirey": time() + 600,
+            }
+        contents[f"section-{section}"] = {
+            "title": f"Week {section}",
+            "checksum": fingerprint(f"section-{section}"),
+            "expirey": time() + 86400,
+            "items": section_items,
+        }
+    return {
+        "general": {"course-id": "35816", "course-title": "Course: COMPSCI 589"},
+        "contents": contents,
+        "resources": resources,
+    }
+
+
+class old_info:
+    # the models before __slots__: fields in __dict__, to_json returns it
+    def __init__(self, **fields) -> None:
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+    def to_json(self) -> Dict:
+        return self.__dict__
+
+
+def old_load(data: bytes) -> Dict:
+    info_dict = json.loads(data.decode("utf-8"))
+    contents = dict()
+    for key, value in info_dict["contents"].items():
+        items = value.pop("items")
+        section = old_info(**value)
+        section.items = {
+            item_id: old_info(**item_json) for item_id, item_json in items.items()
+        }
+        contents[key] = section
+    resources = {
+        url: old_info(**resource_json)
+        for url, resource_json in info_dict["resources"].items()
+    }
+    return {
+        "general": info_dict["general"],
+        "contents": contents,
+        "resources": resources,
+    }
+
+
+def old_save(state: Dict) -> bytes:
+    return json.dumps(state, indent=4, default=lambda x: x.to_json()).encode("utf-8")
+
+
+def new_load(data: bytes) -> Dict:
+    info_dict = serial.loads(data)
+    contents = dict()
+    for key, value in info_dict["contents"].items():
+        contents[key] = section_info.from_json(value)
+    return {
+        "general": info_dict["general"],
+        "contents": contents,
+        "resources": resource_table.from_json(info_dict["resources"]),
+    }
+
+
+def new_save(state: Dict) -> bytes:
+    return serial.dumps(state, indent=True)
+
+
+def touch_items(state: Dict) -> Dict:
+    for section in state["contents"].values():
+        section.items
+    return state
+
+
+def best_time(func: Callable, arg: object, rounds: int) -> float:
+    best = None
+    for _ in range(rounds):
+        start = perf_counter()
+        func(arg)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def held_memory(load: Callable, data: bytes) -> int:
+    """
+    Bytes still allocated by the loaded state once its JSON is freed
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    state = load(data)
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del state
+    return held
+
+
+if __name__ == "__main__":
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    source = json.dumps(course_json(items)).encode("utf-8")
+    old_state = old_load(source)
+    new_state = new_load(source)
+    old_data = old_save(old_state)
+    new_data = new_save(new_state)
+    assert json.loads(old_data) == json.loads(new_data)
+
+    backend = "orjson" if serial.orjson is not None else "json"
+    print(f"Course state: {items} items, {items} resources")
+    print(f"Old models, json:       {len(old_data) / 1024:8.0f} KiB saved")
+    print(f"Slotted models, {backend:6}: {len(new_data) / 1024:8.0f} KiB saved")
+    print()
+    print("                         old        new")
+    old_load_time = best_time(old_load, old_data, rounds)
+    new_load_time = best_time(new_load, new_data, rounds)
+    full_load = lambda data: touch_items(new_load(data))
+    full_load_time = best_time(full_load, new_data, rounds)
+    old_save_time = best_time(old_save, old_state, rounds)
+    touch_items(new_state)
+    new_save_time = best_time(new_save, new_state, rounds)
+    print(
+        f"load:              {old_load_time * 1000:8.1f} ms {new_load_time * 1000:8.1f} ms"
+    )
+    print(
+        f"load, every item:  {old_load_time * 1000:8.1f} ms {full_load_time * 1000:8.1f} ms"
+    )
+    print(
+        f"save:              {old_save_time * 1000:8.1f} ms {new_save_time * 1000:8.1f} ms"
+    )
+    old_memory = held_memory(old_load, old_data)
+    new_memory = held_memory(new_load, new_data)
+    full_memory = held_memory(full_load, new_data)
+    print(
+        f"memory:            {old_memory / 2**20:8.1f} MB {new_memory / 2**20:8.1f} MB"
+    )
+    print(
+        f"memory, every item:{old_memory / 2**20:8.1f} MB {full_memory / 2**20:8.1f} MB"
+    )
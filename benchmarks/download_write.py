@@ -0,0 +1,124 @@
+"""
+CPU cost of the download write path, old 8 KB iter_content loop vs read_stream
+
+The file is served from memory by a local server running in another process,
+so the CPU time measured here is only spent by the client.
+
+A text file sent with Content-Encoding: gzip is also fetched through
+read_stream, and checked to be written decoded.
+
+    python benchmarks/download_write.py [size in MiB] [rounds]
+"""
+import gzip
+import os
+import sys
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Process
+from time import perf_counter, process_time, sleep
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.downloader import read_stream  # noqa: E402
+
+PORT = 8765
+BLOCK = os.urandom(1024 * 1024)
+TEXT = b"".join(b"line %d of the lecture notes\n" % index for index in range(100000))
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/gzip":
+            body = gzip.compress(TEXT)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Encoding", "gzip")
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        size = int(self.path.strip("/")) * len(BLOCK)
+        self.send_response(200)
+        self.send_header("Content-Length", str(size))
+        self.send_header("Content-Type", "application/octet-stream")
+        self.end_headers()
+        for _ in range(size // len(BLOCK)):
+            self.wfile.write(BLOCK)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve():
+    ThreadingHTTPServer(("127.0.0.1", PORT), handler).serve_forever()
+
+
+def iter_content_loop(res_obj, file_obj):
+    for chunk in res_obj.iter_content(chunk_size=8192):
+        if not chunk:
+            continue
+        file_obj.write(chunk)
+
+
+def read_stream_loop(res_obj, file_obj):
+    read_stream(res_obj=res_obj, file_obj=file_obj, on_read=lambda length: None)
+
+
+def measure(session, size_mib, write_loop, path):
+    with session.get(f"http://127.0.0.1:{PORT}/{size_mib}", stream=True) as res_obj:
+        with open(path, "wb") as file_obj:
+            cpu_start, wall_start = process_time(), perf_counter()
+            write_loop(res_obj, file_obj)
+            return process_time() - cpu_start, perf_counter() - wall_start
+
+
+def check_gzip(session, path):
+    """
+    Whether a gzip encoded body is written decoded, and fully received
+    """
+    with session.get(f"http://127.0.0.1:{PORT}/gzip", stream=True) as res_obj:
+        with open(path, "wb") as file_obj:
+            written = read_stream(
+                res_obj=res_obj, file_obj=file_obj, on_read=lambda length: None
+            )
+        received = res_obj.raw.tell()
+        content_length = int(res_obj.headers["Content-Length"])
+    with open(path, "rb") as file_obj:
+        decoded = file_obj.read() == TEXT
+    return decoded and written == len(TEXT) and received == content_length
+
+
+def main():
+    size_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    server = Process(target=serve, daemon=True)
+    server.start()
+    sleep(0.5)
+    session = requests.Session()
+    path = os.path.join(tempfile.gettempdir(), "moodle-download-bench.bin")
+    try:
+        passed = check_gzip(session, path)
+        print(f"{'[Passed]' if passed else '[Failed]'} gzip body written decoded")
+        if not passed:
+            sys.exit(1)
+        for name, write_loop in [
+            ("iter_content(8192)", iter_content_loop),
+            ("read_stream", read_stream_loop),
+        ]:
+            cpu, wall = min(
+                measure(session, size_mib, write_loop, path) for _ in range(rounds)
+            )
+            per_gb = cpu * 1024 / size_mib
+            print(
+                f"{name:>20}: {per_gb:.3f} s CPU/GB, {size_mib / wall:.0f} MiB/s wall"
+            )
+    finally:
+        server.terminate()
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
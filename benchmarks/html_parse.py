@@ -0,0 +1,123 @@
+"""
+Parse cost of a course page, old full html.parser tree vs the parser layer
+
+The page is generated with the markup of a moodle course page: a heavy
+<head>, navigation and blocks around the sections, and the activities
+spread over the sections. Both sides then walk every activity the way
+extractor.extract_section_info does.
+
+    python benchmarks/html_parse.py [activities] [rounds]
+"""
+import os
+import sys
+from time import perf_counter
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.parser import course_page, find_title, parse_html  # noqa: E402
+from src.utils.enums import parser_mode  # noqa: E402
+
+SECTIONS = 20
+TYPES = ["resource", "folder", "page", "url", "lti", "forum", "quiz", "assign"]
+
+
+def activity(index: int) -> str:
+    mod = TYPES[index % len(TYPES)]
+    return (
+        f'<li class="activity {mod} modtype_{mod}" id="module-{100000 + index}">'
+        '<div><div class="mod-indent-outer"><div class="contentwithoutlink">'
+        '<div class="activityinstance">'
+        f'<a class="aalink" href="https://umass.moonami.com/mod/{mod}/view.php?id={100000 + index}">'
+        f'<img src="https://umass.moonami.com/theme/image.php/{mod}/icon" class="iconlarge activityicon" alt="">'
+        f'<span class="instancename">Lecture {index} notes<span class="accesshide"> {mod}</span></span></a>'
+        "</div>"
+        f'<div class="contentafterlink"><div class="no-overflow"><p>Reading for week {index % SECTIONS}, '
+        "chapters 1&ndash;3.</p></div></div>"
+        '<span class="actions"><form method="post" action="togglecompletion.php">'
+        f'<input type="hidden" name="id" value="{100000 + index}">'
+        '<input type="hidden" name="sesskey" value="a1b2c3d4e5">'
+        '<button class="btn btn-link">Mark as done</button></form></span>'
+        "</div></div></div></li>"
+    )
+
+
+def course_html(activities: int) -> bytes:
+    head = "".join(
+        f'<link rel="stylesheet" href="https://umass.moonami.com/theme/styles.php/{i}">'
+        f'<script src="https://umass.moonami.com/lib/javascript.php/{i}"></script>'
+        for i in range(60)
+    )
+    nav = "".join(
+        f'<li class="type_course"><a href="https://umass.moonami.com/course/view.php?id={i}">Course {i}</a></li>'
+        for i in range(200)
+    )
+    blocks = "".join(
+        f'<section class="block"><div class="content"><p>Announcement {i}</p></div></section>'
+        for i in range(100)
+    )
+    sections = []
+    per_section = activities // SECTIONS
+    for index in range(SECTIONS):
+        items = "".join(
+            activity(index * per_section + item) for item in range(per_section)
+        )
+        sections.append(
+            f'<li id="section-{index}" class="section main clearfix" aria-label="Week {index}">'
+            f'<div class="content"><h3 class="sectionname">Week {index}</h3>'
+            f'<div id="collapse-{index}"><ul class="section img-text">{items}</ul></div></div></li>'
+        )
+    return (
+        f"<!DOCTYPE html><html><head><title>Course: COMPSCI 589</title>{head}</head>"
+        f'<body><nav><ul>{nav}</ul></nav><div id="page"><ul class="topics">'
+        f"{''.join(sections)}</ul></div><aside>{blocks}</aside></body></html>"
+    ).encode("utf-8")
+
+
+def walk(soup: BeautifulSoup) -> int:
+    found = 0
+    for index, section in enumerate(
+        soup.find_all("li", class_="section main clearfix")
+    ):
+        elements = section.find(id=f"collapse-{index}")
+        for elem in elements.find_all("li"):
+            if elem.find("span", class_="instancename") is None:
+                continue
+            elem.find("div", class_="activityinstance")
+            found += 1
+    return found
+
+
+def old_parse(content: bytes) -> int:
+    soup = BeautifulSoup(content.decode(encoding="utf-8"), "html.parser")
+    soup.find("title").text
+    return walk(soup)
+
+
+def new_parse(content: bytes) -> int:
+    find_title(content)
+    return walk(parse_html(content, mode=parser_mode.LXML, parse_only=course_page))
+
+
+def measure(parse, content: bytes, rounds: int) -> float:
+    best = None
+    for _ in range(rounds):
+        start = perf_counter()
+        found = parse(content)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, found
+
+
+if __name__ == "__main__":
+    activities = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    content = course_html(activities)
+    print(f"Course page: {activities} activities, {len(content) / 1024:.0f} KiB")
+    old_time, old_found = measure(old_parse, content, rounds)
+    new_time, new_found = measure(new_parse, content, rounds)
+    assert old_found == new_found
+    print(f"html.parser, full tree:   {old_time * 1000:8.1f} ms")
+    print(f"lxml, sections only:      {new_time * 1000:8.1f} ms")
+    print(f"Speedup: {old_time / new_time:.1f}x ({new_found} activities found)")
@@ -0,0 +1,236 @@
+"""
+Local stub of the moodle web services, serving the recorded JSON of
+benchmarks/fixtures, and the checks of the REST extractor against it
+
+The stub answers the POST of ws_extractor.call with the recording named after
+its wsfunction, and an invalidtoken exception for any other token. The checks
+run ws_extractor.extract_sections on a course_info and look at the sections
+and items it filled. The folder and lti detail pages are not web services,
+the items are only recorded as queued for them.
+
+    python benchmarks/webservice_stub.py            run the checks
+    python benchmarks/webservice_stub.py serve 8080 serve the recordings
+
+Run from the repository root, course_info reads ".config" from there.
+"""
+import copy
+import json
+import os
+import sys
+import tempfile
+from http.cookies import CookieError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Dict, List
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.container import course_info, item_info  # noqa: E402
+from src.webservice import ws_extractor  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+TOKEN = "recorded-token"
+COURSE_ID = 35816
+
+
+def load_recordings() -> Dict[str, object]:
+    recordings = dict()
+    for filename in os.listdir(FIXTURES):
+        if filename.endswith(".json"):
+            with open(os.path.join(FIXTURES, filename), "r", encoding="utf-8") as f:
+                recordings[filename[:-5]] = json.load(f)
+    return recordings
+
+
+class stub_handler(BaseHTTPRequestHandler):
+    recordings: Dict[str, object] = dict()
+    calls: List[str] = list()
+
+    def log_message(self, *args) -> None:
+        return
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        params = parse_qs(self.rfile.read(length).decode("utf-8"))
+        function = params.get("wsfunction", [""])[0]
+        self.calls.append(function)
+        # errors are answered with 200 and an exception object, like moodle does
+        if params.get("wstoken", [""])[0] != TOKEN:
+            result = {
+                "exception": "moodle_exception",
+                "errorcode": "invalidtoken",
+                "message": "Invalid token - token not found",
+            }
+        elif function not in self.recordings:
+            result = {
+                "exception": "dml_missing_record_exception",
+                "errorcode": "invalidrecord",
+                "message": f"No recording of '{function}'",
+            }
+        else:
+            result = self.recordings[function]
+        body = json.dumps(result).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stub(port: int = 0) -> ThreadingHTTPServer:
+    stub_handler.recordings = load_recordings()
+    server = ThreadingHTTPServer(("127.0.0.1", port), stub_handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stub_url(server: ThreadingHTTPServer) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/webservice/rest/server.php"
+
+
+class recorded_extractor(ws_extractor):
+    # detail pages are not recorded, the items queued for one are kept instead
+    queued: List[str] = list()
+
+    def extract_detail(self, curr_item: item_info) -> None:
+        self.queued.append(curr_item.id)
+        curr_item.update_detail(self.detail_validator(curr_item))
+
+
+def check(name: str, passed: bool) -> None:
+    print(f"{'[Passed]' if passed else '[Failed]'} {name}")
+    if not passed:
+        check.failed += 1
+
+
+check.failed = 0
+
+
+def run_checks() -> int:
+    server = start_stub()
+    with tempfile.TemporaryDirectory() as store_dir:
+        container = course_info(
+            course_id=COURSE_ID,
+            store_dir=store_dir,
+            target_website="umass.moonami.com",
+            login_cookie={"MoodleSession": "recorded"},
+        )
+        container.config["ws_url"] = stub_url(server)
+        container.config["ws_token"] = TOKEN
+        recorded_extractor(container=container)()
+
+        contents = container.contents
+        check(
+            "course title",
+            container.course_title
+            == "Course: COMPSCI 589: Machine Learning (Spring 2023)",
+        )
+        check(
+            "visible sections only",
+            list(contents.keys()) == ["section-0", "section-1"],
+        )
+        check(
+            "section titles",
+            [section.title for section in contents.values()]
+            == ["General", "Week 1: Introduction"],
+        )
+        general = contents["section-0"].items
+        check("labels skipped", "100002" not in general)
+        check("modules not visible to the user skipped", "100004" not in general)
+        check(
+            "items of the sections",
+            list(general.keys()) == ["100001", "100003"]
+            and list(contents["section-1"].items.keys())
+            == ["100011", "100012", "100013"],
+        )
+        syllabus = general["100003"]
+        check(
+            "item fields",
+            syllabus.title == "Syllabus"
+            and syllabus.type == "resource"
+            and syllabus.link
+            == "https://umass.moonami.com/mod/resource/view.php?id=100003",
+        )
+        check("item description", syllabus.content == ["Course policies and schedule."])
+        check(
+            "item files",
+            [file["filename"] for file in syllabus.detail["files"]] == ["syllabus.pdf"]
+            and syllabus.detail["files"][0]["timemodified"] == 1674450000,
+        )
+        check(
+            "folder and lti queued for their detail page",
+            sorted(recorded_extractor.queued) == ["100011", "100013"],
+        )
+
+        section_checksums = {key: section.checksum for key, section in contents.items()}
+        item_checksums = {
+            item.id: item.checksum
+            for section in contents.values()
+            for item in section.items.values()
+        }
+
+        # the student marks every activity as done
+        recordings = stub_handler.recordings
+        original = copy.deepcopy(recordings["core_course_get_contents"])
+        for section in recordings["core_course_get_contents"]:
+            for module in section["modules"]:
+                if "completiondata" in module:
+                    module["completiondata"]["state"] = 1
+                    module["completiondata"]["timecompleted"] = 1675000000
+        for section in contents.values():
+            section.expirey = 0
+            for item in section.items.values():
+                item.expirey = 0
+        recorded_extractor(container=container)()
+        check(
+            "section fingerprints unchanged by completiondata",
+            section_checksums
+            == {key: section.checksum for key, section in contents.items()},
+        )
+        check(
+            "item fingerprints unchanged by completiondata",
+            item_checksums
+            == {
+                item.id: item.checksum
+                for section in contents.values()
+                for item in section.items.values()
+            },
+        )
+
+        # a new revision of the syllabus is uploaded
+        module = recordings["core_course_get_contents"][0]["modules"][2]
+        module["contents"][0]["timemodified"] = 1675100000
+        recorded_extractor(container=container)()
+        check(
+            "item fingerprint changed by a new file",
+            contents["section-0"].items["100003"].checksum != item_checksums["100003"]
+            and contents["section-1"].items["100011"].checksum
+            == item_checksums["100011"],
+        )
+        recordings["core_course_get_contents"] = original
+
+        container.config["ws_token"] = "expired-token"
+        try:
+            recorded_extractor(container=container)()
+            check("invalid token raises CookieError", False)
+        except CookieError:
+            check("invalid token raises CookieError", True)
+        container.sessions.close()
+    server.shutdown()
+    print(f"{check.failed} Failed, calls: {', '.join(sorted(set(stub_handler.calls)))}")
+    return check.failed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+        stub_handler.recordings = load_recordings()
+        server = ThreadingHTTPServer(("127.0.0.1", port), stub_handler)
+        print(f"Serving the recordings at {stub_url(server)}, WS_TOKEN={TOKEN}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        sys.exit(1 if run_checks() > 0 else 0)
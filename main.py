@@ -1,13 +1,22 @@
-from src import constructor
+import sys
+
+from src import batch
 
 if __name__ == "__main__":
-    course_id = 35816
-    inputs = {
-        "course_id": course_id,
-        "store_dir": f"course-{course_id}",
-        "target_website": "umass.moonami.com",
-    }
+    course_ids = [35816]
+    if len(sys.argv) > 1:
+        invalid = [course_id for course_id in sys.argv[1:] if not course_id.isdigit()]
+        if len(invalid) > 0:
+            sys.exit(f"Error! Course ids must be numbers, got: {', '.join(invalid)}")
+        course_ids = [int(course_id) for course_id in sys.argv[1:]]
+    courses = [
+        {
+            "course_id": course_id,
+            "store_dir": f"course-{course_id}",
+            "target_website": "umass.moonami.com",
+        }
+        for course_id in course_ids
+    ]
 
-    content = constructor(**inputs)
-    content.extraction()
-    content.construct_sections()
+    with batch(courses) as content:
+        content.run()
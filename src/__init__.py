@@ -1,3 +1,4 @@
+from .batch import batch
 from .constructor import constructor
 from .cookie_reader import retreive_cookies
 from .extractor import extractor
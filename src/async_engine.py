@@ -0,0 +1,554 @@
+import asyncio
+import logging
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Tuple
+
+try:
+    import aiohttp
+except ImportError as e:
+    raise ImportError(
+        "Error! ENGINE=ASYNC requires aiohttp, install it with 'pip install aiohttp'."
+    ) from e
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from src.container import course_info, item_info, resource_info
+from src.downloader import downloader
+from src.extractor import extractor
+from src.limiter import bandwidth
+from src.module.folder import fetch_folder_params
+from src.parser import folder_page, lti_page
+from src.retry import check_status, classify, retry_policy, retryable_error
+from src.scheduler import download_scheduler
+from src.utils.enums import mod_type
+from src.utils.func import partial
+from src.utils.params import (
+    async_buffer_size,
+    bandwidth_quantum,
+    launch_url,
+    moodle_course_url,
+    view_url,
+)
+from src.utils.progress import renderer
+
+if TYPE_CHECKING:
+    from src.constructor import constructor
+
+
+def new_session(connections: int, timeout: float = 120.0) -> aiohttp.ClientSession:
+    """
+    One aiohttp session for the whole run, at most connections open per host
+
+    Cookies are sent per request, the session does not keep any of its own
+    """
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=connections, limit_per_host=connections),
+        cookie_jar=aiohttp.DummyCookieJar(),
+        timeout=aiohttp.ClientTimeout(
+            total=None, sock_connect=timeout, sock_read=timeout
+        ),
+    )
+
+
+def classify_async(error: Exception) -> Exception:
+    """
+    classify() that also knows the transient errors of aiohttp
+    """
+    if isinstance(error, (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError)):
+        return retryable_error(str(error) or type(error).__name__)
+    if isinstance(error, asyncio.TimeoutError):
+        return retryable_error("Error! Timed out reading from the server.")
+    return classify(error)
+
+
+async def call_async(
+    policy: retry_policy, func: Callable[[], Awaitable], url: str
+) -> Any:
+    """
+    retry_policy.call for coroutines, the backoff does not block the loop
+    """
+    retry_num = 0
+    while True:
+        try:
+            return await func()
+        except Exception as e:
+            await asyncio.sleep(
+                policy.backoff(e, retry_num, url, classifier=classify_async)
+            )
+            retry_num += 1
+
+
+class async_engine:
+    """
+    Download engine running every transfer as a coroutine on one event loop
+
+    The construct functions of the modules run as usual, and hand their
+    downloader to downloader_callback, which schedules the transfer on the
+    loop instead of blocking a worker thread. Skip, resume and filename
+    rules are those of downloader and constructor.downloader_callback. A
+    file is fetched as one stream, continuing a journaled .part file, the
+    part of a segmented download is started over.
+    """
+
+    constructor: "constructor"
+    loop: asyncio.AbstractEventLoop
+    session: aiohttp.ClientSession
+    futures: List[Future]  # scheduled transfers, maybe from other threads
+    deferred: List[Tuple[str, Callable, Exception]]  # name, job, error
+
+    def __init__(self, constructor: "constructor") -> None:
+        self.constructor = constructor
+        self.loop = None
+        self.session = None
+        self.futures = list()
+        self.deferred = list()
+
+    @property
+    def config(self) -> Dict:
+        return self.constructor.config
+
+    async def __aenter__(self) -> "async_engine":
+        self.loop = asyncio.get_running_loop()
+        self.session = new_session(self.config["async_connections"])
+        return self
+
+    async def __aexit__(self, *args, **kwargs) -> None:
+        await self.session.close()
+
+    async def probe(
+        self,
+        meta: resource_info,
+        cookies: Dict[str, str],
+        policy: retry_policy = None,
+    ) -> bool:
+        """
+        Async probe_resource with backoff, return whether it succeeded
+
+        A failed probe is reported and left to the downloader of the item
+        """
+        if policy is None:
+            policy = retry_policy.from_config(self.config)
+        try:
+            await call_async(
+                policy, partial(self.probe_once, meta=meta, cookies=cookies), meta.url
+            )
+        except Exception as e:
+            logging.warning(f"Error! Unable to probe '{meta.url}'. Detail: {e}")
+            return False
+        return True
+
+    async def probe_once(self, meta: resource_info, cookies: Dict[str, str]) -> None:
+        async with self.session.head(
+            meta.url,
+            cookies=cookies,
+            headers=meta.conditional_headers(),
+            allow_redirects=True,
+        ) as res:
+            if res.status == 304:
+                meta.revalidate()
+                return
+            meta.update(final_url=str(res.url), headers=res.headers)
+            if res.status >= 400:
+                meta.expirey = None
+                check_status(
+                    status_code=res.status,
+                    reason=res.reason,
+                    url=str(res.url),
+                    headers=res.headers,
+                    strict=False,
+                )
+
+    def request(
+        self, curr_downloader: downloader, headers: Dict[str, str] = None
+    ) -> Any:
+        params = curr_downloader.params
+        return self.session.request(
+            curr_downloader.request_type.name,
+            params["url"],
+            headers=headers,
+            cookies=curr_downloader.cookies,
+            data=params.get("data"),
+            allow_redirects=True,
+        )
+
+    async def open_stream(self, curr_downloader: downloader) -> aiohttp.ClientResponse:
+        """
+        Async downloader.open_stream, for endpoints that can not be probed
+        """
+        res = await self.request(
+            curr_downloader, headers=curr_downloader.conditional_headers()
+        )
+        if res.status == 304:
+            res.release()
+            curr_downloader.not_modified()
+            return None
+        try:
+            curr_downloader.accept_stream(
+                status_code=res.status,
+                reason=res.reason,
+                url=str(res.url),
+                headers=res.headers,
+            )
+        except Exception:
+            res.release()
+            raise
+        return res
+
+    async def download(self, curr_downloader: downloader, download_path: str) -> bool:
+        """
+        Async downloader.download, retried in place with the same policy
+        """
+        curr_downloader.store_path = download_path
+        try:
+            return await call_async(
+                curr_downloader.policy,
+                partial(self.download_once, curr_downloader),
+                curr_downloader.url,
+            )
+        except Exception as e:
+            return curr_downloader.give_up(e)
+
+    async def download_once(self, curr_downloader: downloader) -> bool:
+        res = None
+        if curr_downloader.content_length is None:
+            res = await self.open_stream(curr_downloader)
+        try:
+            result = curr_downloader.check_local()
+            if result is not None:
+                return result
+            journal = curr_downloader.load_part(resumable=res is None, segments=False)
+            renderer.register(curr_downloader)
+            try:
+                stream_res, res = res, None
+                return await self.stream(
+                    curr_downloader, res=stream_res, journal=journal
+                )
+            finally:
+                renderer.unregister(
+                    curr_downloader, completed=curr_downloader.downloaded
+                )
+        finally:
+            if res is not None:
+                res.release()
+
+    async def stream(
+        self,
+        curr_downloader: downloader,
+        res: aiohttp.ClientResponse = None,
+        journal: Dict = None,
+    ) -> bool:
+        """
+        Async downloader.__download_stream, only the I/O is done here
+        """
+        offset = curr_downloader.resume_offset(journal)
+        if curr_downloader.finalize_complete_part(offset):
+            if res is not None:
+                res.release()
+            return True
+        if res is None:
+            res = await self.request(
+                curr_downloader, headers=curr_downloader.range_headers(offset)
+            )
+        try:
+            return await self.write_part(curr_downloader, res=res, offset=offset)
+        finally:
+            res.release()
+
+    async def write_part(
+        self, curr_downloader: downloader, res: aiohttp.ClientResponse, offset: int
+    ) -> bool:
+        offset = curr_downloader.begin_stream(
+            status_code=res.status,
+            reason=res.reason,
+            url=str(res.url),
+            headers=res.headers,
+            offset=offset,
+        )
+        hasher = curr_downloader.hasher
+        host = curr_downloader.host
+        with curr_downloader.open_part(offset) as file_obj:
+            buffer = bytearray()
+            async for chunk in res.content.iter_chunked(bandwidth_quantum):
+                if bandwidth.enabled:
+                    wait = bandwidth.reserve(host, len(chunk))
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                buffer += chunk
+                curr_downloader.add_fetched(len(chunk))
+                if len(buffer) < async_buffer_size:
+                    continue
+                hasher.update(buffer)
+                file_obj.write(buffer)
+                file_obj.flush()
+                buffer.clear()
+                curr_downloader.flush_journal()
+            if len(buffer) > 0:
+                hasher.update(buffer)
+                file_obj.write(buffer)
+        # aiohttp decodes a compressed body, and checks its encoded length itself
+        curr_downloader.end_stream(
+            received_length=(
+                None if curr_downloader.encoded else curr_downloader.fetched_length
+            ),
+            headers=res.headers,
+        )
+        return True
+
+    def downloader_callback(
+        self,
+        dir_name: str,
+        info_param: Dict[str, int | str],
+        curr_downloader: downloader,
+        intermediate_folder: str = None,
+        url_filename: str = None,
+        post_process: Callable = None,
+        item: item_info = None,
+    ) -> List[str]:
+        """
+        constructor.downloader_callback that schedules the transfer on the loop
+
+        Safe to call from other threads, the lti items are constructed in one
+        """
+        file_paths, canonical_dir = self.constructor.prepare_download(
+            dir_name=dir_name,
+            info_param=info_param,
+            curr_downloader=curr_downloader,
+            intermediate_folder=intermediate_folder,
+            url_filename=url_filename,
+        )
+        job = partial(
+            self.construct,
+            curr_downloader=curr_downloader,
+            file_paths=file_paths,
+            canonical_dir=canonical_dir,
+            post_process=post_process,
+            item=item,
+            info_param=info_param,
+        )
+        self.submit(job, name=curr_downloader.file_name)
+        return file_paths
+
+    def submit(self, job: Callable, name: str) -> None:
+        future = asyncio.run_coroutine_threadsafe(self.run_job(job, name), self.loop)
+        self.futures.append(future)
+
+    async def run_job(self, job: Callable, name: str) -> None:
+        try:
+            await job()
+        except retryable_error as e:
+            self.deferred.append((name, job, e))
+            logging.warning(f"Error! Job '{name}' deferred. Detail: {e}")
+        except Exception as e:
+            logging.warning(f"Error! Job '{name}' failed. Detail: {e}")
+
+    async def construct(
+        self,
+        curr_downloader: downloader,
+        file_paths: List[str],
+        canonical_dir: str,
+        post_process: Callable = None,
+        item: item_info = None,
+        info_param: Dict[str, int | str] = None,
+    ) -> None:
+        downloaded = await self.download(curr_downloader, download_path=file_paths[0])
+        # unzipping and pdf rendering would hold up every transfer on the loop
+        paths = await asyncio.to_thread(
+            self.constructor.place_outputs,
+            file_paths=file_paths,
+            canonical_dir=canonical_dir,
+            post_process=post_process,
+        )
+        self.constructor.container.save_resource(curr_downloader.meta)
+        if downloaded and item is not None:
+            self.constructor.record_manifest(
+                item=item, info_param=info_param, paths=paths, meta=curr_downloader.meta
+            )
+
+    async def join(self) -> None:
+        """
+        Wait for every scheduled transfer, including ones scheduled meanwhile
+        """
+        while len(self.futures) > 0:
+            futures, self.futures = self.futures, list()
+            await asyncio.gather(*[asyncio.wrap_future(future) for future in futures])
+
+    def construct_item(self, construct: Callable, name: str) -> None:
+        try:
+            construct()
+        except Exception as e:
+            logging.warning(f"Error! Job '{name}' failed. Detail: {e}")
+
+    async def construct_sections(
+        self, info_param: Dict[str, int | str], index: int = -1
+    ) -> None:
+        cons = self.constructor
+        items = []
+        metas = []
+        for section in cons.iter_sections(info_param=info_param, index=index):
+            dir_name = cons.section_dir(info_param=info_param, section=section)
+            for item, construct_func, job_param in cons.section_items(
+                info_param=info_param, section=section
+            ):
+                if cons.is_item_current(item, job_param):
+                    renderer.log(f"[Status] Up to date, no need to check. {item.title}")
+                    continue
+                items.append((item, construct_func, job_param, dir_name))
+                if item.type in [mod_type.resource.name, mod_type.page.name]:
+                    meta = cons.container.resources.get(
+                        item.link, revision=item.checksum
+                    )
+                    if not meta.is_probed:
+                        metas.append(meta)
+            renderer.log(
+                f"Section {info_param['section_index']} '{section.title}': Queued"
+            )
+
+        # probed up front, so constructing a downloader does no blocking I/O
+        policy = retry_policy.from_config(self.config)
+        probed = await asyncio.gather(
+            *[self.probe(meta, cons.cookie, policy) for meta in metas]
+        )
+        unprobed = [meta.url for meta, success in zip(metas, probed) if not success]
+
+        threads = []
+        for item, construct_func, job_param, dir_name in items:
+            construct = partial(
+                construct_func,
+                target=item,
+                info_param=job_param,
+                callback=partial(
+                    self.downloader_callback,
+                    dir_name=dir_name,
+                    info_param=job_param,
+                    item=item,
+                ),
+            )
+            # echo360 resolves its recordings with blocking requests, and
+            # the downloader probes again what could not be probed here
+            if item.type == mod_type.lti.name or item.link in unprobed:
+                threads.append(
+                    asyncio.to_thread(self.construct_item, construct, item.title)
+                )
+            else:
+                self.construct_item(construct, item.title)
+        await asyncio.gather(*threads)
+        await self.join()
+
+        # transient failures were deferred so they did not hold up the course
+        for _ in range(self.config["deferred_retries"]):
+            if len(self.deferred) == 0:
+                break
+            deferred, self.deferred = self.deferred, list()
+            renderer.log(f"Retrying {len(deferred)} Deferred Downloads")
+            for name, job, error in deferred:
+                self.submit(job, name=name)
+            await self.join()
+        for name, job, error in self.deferred:
+            logging.warning(f"Error! Failed to download '{name}': {error}")
+
+
+def async_construction(
+    constructor: "constructor", info_param: Dict[str, int | str], index: int = -1
+) -> None:
+    async def run() -> None:
+        async with async_engine(constructor) as engine:
+            await engine.construct_sections(info_param=info_param, index=index)
+
+    asyncio.run(run())
+
+
+class async_extractor(extractor):
+    """
+    extractor fetching the course page and the folder and lti detail pages
+    concurrently on one event loop
+
+    The detail pages are fetched together once the course page is parsed.
+    """
+
+    pages: Dict[str, str]  # fetched pages, waiting to be parsed
+    pending: List[item_info]  # items whose detail page is still to fetch
+
+    def __init__(
+        self,
+        container: course_info,
+        extract_section_index: int = -1,
+        scheduler: download_scheduler = None,
+    ) -> None:
+        extractor.__init__(
+            self,
+            container=container,
+            extract_section_index=extract_section_index,
+            scheduler=scheduler,
+        )
+        self.pages = dict()
+        self.pending = list()
+
+    def check_signin(
+        self,
+        url: str,
+        cookies: Dict = None,
+        check_title: bool = True,
+        parse_only: SoupStrainer = None,
+    ) -> Tuple[BeautifulSoup, str]:
+        res_cont = self.pages.pop(url, None)
+        if res_cont is None:
+            return extractor.check_signin(
+                self,
+                url=url,
+                cookies=cookies,
+                check_title=check_title,
+                parse_only=parse_only,
+            )
+        return self.parse_page(
+            res_cont=res_cont, check_title=check_title, parse_only=parse_only
+        )
+
+    def extract_details(self, details: List[item_info]) -> None:
+        # fetched on the loop once extract_sections returns
+        self.pending.extend(details)
+
+    async def fetch_page(self, session: aiohttp.ClientSession, url: str) -> bytes:
+        async with session.get(url, cookies=self.container.course_cookie) as res:
+            return await res.read()
+
+    async def fetch_detail(
+        self, session: aiohttp.ClientSession, curr_item: item_info
+    ) -> None:
+        if curr_item.type == mod_type.folder.name:
+            res_cont = await self.fetch_page(
+                session, view_url.format(mod_type.folder.name, curr_item.id)
+            )
+            soup, page_title = self.parse_page(
+                res_cont=res_cont, parse_only=folder_page
+            )
+            fetch_folder_params(curr_item=curr_item, soup=soup)
+        elif curr_item.type == mod_type.lti.name:
+            # reach lti redirect form page
+            res_cont = await self.fetch_page(
+                session, launch_url.format(mod_type.lti.name, curr_item.id)
+            )
+            soup, page_title = self.parse_page(
+                res_cont=res_cont, check_title=False, parse_only=lti_page
+            )
+            # echo360 info is resolved with blocking requests and selenium
+            await asyncio.to_thread(
+                self.extract_lti_params, curr_item=curr_item, soup=soup
+            )
+        curr_item.update_detail(self.detail_validator(curr_item))
+        self.container.save_item(curr_item)
+
+    async def extract(self) -> None:
+        async with new_session(self.container.config["async_connections"]) as session:
+            course_url = moodle_course_url.format(self.container.course_id)
+            self.pages[course_url] = await self.fetch_page(session, course_url)
+            self.extract_sections()
+            pending, self.pending = self.pending, list()
+            await asyncio.gather(
+                *[self.fetch_detail(session, curr_item) for curr_item in pending]
+            )
+
+    def __call__(
+        self, container: course_info = None, *args: Any, **kwargs: Any
+    ) -> course_info:
+        asyncio.run(self.extract())
+        return self.container
@@ -0,0 +1,165 @@
+import logging
+from time import time
+from typing import Dict, List
+
+from src.constructor import constructor
+from src.cookie_reader import retreive_cookies
+from src.limiter import bandwidth, config_watcher
+from src.module.echo360_handler import Echo360Extractor
+from src.scheduler import download_scheduler, job_group
+from src.session import session_pool
+from src.utils.func import load_config, partial
+from src.utils.params import terminal_cols
+from src.utils.progress import renderer
+
+
+class batch:
+    """
+    Sync several courses in one process
+
+    The courses share one download scheduler (MAX_WORKERS jobs in total, at
+    most MAX_WORKERS_PER_COURSE of them for one course), one session pool,
+    the login cookie of every site and the echo360 webdriver. MAX_COURSES
+    courses are extracted and downloaded at once.
+    """
+
+    courses: List[Dict[str, str]]
+    config: Dict
+    log_config: str
+    scheduler: download_scheduler
+    sessions: session_pool
+    cookies: Dict[str, Dict[str, str]]  # login cookie per site
+    summary: Dict[str, Dict]  # outcome per course id
+
+    def __init__(
+        self, courses: List[Dict[str, str]], log_config: str = "./log_config.ini"
+    ) -> None:
+        """
+        courses are the constructor params of every course: course_id,
+        target_website and optionally store_dir (default "course-{course_id}")
+        """
+        self.courses = courses
+        self.log_config = log_config
+        self.config = load_config()
+        self.scheduler = download_scheduler(
+            max_workers=self.config["max_workers"],
+            max_workers_per_host=self.config["max_workers_per_host"],
+        )
+        self.sessions = session_pool(
+            pool_size=self.config["max_workers_per_host"] * self.config["segment_count"]
+        )
+        self.cookies = dict()
+        self.summary = dict()
+
+    def __enter__(self) -> "batch":
+        return self
+
+    def __exit__(self, *args, **kwargs) -> None:
+        self.scheduler.shutdown()
+        self.sessions.close()
+
+    def get_cookie(self, target_website: str) -> Dict[str, str]:
+        # the browser cookie store is decrypted once per site
+        if target_website not in self.cookies:
+            self.cookies[target_website] = retreive_cookies(
+                target_website=target_website
+            )
+        return self.cookies[target_website]
+
+    def sync_course(self, course: Dict[str, str], cookie: Dict[str, str]) -> None:
+        course_id = str(course["course_id"])
+        result = {"title": "", "items": 0, "jobs": 0, "failed": 0, "error": None}
+        self.summary[course_id] = result
+        start_time = time()
+        group = job_group(
+            scheduler=self.scheduler,
+            name=course_id,
+            max_workers=self.config["max_workers_per_course"],
+        )
+        try:
+            course_constructor = constructor(
+                course_id=course["course_id"],
+                store_dir=course.get("store_dir", f"course-{course_id}"),
+                target_website=course["target_website"],
+                config=self.log_config,
+                login_cookie=cookie,
+                scheduler=group,
+                sessions=self.sessions,
+            )
+            renderer.log(f"Syncing Course {course_id}")
+            if self.config["pipeline"]:
+                course_constructor.download(pipelined=True)
+            else:
+                course_constructor.extraction()
+                course_constructor.download()
+            container = course_constructor.container
+            result["title"] = container.course_title
+            result["items"] = sum(
+                section.items_length for section in container.contents.values()
+            )
+        except Exception as e:
+            result["error"] = e
+            logging.warning(f"Error! Course {course_id} failed. Detail: {e}")
+        finally:
+            group.join()
+            result["jobs"] = len(group.jobs)
+            result["failed"] = sum(job.error is not None for job in group.jobs)
+            result["time"] = time() - start_time
+
+    def run(self) -> Dict[str, Dict]:
+        """
+        Sync every course, print one summary and return it
+        """
+        cookies = dict()
+        for course in self.courses:
+            try:
+                cookies[str(course["course_id"])] = self.get_cookie(
+                    course["target_website"]
+                )
+            except Exception as e:
+                self.summary[str(course["course_id"])] = {"error": e}
+
+        print("#" * int(terminal_cols * 3 / 4))
+        print(f"Syncing {len(self.courses)} Courses")
+        renderer.begin(title="Batch")
+        limits_watcher = config_watcher(limiter=bandwidth)
+        limits_watcher.start()
+        Echo360Extractor.start_sharing()
+
+        # the courses run on a scheduler of their own, their downloads are
+        # jobs of the shared one
+        with download_scheduler(max_workers=self.config["max_courses"]) as courses:
+            for course in self.courses:
+                cookie = cookies.get(str(course["course_id"]))
+                if cookie is None:
+                    continue
+                courses.submit(
+                    partial(self.sync_course, course=course, cookie=cookie),
+                    name=f"Course {course['course_id']}",
+                )
+
+        Echo360Extractor.stop_sharing()
+        limits_watcher.stop()
+        renderer.end()
+        self.print_summary()
+        return self.summary
+
+    def print_summary(self) -> None:
+        print("#" * int(terminal_cols / 2))
+        for host, stats in self.sessions.stats().items():
+            msg = f"Connections to {host}: {stats['requests']} requests, {stats['opened']} opened, {stats['reused']} reused"
+            logging.info(msg)
+        succeeded = 0
+        for course in self.courses:
+            course_id = str(course["course_id"])
+            result = self.summary.get(course_id, dict())
+            if result.get("error") is not None:
+                print(f"[Failed] Course {course_id}: {result['error']}")
+                continue
+            succeeded += 1
+            print(
+                f"[Done] Course {course_id} '{result['title']}': {result['items']} items, "
+                + f"{result['jobs'] - result['failed']}/{result['jobs']} jobs succeeded in {result['time']:.1f}s"
+            )
+        print(f"Batch Complete! {succeeded}/{len(self.courses)} Courses Synced.")
+        print("#" * int(terminal_cols * 3 / 4))
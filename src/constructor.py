@@ -1,38 +1,51 @@
 import logging
 import logging.config
 import os
-from typing import Dict, List
+from typing import Callable, Dict, Iterator, List, Tuple
+from urllib.parse import urlparse
 
-from src.container import course_info, section_info
-from src.downloader import downloader
+import requests
+
+from src.container import (
+    course_info,
+    item_info,
+    manifest_entry,
+    resource_info,
+    section_info,
+)
+from src.downloader import downloader, probe_resource
 from src.extractor import extractor
+from src.limiter import bandwidth, config_watcher
 from src.module.folder import construct_folder
 from src.module.lti import construct_echo360
 from src.module.page import construct_page
 from src.module.resource import construct_file
-from src.utils.enums import custom_enum, download_mode, file_mode, mod_type
-from src.utils.func import slugify
+from src.retry import retry_policy
+from src.scheduler import download_job, download_scheduler, job_group
+from src.session import session_pool
+from src.store import get_store, object_store
+from src.utils.enums import (
+    custom_enum,
+    download_mode,
+    engine_mode,
+    extractor_mode,
+    file_mode,
+    mod_type,
+)
+from src.utils.func import hash_file, link_path, partial, slugify
 from src.utils.params import terminal_cols
+from src.utils.progress import renderer
+from src.webservice import ws_extractor
 
-
-def partial(func, /, *args, **keywords):
-    """
-    Implementation from:
-    https://docs.python.org/3/library/functools.html#functools.partial
-    """
-
-    def newfunc(*fargs, **fkeywords):
-        newkeywords = {**keywords, **fkeywords}
-        return func(*args, *fargs, **newkeywords)
-
-    newfunc.func = func
-    newfunc.args = args
-    newfunc.keywords = keywords
-    return newfunc
+# items downloaded by one job each, their local files are kept in the manifest.
+# the recordings of an lti item are resolved anew on every run
+manifest_types = [mod_type.resource.name, mod_type.page.name, mod_type.folder.name]
 
 
 class constructor:
     container: course_info
+    scheduler: download_scheduler | job_group
+    store: object_store
 
     def __init__(
         self,
@@ -40,10 +53,25 @@ class constructor:
         store_dir: str,
         target_website: str,
         config: str = "./log_config.ini",
+        login_cookie: Dict[str, str] = None,
+        scheduler: download_scheduler | job_group = None,
+        sessions: session_pool = None,
     ) -> None:
         self.container = course_info(
-            course_id=course_id, store_dir=store_dir, target_website=target_website
+            course_id=course_id,
+            store_dir=store_dir,
+            target_website=target_website,
+            login_cookie=login_cookie,
+            sessions=sessions,
         )
+        self.scheduler = scheduler
+        if self.scheduler is None:
+            self.scheduler = download_scheduler(
+                max_workers=self.config["max_workers"],
+                max_workers_per_host=self.config["max_workers_per_host"],
+            )
+        self.store = get_store(store_dir)
+        bandwidth.load(self.config)
 
         try:
             if not os.path.isdir(store_dir):
@@ -84,10 +112,30 @@ class constructor:
     def __exit__(self) -> None:
         self.container.save()
 
-    def extraction(self, index: int = -1) -> Dict[str, Dict]:
-        new_extractor = extractor(
+    def extraction(
+        self, index: int = -1, on_section: Callable = None
+    ) -> Dict[str, Dict]:
+        """
+        Extract the course, on_section takes every section as soon as it is
+        extracted (pipelined mode, the thread engine extractors only)
+        """
+        params = dict()
+        if on_section is not None:
+            params["on_section"] = on_section
+        if self.config["extractor"] == extractor_mode.REST:
+            extractor_class = ws_extractor
+        elif self.config["engine"] == engine_mode.ASYNC:
+            # aiohttp is an optional dependency, only needed by this engine
+            from src.async_engine import async_extractor
+
+            extractor_class = async_extractor
+        else:
+            extractor_class = extractor
+        new_extractor = extractor_class(
             container=self.container,
             extract_section_index=index,
+            scheduler=self.scheduler,
+            **params,
         )
         new_extractor()
         self.container.save()
@@ -112,12 +160,59 @@ class constructor:
         curr_downloader: downloader,
         intermediate_folder: str = None,
         url_filename: str = None,
+        post_process: Callable = None,
+        item: item_info = None,
     ) -> List[str]:
+        """
+        Download the target once and return the paths it is stored at
 
-        if self.config["download_mode"] != download_mode.All:
-            info_param["file_index"] += 1
-            info_param["section_file_index"] += 1
+        post_process runs once on the downloaded file and returns the paths it
+        produced. Under FILE_MODE=BOTH those are linked into the flat
+        resource folder rather than downloaded and processed a second time.
+        The paths are recorded in the manifest of item, if given
+        """
+        file_paths, canonical_dir = self.prepare_download(
+            dir_name=dir_name,
+            info_param=info_param,
+            curr_downloader=curr_downloader,
+            intermediate_folder=intermediate_folder,
+            url_filename=url_filename,
+        )
+        downloaded = curr_downloader.download(download_path=file_paths[0])
+        self.container.save_resource(curr_downloader.meta)
+        paths = self.place_outputs(
+            file_paths=file_paths,
+            canonical_dir=canonical_dir,
+            post_process=post_process,
+        )
+        if downloaded and item is not None:
+            self.record_manifest(
+                item=item, info_param=info_param, paths=paths, meta=curr_downloader.meta
+            )
+        return paths
 
+    def prepare_download(
+        self,
+        dir_name: str,
+        info_param: Dict[str, int | str],
+        curr_downloader: downloader,
+        intermediate_folder: str = None,
+        url_filename: str = None,
+    ) -> Tuple[List[str], str]:
+        """
+        Configure the downloader, return the paths of the file and the folder
+        its canonical copy is downloaded into
+        """
+        if curr_downloader.segment_threshold is None:
+            curr_downloader.segment_threshold = self.config["segment_threshold"]
+        if curr_downloader.segment_count is None:
+            curr_downloader.segment_count = self.config["segment_count"]
+        if curr_downloader.preallocate is None:
+            curr_downloader.preallocate = self.config["preallocate"]
+        if curr_downloader.store is None:
+            curr_downloader.store = self.store
+        if curr_downloader.policy is None:
+            curr_downloader.policy = retry_policy.from_config(self.config)
         file_name = self.format_filename(info_param=info_param)
         if url_filename is not None:
             file_name = slugify(url_filename) + f".{info_param['url_file_extension']}"
@@ -138,27 +233,147 @@ class constructor:
                 exist_ok=True,
             )
 
-        file_paths = []
-        if (
-            self.config["file_mode"] == file_mode.BOTH
-            or self.config["file_mode"] == file_mode.UNDERSECTION
-        ):
-            file_paths = [os.path.join(dir_name, file_name)]
-            curr_downloader.download(download_path=file_paths[0])
-            if self.config["file_mode"] == file_mode.BOTH:
-                file_paths.append(
-                    os.path.join(self.fixed_resource_store_dir, file_name)
+        canonical_dir = dir_name
+        if self.config["file_mode"] == file_mode.INONEFOLDER:
+            canonical_dir = self.fixed_resource_store_dir
+        file_paths = [os.path.join(canonical_dir, file_name)]
+        return file_paths, canonical_dir
+
+    def place_outputs(
+        self, file_paths: List[str], canonical_dir: str, post_process: Callable = None
+    ) -> List[str]:
+        """
+        Post process the downloaded file, and link its outputs into the flat
+        resource folder under FILE_MODE=BOTH. Return every path written
+        """
+        if not os.path.isfile(file_paths[0]):
+            return file_paths
+
+        output_paths = [file_paths[0]]
+        if post_process is not None:
+            output_paths = post_process(file_paths[0])
+        placed = [path for path in output_paths if path not in file_paths]
+
+        if self.config["file_mode"] == file_mode.BOTH:
+            file_paths.append(
+                os.path.join(
+                    self.fixed_resource_store_dir,
+                    os.path.relpath(file_paths[0], canonical_dir),
                 )
-                curr_downloader.duplicate(new_file_path=file_paths[1])
-        elif self.config["file_mode"] == file_mode.INONEFOLDER:
-            file_paths = [os.path.join(self.fixed_resource_store_dir, file_name)]
-            curr_downloader.download(download_path=file_paths[0])
+            )
+            for output_path in output_paths:
+                if not os.path.exists(output_path):
+                    continue
+                link = os.path.join(
+                    self.fixed_resource_store_dir,
+                    os.path.relpath(output_path, canonical_dir),
+                )
+                try:
+                    link_path(output_path, link)
+                except Exception as e:
+                    logging.warning(f"Error! Unable to link {output_path}. {e}")
+                    continue
+                if link not in file_paths:
+                    placed.append(link)
 
-        return file_paths
+        return file_paths + placed
 
-    def construct_section(
-        self, info_param: Dict[str, int | str], section: section_info
+    def layout(self, info_param: Dict[str, int | str]) -> str:
+        """
+        The config and indices the local paths of an item are formatted with
+        """
+        return "|".join(
+            str(value)
+            for value in [
+                self.config["file_mode"],
+                self.config["filename_format"],
+                self.config["zip_mode"],
+                self.config["page_mode"],
+                info_param["section_index"],
+                info_param["section_title"],
+                info_param["section_file_index"],
+                info_param["file_index"],
+            ]
+        )
+
+    def is_item_current(
+        self, item: item_info, info_param: Dict[str, int | str]
+    ) -> bool:
+        """
+        Whether the local files of the item are up to date, from the manifest
+        and a stat of the files, without a request
+        """
+        if not self.config["manifest"] or item.type not in manifest_types:
+            return False
+        return self.container.manifest.is_current(
+            item.id, revision=item.checksum, layout=self.layout(info_param)
+        )
+
+    def record_manifest(
+        self,
+        item: item_info,
+        info_param: Dict[str, int | str],
+        paths: List[str],
+        meta: resource_info,
+    ) -> None:
+        if item.type not in manifest_types:
+            return
+        self.container.manifest.record(
+            item.id,
+            revision=item.checksum,
+            layout=self.layout(info_param),
+            paths=paths,
+            meta=meta,
+        )
+        self.container.save_manifest(item.id)
+
+    def probe_section(self, items: List[item_info]) -> None:
+        """
+        Resolve the metadata of every resource of the items concurrently
+
+        Probes jump ahead of queued downloads, results are kept in the course
+        state so that later runs reuse them until they expire.
+        """
+        policy = retry_policy.from_config(self.config)
+        jobs = []
+        for item in items:
+            if item.type not in [mod_type.resource.name, mod_type.page.name]:
+                continue
+            meta = self.container.resources.get(item.link, revision=item.checksum)
+            if meta.is_probed:
+                continue
+            probe_job = partial(
+                self.probe,
+                meta=meta,
+                session=self.container.sessions.get(item.link),
+                policy=policy,
+            )
+            jobs.append(
+                self.scheduler.submit(
+                    probe_job,
+                    host=urlparse(item.link).netloc,
+                    name=f"Probe {item.title}",
+                    priority=0,
+                )
+            )
+        for job in jobs:
+            job.wait()
+
+    def probe(
+        self, meta: resource_info, session: requests.Session, policy: retry_policy
     ) -> None:
+        """
+        probe_resource with backoff, a failed probe is reported and left to
+        the downloader of the item, which probes again
+        """
+        try:
+            probe_resource(meta=meta, session=session, policy=policy)
+        except Exception as e:
+            logging.warning(f"Error! Unable to probe '{meta.url}'. Detail: {e}")
+
+    def section_dir(
+        self, info_param: Dict[str, int | str], section: section_info
+    ) -> str:
         section_index = format(info_param["section_index"], "02d")
         partial_dir_name = f"{section_index}-{section.title}"
         dir_name = os.path.join(self.store_dir, partial_dir_name)
@@ -171,61 +386,139 @@ class constructor:
             raise ValueError(
                 f"Error! Unable to create subdirectory for section {partial_dir_name}!"
             )
+        return dir_name
 
+    def section_items(
+        self,
+        info_param: Dict[str, int | str],
+        section: section_info,
+        scheduler: download_scheduler = None,
+    ) -> Iterator[Tuple[item_info, Callable, Dict[str, int | str]]]:
+        """
+        Yield the items of the section to construct, with their construct
+        function and a snapshot of the file indices
+        """
         for item_id, item in section.items.items():
             if self.config["download_mode"] == download_mode.All:
                 info_param["file_index"] += 1
                 info_param["section_file_index"] += 1
 
-            partial_callback = partial(
-                self.downloader_callback,
-                dir_name=dir_name,
-                info_param=info_param,
-            )
             if item.type == mod_type.resource.name:
-                curr_downloader = construct_file(
-                    target=item, info_param=info_param, callback=partial_callback
-                )
+                construct_func = construct_file
             elif item.type == mod_type.folder.name:
-                curr_downloader = construct_folder(
-                    target=item,
-                    mode=self.config["zip_mode"],
-                    info_param=info_param,
-                    callback=partial_callback,
-                )
+                construct_func = partial(construct_folder, mode=self.config["zip_mode"])
             elif item.type == mod_type.page.name:
-                curr_downloader = construct_page(
-                    target=item,
-                    mode=self.config["page_mode"],
-                    info_param=info_param,
-                    callback=partial_callback,
-                )
+                construct_func = partial(construct_page, mode=self.config["page_mode"])
             elif item.type == mod_type.lti.name:
-                curr_downloader = construct_echo360(
-                    target=item,
+                construct_func = partial(
+                    construct_echo360,
                     mode=self.config["video_mode"],
-                    info_param=info_param,
-                    callback=partial_callback,
                     config=self.config,
+                    scheduler=scheduler,
                 )
             else:
                 continue
-            # if index == 2:
-            #     break
 
-    def construct_sections(self, index: int = -1) -> None:
-        print("#" * int(terminal_cols * 3 / 4))
-        print(f"Downloading Course: '{self.container.course_title}'")
-        info_param = {
-            "file_index": -1,
-            "section_index": -1,
-            "section_title": "",
-            "section_file_index": -1,
-            "url_filename": "",
-            "url_file_extension": "",
-            "cookie": self.cookie,
-        }
+            # lti is the only type that never downloads under FILEONLY mode
+            if (
+                self.config["download_mode"] != download_mode.All
+                and item.type != mod_type.lti.name
+            ):
+                info_param["file_index"] += 1
+                info_param["section_file_index"] += 1
 
+            # every job owns a snapshot of the indices, so the filenames do not
+            # depend on the order in which the jobs finish
+            yield item, construct_func, info_param.copy()
+
+    def construct_section(
+        self,
+        info_param: Dict[str, int | str],
+        section: section_info,
+        detail_jobs: Dict[str, download_job] = None,
+    ) -> None:
+        """
+        Queue the downloads of the section, an item with a job in detail_jobs
+        is queued once that job has fetched its detail page
+        """
+        if detail_jobs is None:
+            detail_jobs = dict()
+        dir_name = self.section_dir(info_param=info_param, section=section)
+
+        items = []
+        for item, construct_func, job_param in self.section_items(
+            info_param=info_param, section=section, scheduler=self.scheduler
+        ):
+            if self.is_item_current(item, job_param):
+                renderer.log(f"[Status] Up to date, no need to check. {item.title}")
+                continue
+            items.append((item, construct_func, job_param))
+
+        self.probe_section(items=[item for item, _, _ in items])
+
+        for item, construct_func, job_param in items:
+            partial_callback = partial(
+                self.downloader_callback,
+                dir_name=dir_name,
+                info_param=job_param,
+                item=item,
+            )
+            construct_job = partial(
+                self.scheduler.submit,
+                partial(
+                    construct_func,
+                    target=item,
+                    info_param=job_param,
+                    callback=partial_callback,
+                ),
+                host=urlparse(item.link).netloc,
+                name=item.title,
+            )
+            if item.id in detail_jobs:
+                detail_jobs[item.id].then(
+                    partial(self.after_detail, construct_job=construct_job)
+                )
+            else:
+                construct_job()
+
+    def after_detail(self, detail_job: download_job, construct_job: Callable) -> None:
+        # the failure of the detail page is logged by its job, the item is left
+        # for the next run
+        if detail_job.error is None:
+            construct_job()
+
+    def begin_section(
+        self, info_param: Dict[str, int | str], index: int, section: section_info
+    ) -> None:
+        info_param["section_index"] = index
+        info_param["section_title"] = section.title
+        info_param["section_file_index"] = -1
+
+    def pipe_section(
+        self,
+        info_param: Dict[str, int | str],
+        index: int,
+        section: section_info,
+        detail_jobs: Dict[str, download_job],
+    ) -> None:
+        """
+        on_section of the extractor in pipelined mode, queue the downloads of
+        the section while the next sections are extracted
+        """
+        if section.items_length == 0:
+            return
+        self.begin_section(info_param=info_param, index=index, section=section)
+        self.construct_section(
+            info_param=info_param, section=section, detail_jobs=detail_jobs
+        )
+        renderer.log(f"Section {index} '{section.title}': Queued")
+
+    def iter_sections(
+        self, info_param: Dict[str, int | str], index: int = -1
+    ) -> Iterator[section_info]:
+        """
+        Yield the sections to construct, with info_param set up for each
+        """
         for iter_index, (section_id, section) in enumerate(
             self.container.contents.items()
         ):
@@ -234,17 +527,214 @@ class constructor:
                 continue
             if section.items_length == 0:
                 continue
-            info_param["section_index"] = section_index
-            info_param["section_title"] = section.title
-            info_param["section_file_index"] = -1
-            print("#" * int(terminal_cols / 2))
-            print(f"Section {section_index} '{section.title}': Downloading")
-            self.construct_section(info_param=info_param, section=section)
-            print(f"Section {section_index} '{section.title}': Downloaded")
+            self.begin_section(
+                info_param=info_param, index=section_index, section=section
+            )
+            yield section
 
+    def sync(self, index: int = -1) -> None:
+        """
+        Extract and download the course, pipelined unless PIPELINE=False
+        """
+        if self.config["pipeline"]:
+            return self.construct_sections(index=index, pipelined=True)
+        self.extraction(index=index)
+        self.construct_sections(index=index)
+
+    def construct_sections(self, index: int = -1, pipelined: bool = False) -> None:
+        course_title = self.container.course_title
+        if course_title == "":
+            course_title = f"Course {self.container.course_id}"
+        print("#" * int(terminal_cols * 3 / 4))
+        print(f"Downloading Course: '{course_title}'")
+
+        renderer.begin(title=course_title)
+        limits_watcher = config_watcher(limiter=bandwidth)
+        limits_watcher.start()
+
+        self.download(index=index, pipelined=pipelined)
+
+        limits_watcher.stop()
+        renderer.end()
         print("#" * int(terminal_cols / 2))
+        for host, stats in self.container.sessions.stats().items():
+            msg = f"Connections to {host}: {stats['requests']} requests, {stats['opened']} opened, {stats['reused']} reused"
+            logging.info(msg)
         print(f"Download Complete! Downloaded File are stored in '{self.store_dir}'.")
         print("#" * int(terminal_cols * 3 / 4))
 
+    def download(self, index: int = -1, pipelined: bool = False) -> None:
+        """
+        Download the extracted sections and save the course state
+
+        When pipelined, the course is extracted here and every section is
+        queued as soon as it is extracted. The progress display is left to
+        the caller, so that a batch shows the courses it runs together in
+        one display
+        """
+        info_param = {
+            "file_index": -1,
+            "section_index": -1,
+            "section_title": "",
+            "section_file_index": -1,
+            "url_filename": "",
+            "url_file_extension": "",
+            "cookie": self.cookie,
+            "sessions": self.container.sessions,
+            "resources": self.container.resources,
+        }
+
+        if self.config["reconcile"]:
+            self.reconcile(restore=self.config["restore_edited"])
+
+        if pipelined and self.config["engine"] == engine_mode.ASYNC:
+            # the async engine extracts the course on its own loop first
+            self.extraction(index=index)
+            pipelined = False
+
+        if pipelined:
+            self.extraction(
+                index=index,
+                on_section=partial(self.pipe_section, info_param=info_param),
+            )
+            self.finish_sections()
+        elif self.config["engine"] == engine_mode.ASYNC:
+            # aiohttp is an optional dependency, only needed by this engine
+            from src.async_engine import async_construction
+
+            async_construction(constructor=self, info_param=info_param, index=index)
+        else:
+            self.run_sections(info_param=info_param, index=index)
+
+        if self.config["verify"]:
+            self.verification()
+
+        self.container.save()
+        self.store.save()
+
+    def run_sections(self, info_param: Dict[str, int | str], index: int = -1) -> None:
+        for section in self.iter_sections(info_param=info_param, index=index):
+            self.construct_section(info_param=info_param, section=section)
+            renderer.log(
+                f"Section {info_param['section_index']} '{section.title}': Queued"
+            )
+        self.finish_sections()
+
+    def finish_sections(self) -> None:
+        """
+        Wait for the queued downloads, retrying the deferred ones
+        """
+        self.scheduler.join()
+        # transient failures were deferred so they did not hold up the course
+        for _ in range(self.config["deferred_retries"]):
+            deferred_num = self.scheduler.retry_deferred()
+            if deferred_num == 0:
+                break
+            renderer.log(f"Retrying {deferred_num} Deferred Downloads")
+            self.scheduler.join()
+        for job in self.scheduler.deferred:
+            logging.warning(f"Error! Failed to download '{job.name}': {job.error}")
+
     def construction(self, index: int = -1) -> None:
         return self.construct_sections(index)
+
+    def verification(self) -> List[str]:
+        """
+        Re-hash the downloaded files in parallel against their recorded digest
+
+        A file that does not match is removed together with its stored object,
+        so the next construction downloads it again. Return the removed paths
+        """
+        mismatched = []
+
+        def verify(meta: resource_info) -> None:
+            if hash_file(meta.local_path).hexdigest() == meta.digest:
+                return
+            logging.warning(f"Error! Corrupt file removed: '{meta.local_path}'")
+            mismatched.append(meta.local_path)
+            os.remove(meta.local_path)
+            self.store.discard(meta.digest)
+            meta.forget_local()
+
+        verified = 0
+        for meta in self.container.resources.resources.values():
+            if meta.digest is None or meta.local_path is None:
+                continue
+            if not os.path.isfile(meta.local_path):
+                continue
+            self.scheduler.submit(partial(verify, meta), name=meta.local_path)
+            verified += 1
+        self.scheduler.join()
+        self.container.save()
+        renderer.log(
+            f"Verified {verified} Files, {len(mismatched)} Corrupt File Removed."
+        )
+        return mismatched
+
+    def reconcile(self, restore: bool = False) -> Dict[str, List[str]]:
+        """
+        Compare the local files with the manifest, to find the ones edited or
+        deleted since they were downloaded
+
+        A downloaded file whose size or mtime changed is re-hashed, if it still
+        matches its digest it was only touched and is kept. The entry of an
+        item with a deleted or edited file is dropped, so the next construction
+        checks it with the server and downloads the deleted files again. Edited
+        files are kept unless restore, then they are removed to be downloaded
+        again as well. Return the deleted and the edited paths
+        """
+        result = {"deleted": [], "edited": []}
+        manifest = self.container.manifest
+        for item_id, curr_entry in list(manifest.entries.items()):
+            deleted = []
+            edited = []
+            for path in curr_entry.changed_files():
+                if not os.path.isfile(path):
+                    deleted.append(path)
+                elif (
+                    path == curr_entry.local_path
+                    and curr_entry.digest is not None
+                    and hash_file(path).hexdigest() == curr_entry.digest
+                ):
+                    stat = os.stat(path)
+                    curr_entry.files[path] = [stat.st_size, stat.st_mtime_ns]
+                else:
+                    edited.append(path)
+            if len(deleted) + len(edited) == 0:
+                continue
+            if curr_entry.local_path in deleted + edited:
+                self.forget_download(curr_entry)
+            if restore:
+                for path in edited:
+                    os.remove(path)
+            result["deleted"].extend(deleted)
+            result["edited"].extend(edited)
+            manifest.drop(item_id)
+            self.container.save_manifest(item_id)
+
+        for path in result["deleted"]:
+            logging.warning(f"Error! File deleted locally: '{path}'")
+        for path in result["edited"]:
+            logging.warning(f"Error! File edited locally: '{path}'")
+        self.container.save()
+        renderer.log(
+            f"Reconciled {len(manifest.entries)} Items, {len(result['deleted'])} Deleted and {len(result['edited'])} Edited Files Found."
+        )
+        return result
+
+    def forget_download(self, curr_entry: manifest_entry) -> None:
+        """
+        The downloaded file of the entry changed, stop trusting its validators
+        """
+        meta = self.container.resources.resources.get(curr_entry.resource)
+        if meta is None or meta.local_path != curr_entry.local_path:
+            return
+        # an edited hardlink has changed the stored object as well
+        if meta.digest is not None and os.path.isfile(meta.local_path):
+            object_path = self.store.object_path(meta.digest)
+            if os.path.isfile(object_path) and os.path.samefile(
+                meta.local_path, object_path
+            ):
+                self.store.discard(meta.digest)
+        meta.forget_local()
+        self.container.save_resource(meta)
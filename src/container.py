@@ -1,19 +1,44 @@
-import json
 import os
+from threading import Lock
 from time import time
 from typing import Dict, List, Type
 
 from src.cookie_reader import retreive_cookies
-from src.utils.enums import container_mode, custom_enum, video_mode
-from src.utils.func import checksum as checksum_func
+from src.fingerprint import fingerprint
+from src.serial import dumps, loads
+from src.session import session_pool
+from src.state import state_store
+from src.utils.enums import container_mode, custom_enum, state_mode, video_mode
 from src.utils.func import load_config
-from src.utils.params import modified_expire_time, video_expire_time
+from src.utils.params import (
+    detail_expire_time,
+    manifest_expire_time,
+    modified_expire_time,
+    moodle_course_url,
+    probe_expire_time,
+    secret_config_keys,
+    state_schema_version,
+    video_expire_time,
+)
 
 info_dict_path = "course_info.json"
+state_db_path = "course_info.db"
 fix_resource_store_dir = "Resources"
 
+decode_lock = Lock()
+
 
 class info:
+    """
+    Base of the course state models
+
+    Every model lists its fields in __slots__, which are also the fields of
+    its JSON. Slots keep an instance without a __dict__, a course holds one
+    item_info per activity and one resource_info per download
+    """
+
+    __slots__ = ()
+
     def __enter__(self) -> Type["info"]:
         return self
 
@@ -25,16 +50,29 @@ class info:
         return cls()
 
     def to_json(self) -> Dict:
-        return {}
+        return {field: getattr(self, field) for field in self.__slots__}
 
     def __str__(self) -> str:
-        return json.dumps(self.to_json(), indent=4, default=lambda x: x.to_json())
+        return dumps(self.to_json(), indent=True).decode("utf-8")
 
     def __repr__(self) -> str:
         return str(self)
 
 
 class item_info(info):
+    __slots__ = (
+        "id",
+        "title",
+        "type",
+        "link",
+        "detail",
+        "content",
+        "checksum",
+        "expirey",
+        "detail_expirey",
+        "detail_validator",
+    )
+
     expirey: int
     checksum: str
     id: str
@@ -42,6 +80,8 @@ class item_info(info):
     type: str
     link: str
     detail: Dict
+    detail_expirey: float  # None until the detail page is extracted
+    detail_validator: str  # item and login session the detail was extracted for
     content: List[str]
 
     def __init__(
@@ -55,6 +95,8 @@ class item_info(info):
         checksum: str = None,
         raw_content: str = None,
         expirey: int = None,
+        detail_expirey: float = None,
+        detail_validator: str = None,
     ) -> None:
         self.id = id
         self.title = title
@@ -68,26 +110,65 @@ class item_info(info):
             self.content = list()
         self.checksum = checksum
         if raw_content is not None:
-            self.checksum = checksum_func(raw_content)
+            self.checksum = fingerprint(raw_content)
         self.expirey = expirey
         if expirey is None:
             self.expirey = time() + modified_expire_time
             if self.type.lower() == "lti":
                 self.expirey = time() + video_expire_time
+        self.detail_expirey = detail_expirey
+        self.detail_validator = detail_validator
+
+    def is_detail_current(self, validator: str) -> bool:
+        """
+        Whether the extracted detail can be used without fetching its page again
+        """
+        return (
+            self.detail_expirey is not None
+            and time() < self.detail_expirey
+            and self.detail_validator == validator
+        )
+
+    def update_detail(self, validator: str) -> None:
+        """
+        Mark the detail as extracted for validator
+        """
+        self.detail_validator = validator
+        self.detail_expirey = time() + detail_expire_time
+        # the echo360 cookie in the detail expires with the video cookie
+        if self.type.lower() == "lti":
+            self.detail_expirey = time() + video_expire_time
+
+    def keep_detail(self, prev_item: "item_info") -> None:
+        """
+        Carry over the detail of the expired copy of this item
+        """
+        if prev_item.checksum != self.checksum:
+            return
+        self.detail = prev_item.detail
+        self.detail_expirey = prev_item.detail_expirey
+        self.detail_validator = prev_item.detail_validator
 
     @classmethod
     def from_json(cls, input_json: Dict) -> "item_info":
         return cls(**input_json)
 
-    def to_json(self) -> Dict:
-        return self.__dict__
-
 
 class section_info(info):
+    """
+    A section of the course, its items are built from their JSON on first use
+
+    Loading a course only decodes its JSON, the item_info of a section that
+    is never looked at is never built, and its JSON is saved back as is
+    """
+
+    __slots__ = ("title", "checksum", "expirey", "decoded_items", "pending_items")
+
     expirey: int
     title: str
     checksum: str
-    items: Dict[str, item_info]
+    decoded_items: Dict[str, item_info]
+    pending_items: Dict[str, Dict]  # JSON of the items, None once decoded
 
     def __init__(
         self,
@@ -99,12 +180,35 @@ class section_info(info):
         self.title = title
         self.checksum = checksum
         if raw_content is not None:
-            self.checksum = checksum_func(raw_content)
-        self.items = dict()
+            self.checksum = fingerprint(raw_content)
+        self.decoded_items = dict()
+        self.pending_items = None
         self.expirey = expirey
         if expirey is None:
             self.expirey = time() + modified_expire_time
 
+    @property
+    def items(self) -> Dict[str, item_info]:
+        if self.pending_items is not None:
+            self.decode_items()
+        return self.decoded_items
+
+    @items.setter
+    def items(self, items: Dict[str, item_info]) -> None:
+        self.decoded_items = items
+        self.pending_items = None
+
+    def decode_items(self) -> None:
+        # the worker threads of a pipelined run may reach the section at once
+        with decode_lock:
+            if self.pending_items is None:
+                return
+            self.decoded_items = {
+                key: item_info.from_json(value)
+                for key, value in self.pending_items.items()
+            }
+            self.pending_items = None
+
     def update_expirey(self, expire_time: int = None) -> None:
         if expire_time is None:
             for key, value in self.items.items():
@@ -114,28 +218,431 @@ class section_info(info):
 
     @property
     def items_length(self) -> int:
-        return len(self.items.items())
+        if self.pending_items is not None:
+            return len(self.pending_items)
+        return len(self.decoded_items)
 
     @classmethod
     def from_json(cls, input_json: Dict) -> "section_info":
         items = input_json.pop("items", dict())
         new_instance = cls(**input_json)
-        for key, value in items.items():
-            new_instance.items[key] = item_info.from_json(value)
+        new_instance.pending_items = items
         return new_instance
 
     def to_json(self) -> Dict:
-        return self.__dict__
+        items = self.pending_items
+        if items is None:
+            items = self.decoded_items
+        return {
+            "title": self.title,
+            "checksum": self.checksum,
+            "expirey": self.expirey,
+            "items": items,
+        }
+
+
+class resource_info(info):
+    """
+    Metadata of one downloadable resource, resolved by a single probe request
+
+    The local_* fields are the validators of the copy on disk, a later probe
+    sends them as a conditional request
+    """
+
+    expirey: float  # None until the resource is probed
+    url: str
+    final_url: str
+    revision: str  # checksum of the item the resource belongs to
+    content_length: int
+    content_type: str
+    etag: str
+    last_modified: str
+    accept_ranges: str
+    not_modified: bool  # last probe answered 304 for the local copy
+    local_path: str
+    local_etag: str
+    local_last_modified: str
+    digest: str  # sha256 of the local copy
+
+    __slots__ = (
+        "url",
+        "final_url",
+        "revision",
+        "content_length",
+        "content_type",
+        "etag",
+        "last_modified",
+        "accept_ranges",
+        "not_modified",
+        "local_path",
+        "local_etag",
+        "local_last_modified",
+        "digest",
+        "expirey",
+    )
+
+    def __init__(
+        self,
+        url: str = None,
+        final_url: str = None,
+        revision: str = None,
+        content_length: int = None,
+        content_type: str = None,
+        etag: str = None,
+        last_modified: str = None,
+        accept_ranges: str = None,
+        not_modified: bool = False,
+        local_path: str = None,
+        local_etag: str = None,
+        local_last_modified: str = None,
+        digest: str = None,
+        expirey: float = None,
+    ) -> None:
+        self.url = url
+        self.final_url = final_url
+        self.revision = revision
+        self.content_length = content_length
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.accept_ranges = accept_ranges
+        self.not_modified = not_modified
+        self.local_path = local_path
+        self.local_etag = local_etag
+        self.local_last_modified = local_last_modified
+        self.digest = digest
+        self.expirey = expirey
+
+    @property
+    def is_probed(self) -> bool:
+        return self.expirey is not None and time() < self.expirey
+
+    def update(self, final_url: str, headers: Dict[str, str]) -> None:
+        self.final_url = final_url
+        size = headers.get("content-length")
+        self.content_length = None if size is None else int(size)
+        self.content_type = headers.get("Content-Type")
+        self.etag = headers.get("ETag")
+        self.last_modified = headers.get("Last-Modified")
+        self.accept_ranges = headers.get("Accept-Ranges")
+        self.not_modified = False
+        self.expirey = time() + probe_expire_time
+
+    def revalidate(self) -> None:
+        """
+        The server confirmed the local copy, keep the stored metadata
+        """
+        self.not_modified = True
+        self.expirey = time() + probe_expire_time
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = dict()
+        if self.local_path is None or not os.path.isfile(self.local_path):
+            return headers
+        if self.local_etag is not None:
+            headers["If-None-Match"] = self.local_etag
+        if self.local_last_modified is not None:
+            headers["If-Modified-Since"] = self.local_last_modified
+        return headers
+
+    def record_local(
+        self, local_path: str, headers: Dict[str, str] = None, digest: str = None
+    ) -> None:
+        """
+        Remember the validators and digest of the copy just written to local_path
+        """
+        self.digest = digest
+        if headers is not None:
+            self.etag = headers.get("ETag", self.etag)
+            self.last_modified = headers.get("Last-Modified", self.last_modified)
+        self.local_path = local_path
+        self.local_etag = self.etag
+        self.local_last_modified = self.last_modified
+
+    def forget_local(self) -> None:
+        """
+        The local copy is gone or corrupt, download it again on the next run
+        """
+        self.local_path = None
+        self.local_etag = None
+        self.local_last_modified = None
+        self.digest = None
+        self.not_modified = False
+        self.expirey = None
+
+    def is_local_current(
+        self, local_path: str, local_size: int, content_length: int
+    ) -> bool:
+        """
+        Whether the copy at local_path is the current version of the resource
+
+        content_length is -1 for web pages, which are only current after a 304
+        """
+        if not os.path.isfile(local_path):
+            return False
+        if self.local_path == local_path:
+            if self.not_modified:
+                return True
+            if self.local_etag is not None or self.local_last_modified is not None:
+                # same size edits are caught by the validators
+                return (
+                    self.local_etag == self.etag
+                    and self.local_last_modified == self.last_modified
+                    and (content_length == -1 or local_size == content_length)
+                )
+        if content_length is None or content_length == -1:
+            return False
+        return local_size >= content_length
+
+    @classmethod
+    def from_json(cls, input_json: Dict) -> "resource_info":
+        return cls(**input_json)
+
+
+class resource_table(info):
+    __slots__ = ("resources", "lock")
+
+    resources: Dict[str, resource_info]
+    lock: Lock
+
+    def __init__(self) -> None:
+        self.resources = dict()
+        self.lock = Lock()
+
+    def get(self, key: str, revision: str = None) -> resource_info:
+        """
+        Return the stored metadata of key, dropping it if the item has changed
+        """
+        with self.lock:
+            curr_resource = self.resources.get(key)
+            if curr_resource is None:
+                curr_resource = resource_info(url=key, revision=revision)
+                self.resources[key] = curr_resource
+            elif revision is not None and curr_resource.revision != revision:
+                # the item changed, probe again but keep the local validators
+                curr_resource.revision = revision
+                curr_resource.expirey = None
+            return curr_resource
+
+    def rename_revision(self, revision: str, new_revision: str) -> None:
+        """
+        Move the resources of revision to new_revision, the item is unchanged
+        """
+        with self.lock:
+            for curr_resource in self.resources.values():
+                if curr_resource.revision == revision:
+                    curr_resource.revision = new_revision
+
+    @classmethod
+    def from_json(cls, input_json: Dict) -> "resource_table":
+        new_instance = cls()
+        for key, value in input_json.items():
+            new_instance.resources[key] = resource_info.from_json(value)
+        return new_instance
+
+    def to_json(self) -> Dict:
+        return self.resources
+
+
+def stat_tree(path: str) -> Dict[str, List[int]]:
+    """
+    Size and mtime of the file at path, or of every file under the folder
+    """
+    paths = [path]
+    if os.path.isdir(path):
+        paths = [
+            os.path.join(root, filename)
+            for root, dirs, filenames in os.walk(path)
+            for filename in filenames
+        ]
+    stats = dict()
+    for file_path in paths:
+        stat = os.stat(file_path)
+        stats[file_path] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+
+class manifest_entry(info):
+    """
+    The local files of one item, as written by the run that downloaded it
+
+    While the item and the layout of the course folder are unchanged, the
+    files are up to date as long as their size and mtime are, no request is
+    needed to tell
+    """
+
+    item_id: str
+    revision: str  # checksum of the item the files were written for
+    layout: str  # naming config and indices the paths were formatted with
+    resource: str  # key of the resource_info of the download
+    local_path: str  # the downloaded file, the others are produced from it
+    files: Dict[str, List[int]]  # size and mtime_ns of every local file
+    digest: str
+    etag: str
+    last_modified: str
+    verified: float  # time the files were last checked against the server
+
+    __slots__ = (
+        "item_id",
+        "revision",
+        "layout",
+        "resource",
+        "local_path",
+        "files",
+        "digest",
+        "etag",
+        "last_modified",
+        "verified",
+    )
+
+    def __init__(
+        self,
+        item_id: str = None,
+        revision: str = None,
+        layout: str = None,
+        resource: str = None,
+        local_path: str = None,
+        files: Dict[str, List[int]] = None,
+        digest: str = None,
+        etag: str = None,
+        last_modified: str = None,
+        verified: float = None,
+    ) -> None:
+        self.item_id = item_id
+        self.revision = revision
+        self.layout = layout
+        self.resource = resource
+        self.local_path = local_path
+        self.files = files if files is not None else dict()
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.verified = verified
+
+    def is_current(self, revision: str, layout: str) -> bool:
+        """
+        Whether the files are up to date, one stat per file and no request
+
+        After manifest_expire_time the server is asked again, the course page
+        does not always change along with a file
+        """
+        if self.revision != revision or self.layout != layout:
+            return False
+        if self.verified is None or time() >= self.verified + manifest_expire_time:
+            return False
+        if len(self.files) == 0:
+            return False
+        return len(self.changed_files()) == 0
+
+    def changed_files(self) -> List[str]:
+        changed = []
+        for path, (size, mtime) in self.files.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                changed.append(path)
+                continue
+            if stat.st_size != size or stat.st_mtime_ns != mtime:
+                changed.append(path)
+        return changed
+
+    @classmethod
+    def from_json(cls, input_json: Dict) -> "manifest_entry":
+        return cls(**input_json)
+
+
+class manifest_table(info):
+    __slots__ = ("entries", "lock")
+
+    entries: Dict[str, manifest_entry]  # entry per item id
+    lock: Lock
+
+    def __init__(self) -> None:
+        self.entries = dict()
+        self.lock = Lock()
+
+    def get(self, item_id: str) -> manifest_entry:
+        with self.lock:
+            return self.entries.get(item_id)
+
+    def is_current(self, item_id: str, revision: str, layout: str) -> bool:
+        curr_entry = self.get(item_id)
+        return curr_entry is not None and curr_entry.is_current(revision, layout)
+
+    def record(
+        self,
+        item_id: str,
+        revision: str,
+        layout: str,
+        paths: List[str],
+        meta: resource_info,
+    ) -> manifest_entry:
+        """
+        Replace the entry of the item with the files it has just written
+        """
+        files = dict()
+        for path in paths:
+            if os.path.exists(path):
+                files.update(stat_tree(path))
+        curr_entry = manifest_entry(
+            item_id=item_id,
+            revision=revision,
+            layout=layout,
+            resource=meta.url,
+            local_path=meta.local_path,
+            files=files,
+            digest=meta.digest,
+            etag=meta.local_etag,
+            last_modified=meta.local_last_modified,
+            verified=time(),
+        )
+        with self.lock:
+            self.entries[item_id] = curr_entry
+        return curr_entry
+
+    def drop(self, item_id: str) -> None:
+        with self.lock:
+            self.entries.pop(item_id, None)
+
+    @classmethod
+    def from_json(cls, input_json: Dict) -> "manifest_table":
+        new_instance = cls()
+        for key, value in input_json.items():
+            new_instance.entries[key] = manifest_entry.from_json(value)
+        return new_instance
+
+    def to_json(self) -> Dict:
+        return self.entries
 
 
 class course_info(info):
+    __slots__ = (
+        "course_id",
+        "course_title",
+        "target_website",
+        "course_cookie",
+        "config",
+        "contents",
+        "resources",
+        "manifest",
+        "mode",
+        "sessions",
+        "state",
+        "store_dir",
+        "fixed_resource_store_dir",
+    )
+
     course_id: str
     course_title: str
     target_website: str
     course_cookie: Dict[str, str]
     config: Dict[str, custom_enum | str]
     contents: Dict[str, section_info]
+    resources: resource_table
+    manifest: manifest_table
     mode: container_mode
+    sessions: session_pool
+    state: state_store  # None unless STATE_STORE=SQLITE
 
     store_dir: str
     fixed_resource_store_dir: str
@@ -146,6 +653,7 @@ class course_info(info):
         store_dir: str,
         target_website: str = None,
         login_cookie: Dict[str, str] = None,
+        sessions: session_pool = None,
     ) -> None:
         self.course_id = course_id
         self.course_title = ""
@@ -155,9 +663,20 @@ class course_info(info):
         self.course_cookie = login_cookie
         self.mode = None
         self.contents = dict()
+        self.resources = resource_table()
+        self.manifest = manifest_table()
 
         self.config = load_config()
-        self.try_load_prev_info_dict()
+        self.state = None
+        if self.config["state_store"] == state_mode.SQLITE:
+            self.state = state_store(os.path.join(store_dir, state_db_path))
+        if self.state is not None and not self.state.is_empty():
+            self.load_state()
+        else:
+            self.try_load_prev_info_dict()
+            if self.state is not None:
+                # one time import of the course_info.json of earlier runs
+                self.state.save_course(self)
         if self.course_cookie is None:
             if self.target_website is None:
                 raise ValueError(
@@ -166,20 +685,93 @@ class course_info(info):
             self.course_cookie = retreive_cookies(target_website=self.target_website)
             # print(json.dumps(self.course_cookie, indent=4))
 
+        # cookies are attached to the moodle session once, not on every request
+        self.sessions = sessions
+        if self.sessions is None:
+            self.sessions = session_pool(
+                pool_size=self.config["max_workers_per_host"]
+                * self.config["segment_count"]
+            )
+        self.sessions.attach_cookies(
+            self.target_website or moodle_course_url, self.course_cookie
+        )
+
     def init_params(self) -> None:
         if self.contents is not None:
             self.contents.clear()
         else:
             self.contents = dict()
+        self.resources = resource_table()
+        self.manifest = manifest_table()
 
     def __enter__(self) -> "course_info":
         return self
 
     def save(self) -> None:
-        with open(
-            os.path.join(self.store_dir, "course_info.json"), "w", encoding="utf-8"
-        ) as record:
-            record.write(str(self))
+        if self.state is not None:
+            return self.state.save_course(self)
+        with open(os.path.join(self.store_dir, "course_info.json"), "wb") as record:
+            record.write(dumps(self.to_json(), indent=True))
+
+    def save_section(self, section_id: str, section: section_info) -> None:
+        """
+        Write the section and its items as soon as they are extracted, only
+        the state store is written before save()
+        """
+        if self.state is None:
+            return
+        self.state.upsert_general(self.to_json()["general"])
+        self.state.upsert_section(section_id, section)
+
+    def save_item(self, curr_item: item_info) -> None:
+        if self.state is None:
+            return
+        self.state.upsert_item(curr_item)
+
+    def save_resource(self, curr_resource: resource_info) -> None:
+        if self.state is None or curr_resource is None:
+            return
+        self.state.upsert_resource(curr_resource.url, curr_resource)
+
+    def save_manifest(self, item_id: str) -> None:
+        if self.state is None:
+            return
+        curr_entry = self.manifest.get(item_id)
+        if curr_entry is None:
+            self.state.delete_manifest(item_id)
+        else:
+            self.state.upsert_manifest(curr_entry)
+
+    def check_general(self, general_dict: Dict) -> None:
+        # the state of earlier versions has no version, and is read the same
+        if general_dict.get("schema-version", 1) > state_schema_version:
+            raise ValueError(
+                "Error! Course state was written by a newer version, please update to continue!"
+            )
+        # found class is not the class we currently working on. the id is an int
+        # or a str depending on the caller, compared as a str
+        if "course-id" in general_dict and str(general_dict["course-id"]) != str(
+            self.course_id
+        ):
+            print(general_dict["course-id"], self.course_id)
+            raise ValueError(
+                "Error! Folder contains existing course, please select another folder to continue!"
+            )
+        if (
+            "target-website" in general_dict
+            and general_dict["target-website"] != self.target_website
+        ):
+            raise ValueError(
+                "Error! Folder contains existing course, please select another folder to continue!"
+            )
+
+    def load_state(self) -> None:
+        self.check_general(self.state.load_general())
+        for key, value in self.state.load_sections().items():
+            self.contents[key] = section_info.from_json(value)
+        self.resources = resource_table.from_json(self.state.load_resources())
+        self.manifest = manifest_table.from_json(self.state.load_manifest())
+        self.mode = container_mode.update
 
     def try_load_prev_info_dict(self, target_file_path: str = None) -> None:
         if target_file_path is None:
@@ -192,30 +784,18 @@ class course_info(info):
         if not os.path.isfile(prev_info_dict_path):
             return self.init_params()
 
-        with open(prev_info_dict_path, "r", encoding="utf-8") as input:
-            info_dict: Dict = json.load(input)
+        with open(prev_info_dict_path, "rb") as input:
+            info_dict: Dict = loads(input.read())
             if info_dict is None:
                 return self.init_params()
-            general_dict = info_dict["general"]
-            # found class is not the class we currently working on
-            if (
-                "course-id" in general_dict
-                and general_dict["course-id"] != self.course_id
-            ):
-                print(general_dict["course-id"], self.course_id)
-                raise ValueError(
-                    "Error! Folder contains existing course, please select another folder to continue!"
-                )
-            if (
-                "target-website" in general_dict
-                and general_dict["target-website"] != self.target_website
-            ):
-                raise ValueError(
-                    "Error! Folder contains existing course, please select another folder to continue!"
-                )
+            self.check_general(info_dict["general"])
             if "contents" in info_dict:
                 for key, value in info_dict["contents"].items():
                     self.contents[key] = section_info.from_json(value)
+                if "resources" in info_dict:
+                    self.resources = resource_table.from_json(info_dict["resources"])
+                if "manifest" in info_dict:
+                    self.manifest = manifest_table.from_json(info_dict["manifest"])
                 self.mode = container_mode.update
             else:
                 self.contents = dict()
@@ -224,10 +804,19 @@ class course_info(info):
     def to_json(self) -> Dict:
         return {
             "general": {
+                "schema-version": state_schema_version,
                 "course-id": self.course_id,
                 "course-title": self.course_title,
                 "target-website": self.target_website,
-                "config": self.config,
+                # enums by name, orjson would write their value. secrets are
+                # never written to the course state
+                "config": {
+                    key: value.to_json() if isinstance(value, custom_enum) else value
+                    for key, value in self.config.items()
+                    if key not in secret_config_keys
+                },
             },
             "contents": self.contents,
+            "resources": self.resources,
+            "manifest": self.manifest,
         }
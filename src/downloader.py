@@ -1,39 +1,290 @@
+import hashlib
 import json
 import logging
 import os
-import traceback
-from io import BufferedReader
-from math import floor
+from io import BufferedIOBase
+from math import ceil
 from threading import Event, Thread
-from time import sleep, time
-from typing import Callable, Dict
+from time import time
+from typing import Any, Callable, Dict, Iterator, List
 
 import requests
 from requests import Response
 
-from src.utils import progress_bar, request_method
+from src.container import resource_info
+from src.limiter import bandwidth, bandwidth_limiter
+from src.retry import (
+    check_response,
+    check_status,
+    classify,
+    fatal_error,
+    retry_policy,
+    retryable_error,
+)
+from src.session import get_host
+from src.store import object_store
+from src.utils import (
+    hash_file,
+    is_html,
+    link_file,
+    partial,
+    preallocate_file,
+    request_method,
+)
+from src.utils.params import (
+    bandwidth_quantum,
+    chunk_grow_time,
+    chunk_max_size,
+    chunk_min_size,
+    chunk_shrink_time,
+    segment_min_size,
+)
+from src.utils.progress import renderer
 
 
-class loading(Thread):
-    exit_signal: Event
-    msg: str
+def probe_resource(
+    meta: resource_info,
+    session: requests.Session = None,
+    cookies: Dict[str, str] = None,
+    timeout: float = 120.0,
+    policy: retry_policy = None,
+) -> resource_info:
+    """
+    Resolve final url, size, type and validators of meta.url with one HEAD request
+
+    When the local copy is known the request is conditional, and a 304 keeps
+    the stored metadata. The metadata is only cached (marked as probed) when
+    the request succeeded. With a policy, transient failures are retried in
+    place with its backoff
+    """
+    if policy is not None:
+        return policy.call(
+            partial(
+                probe_resource,
+                meta=meta,
+                session=session,
+                cookies=cookies,
+                timeout=timeout,
+            ),
+            url=meta.url,
+        )
+    params = {"url": meta.url, "timeout": timeout, "allow_redirects": True}
+    if session is None:
+        params["cookies"] = cookies
+    headers = meta.conditional_headers()
+    if len(headers) > 0:
+        params["headers"] = headers
+    res: Response = request_method.HEAD.get_req_method(session)(**params)
+    if res.status_code == 304:
+        meta.revalidate()
+        return meta
+    meta.update(final_url=res.url, headers=res.headers)
+    if not res.ok:
+        meta.expirey = None
+        check_response(res, strict=False)
+    return meta
+
+
+def is_encoded(headers: Dict[str, str]) -> bool:
+    """
+    Whether the body is sent compressed, its length then differs from the file size
+    """
+    encoding = headers.get("Content-Encoding", "identity")
+    return encoding.lower() not in ["", "identity"]
+
+
+class decoded_body:
+    """
+    readinto over the decoded body of a compressed response
+
+    urllib3 only decodes what is read through its read(), the decoded chunks
+    can be larger than the buffer, the rest is kept for the next call
+    """
+
+    chunks: Iterator[bytes]
+    pending: memoryview
+
+    def __init__(self, res_obj: Response) -> None:
+        self.chunks = res_obj.raw.stream(chunk_min_size, decode_content=True)
+        self.pending = memoryview(b"")
 
-    def __init__(self, msg: str = "Loading", dot_limit: int = 3):
-        self.exit_signal = Event()
-        self.msg = msg
-        self.dot_limit = dot_limit
+    def readinto(self, buffer: memoryview) -> int:
+        if len(self.pending) == 0:
+            self.pending = memoryview(next(self.chunks, b""))
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def read_stream(
+    res_obj: Response,
+    file_obj: BufferedIOBase,
+    on_read: Callable[[int], None],
+    on_flush: Callable[[], None] = None,
+    limit: int = None,
+    abort_signal: Event = None,
+    limiter: bandwidth_limiter = None,
+    host: str = None,
+    hasher: Any = None,
+) -> int:
+    """
+    Copy the body of a streamed response into file_obj, return the num of
+    bytes written
+
+    The socket is read straight into one preallocated buffer through a
+    memoryview, and the buffer is written out once full. The chunk size
+    starts at chunk_min_size and adapts to the throughput. Compressed bodies
+    are decoded by urllib3 first, the num of bytes is then the decoded
+    length, res_obj.raw.tell() is the one received.
+
+    While the limiter is enabled every read is capped to one quantum and
+    waits for its bandwidth of host. hasher is fed every buffer before it
+    is written. on_flush is called once a buffer is flushed out of file_obj,
+    the bytes are then visible to other handles of the file.
+    """
+    raw = res_obj.raw
+    fp = getattr(raw, "_fp", None)
+    zero_copy = not is_encoded(res_obj.headers) and hasattr(fp, "readinto")
+    readinto = fp.readinto if zero_copy else decoded_body(res_obj).readinto
+
+    view = memoryview(bytearray(chunk_max_size))
+    chunk_size = chunk_min_size
+    filled = 0
+    total = 0
+    eof = False
+    flush_time = time()
+    while limit is None or total < limit:
+        if abort_signal is not None and abort_signal.is_set():
+            break
+        end = chunk_size
+        if limit is not None:
+            end = min(end, filled + limit - total)
+        limited = limiter is not None and limiter.enabled
+        if limited:
+            end = min(end, filled + bandwidth_quantum)
+        read_size = readinto(view[filled:end])
+        if not read_size:
+            eof = True
+            break
+        if limited:
+            limiter.consume(host, read_size)
+        filled += read_size
+        total += read_size
+        on_read(read_size)
+        if filled < end:
+            continue
+        if hasher is not None:
+            hasher.update(view[:filled])
+        file_obj.write(view[:filled])
+        filled = 0
+        if on_flush is not None:
+            file_obj.flush()
+            on_flush()
+        now = time()
+        if now - flush_time < chunk_grow_time and chunk_size < chunk_max_size:
+            chunk_size *= 2
+        elif now - flush_time > chunk_shrink_time and chunk_size > chunk_min_size:
+            chunk_size //= 2
+        flush_time = now
+    if filled > 0:
+        if hasher is not None:
+            hasher.update(view[:filled])
+        file_obj.write(view[:filled])
+        if on_flush is not None:
+            file_obj.flush()
+            on_flush()
+    # http.client finished the body by itself, hand the connection back to the pool
+    if zero_copy and eof:
+        raw.release_conn()
+    return total
+
+
+class segment(Thread):
+    """
+    Fetch the byte range [range_start, range_end] of the target into its place
+    in the preallocated file
+    """
+
+    parent: "downloader"
+    params: Dict
+    range_start: int
+    range_end: int
+    fetched_length: int
+    flushed_length: int  # part of fetched_length written to the file
+    range_ignored: bool  # server answered the range request with another body
+    error: Exception
+
+    def __init__(
+        self, parent: "downloader", params: Dict, range_start: int, range_end: int
+    ):
+        self.parent = parent
+        self.params = params
+        self.range_start = range_start
+        self.range_end = range_end
+        self.fetched_length = 0
+        self.flushed_length = 0
+        self.range_ignored = False
+        self.error = None
         Thread.__init__(self=self)
+        self.daemon = True
+
+    @property
+    def length(self) -> int:
+        return self.range_end - self.range_start + 1
+
+    def add_fetched(self, length: int) -> None:
+        self.fetched_length += length
 
-    def stop(self):
-        self.exit_signal.set()
+    def mark_flushed(self) -> None:
+        self.flushed_length = self.fetched_length
 
-    def run(self):
-        col = len(self.msg) + self.dot_limit
-        while not self.exit_signal.is_set():
-            dot_num = int(floor(time()) % self.dot_limit) + 1
-            print(self.msg + "." * dot_num)
-            sleep(1)
-            print("\033[A{}\033[A".format(" " * col))
+    def fetch(self) -> None:
+        offset = self.range_start + self.fetched_length
+        params = self.params.copy()
+        headers = dict(params.pop("headers", None) or {})
+        headers["Range"] = f"bytes={offset}-{self.range_end}"
+        with self.parent.method(stream=True, headers=headers, **params) as res_obj:
+            # the ranges of a compressed body are not those of the file
+            if res_obj.status_code != 206 or is_encoded(res_obj.headers):
+                check_response(res_obj)
+                self.range_ignored = True
+                return
+            with open(self.parent.part_path, "r+b") as file_obj:
+                file_obj.seek(offset)
+                read_stream(
+                    res_obj=res_obj,
+                    file_obj=file_obj,
+                    on_read=self.add_fetched,
+                    on_flush=self.mark_flushed,
+                    limit=self.length - self.fetched_length,
+                    abort_signal=self.parent.abort_signal,
+                    limiter=bandwidth,
+                    host=self.parent.host,
+                )
+
+    def run(self) -> None:
+        retry_num = 0
+        while self.fetched_length < self.length:
+            if self.parent.abort_signal.is_set():
+                return
+            try:
+                self.fetch()
+                if self.range_ignored:
+                    self.parent.abort_signal.set()
+                    return
+            except Exception as e:
+                # the buffered bytes that did not reach the file are fetched again
+                self.fetched_length = self.flushed_length
+                error = classify(e)
+                if not self.parent.policy.should_retry(error, retry_num):
+                    self.error = error
+                    self.parent.abort_signal.set()
+                    return
+                self.parent.abort_signal.wait(
+                    self.parent.policy.delay(retry_num, error.retry_after)
+                )
+                retry_num += 1
 
 
 class downloader:
@@ -43,20 +294,30 @@ class downloader:
 
     url: str  # path to download target file
     cookies: Dict[str, str]
+    session: requests.Session  # pooled session of the target host, if any
+    request_type: request_method
     store_path: str  # path to store the downloaded target file
     file_name: str  # downloaded target file name fetched from url
     socket_timeout: float  # time to stop and retry after x secs
     retry_limit: int  # limit of num of retries
+    policy: retry_policy  # backoff between retries, from retry_limit by default
 
-    retry_num: int  # num of retries have occurred
     progress: float  # progress of the download
     content_length: int  # target file total length
     fetched_length: int  # downloaded target file length
     threshold: int  # if less than threshold, the cookie might be not valid
+    segment_threshold: int  # files larger than this are fetched in segments
+    segment_count: int  # max num of concurrent byte ranges for this file
+    preallocate: bool  # reserve the file on disk before writing it
+    journal_time: float  # last time the stream journal was saved
+    store: object_store  # content-addressed store the file is kept in, if any
+    hasher: Any  # sha256 of the stream, fed while it is written
+    encoded: bool  # the stream is compressed, its offsets are not the file's
+    abort_signal: Event  # stops the running segments
     downloaded: bool  # whether the file is already downloaded
 
     params: Dict
-    loading_thread: loading
+    meta: resource_info  # probed metadata, shared with the course state
 
     def __init__(
         self,
@@ -70,26 +331,47 @@ class downloader:
         threshold: int = None,
         suppress_url_file_check: bool = False,
         url_filename: str = "",
+        session: requests.Session = None,
+        meta: resource_info = None,
+        segment_threshold: int = None,
+        segment_count: int = None,
+        preallocate: bool = None,
+        store: object_store = None,
+        policy: retry_policy = None,
     ):
         self.url = url
+        self.meta = meta
+        if self.meta is None:
+            self.meta = resource_info(url=url)
         self.cookies = cookies
+        self.session = session
         self.threshold = threshold
-        self.method = method.get_req_method()
+        self.segment_threshold = segment_threshold
+        self.segment_count = segment_count
+        self.preallocate = preallocate
+        self.journal_time = 0
+        self.store = store
+        self.hasher = None
+        self.encoded = False
+        self.abort_signal = Event()
+        self.request_type = method
+        self.method = method.get_req_method(session)
         # self.cookies = dict_to_str(cookies)
         self.store_path = store_path
         self.socket_timeout = socket_timeout
         self.retry_limit = retry_limit
-        self.retry_num = 0
+        self.policy = policy
         self.progress = 0
         self.fetched_length = 0
         self.downloaded = False
-        self.loading_thread = None
         self.params = {
             "url": self.url,
             "timeout": self.socket_timeout,
-            "cookies": self.cookies,
             "allow_redirects": True,
         }
+        # a pooled session already carries the cookies of its host
+        if self.session is None:
+            self.params["cookies"] = self.cookies
 
         if params is not None:
             self.params.update(params)
@@ -104,33 +386,39 @@ class downloader:
             if not self.is_url_file_exists():
                 raise FileNotFoundError("Error! File is not found on the target url!")
 
-        self.content_length = self.get_content_length()
+        # a POST endpoint (folder zip) can not be probed without generating the
+        # whole response, its headers are read from the download stream instead
+        self.content_length = None
+        if self.request_type != request_method.POST:
+            self.content_length = self.get_content_length()
 
         self.get_local_file_size()
 
-    def stop_loading_thread(self):
-        if self.loading_thread is not None:
-            self.loading_thread.stop()
-            self.loading_thread.join(1)
-
-    def start_loading_thread(self, loading_str: str = None):
-        if self.loading_thread is not None:
-            self.stop_loading_thread()
-        if loading_str is None:
-            loading_str = f"Connecting to Resource: {self.file_name}"
-        self.loading_thread = loading(msg=loading_str)
-        self.loading_thread.daemon = True
-        self.loading_thread.start()
+    def probe(self) -> resource_info:
+        """
+        Fill self.meta unless a previous probe (this run or a cached one) did
+        """
+        if not self.meta.is_probed:
+            probe_resource(
+                meta=self.meta,
+                session=self.session,
+                cookies=self.cookies,
+                timeout=self.socket_timeout,
+                policy=self.policy or retry_policy(retry_limit=self.retry_limit),
+            )
+        return self.meta
 
     def is_url_file_exists(self):
         """
         Checks to see if the target file exists in the target url
         """
         try:
-            res = requests.head(**self.params)
+            self.probe()
             # if self.store_path is None:
-            self.file_name = res.url.split("?")[0].split("/")[-1]
+            self.file_name = self.meta.final_url.split("?")[0].split("/")[-1]
             # self.store_path += self.file_name
+        except retryable_error:
+            raise
         except Exception:
             return False
         return True
@@ -142,27 +430,22 @@ class downloader:
         If target is a web page, return -1
         """
         try:
-            if query_method is None:
-                query_method = requests.head
-                if self.method == request_method.POST.get_req_method():
+            if query_method is None and self.request_type != request_method.POST:
+                # reuse the single HEAD probe shared with is_url_file_exists
+                self.probe()
+                size = self.meta.content_length
+                res_type = self.meta.content_type
+                res_headers = str(self.meta)
+            else:
+                if query_method is None:
                     query_method = self.method
-            res: Response = query_method(**self.params)
-            size = res.headers.get("content-length")
-            res_type = res.headers.get("Content-Type")
-            if res_type is not None and "text/html" in res_type:
-                self.content_length = -1
-                return -1
-            if size is None or int(size) == 0:
-                # with open("error.html", "w", encoding="utf-8") as f:
-                #     f.write(res.content.decode("utf-8"))
-                raise ConnectionError(
-                    "Error! File is not found on the target url or File has no content!\n"
-                    + f"Method: {self.method}; Params: \n{json.dumps(self.params, indent=4)} \n"
-                    + "response header: \n"
-                    + str(res.headers)
-                )
-            self.content_length = int(size)
-            return self.content_length
+                res: Response = query_method(**self.params)
+                size = res.headers.get("content-length")
+                res_type = res.headers.get("Content-Type")
+                res_headers = str(res.headers)
+            return self.check_content_length(
+                size=size, res_type=res_type, res_headers=res_headers
+            )
         except ConnectionError:
             raise
         except Exception as e:
@@ -170,6 +453,88 @@ class downloader:
                 f"Error! File is not found on the target url!\n Detail: {e}"
             )
 
+    def check_content_length(
+        self, size: int | str, res_type: str, res_headers: str
+    ) -> int:
+        """
+        Interpret the content-length and content-type of the target url
+
+        If target is a web page, return -1
+        """
+        if res_type is not None and "text/html" in res_type:
+            self.content_length = -1
+            return -1
+        if size is None or int(size) == 0:
+            # with open("error.html", "w", encoding="utf-8") as f:
+            #     f.write(res.content.decode("utf-8"))
+            raise fatal_error(
+                "Error! File is not found on the target url or File has no content!\n"
+                + f"Method: {self.method}; Params: \n{json.dumps(self.params, indent=4)} \n"
+                + "response header: \n"
+                + res_headers
+            )
+        self.content_length = int(size)
+        return self.content_length
+
+    def open_stream(self, params: Dict) -> Response:
+        """
+        Open the streamed download response and read its headers as the probe
+
+        Used for endpoints that can not be probed with a HEAD request, so the
+        same response decides whether to skip and otherwise feeds the file.
+        Return None when the server answers 304 for the local copy
+        """
+        params = params.copy()
+        headers = dict(params.pop("headers", None) or {})
+        headers.update(self.conditional_headers())
+        res_obj: Response = self.method(stream=True, headers=headers, **params)
+        if res_obj.status_code == 304:
+            res_obj.close()
+            self.not_modified()
+            return None
+        try:
+            self.accept_stream(
+                status_code=res_obj.status_code,
+                reason=res_obj.reason,
+                url=res_obj.url,
+                headers=res_obj.headers,
+            )
+        except Exception:
+            res_obj.close()
+            raise
+        return res_obj
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """
+        Validators of the local copy, for a download request that is also the probe
+        """
+        if self.meta.local_path != self.store_path:
+            return dict()
+        return self.meta.conditional_headers()
+
+    def not_modified(self) -> None:
+        """
+        The download request was answered 304, keep the local copy
+        """
+        self.meta.revalidate()
+        self.content_length = self.meta.content_length
+        if self.content_length is None:
+            self.content_length = -1
+
+    def accept_stream(
+        self, status_code: int, reason: str, url: str, headers: Dict[str, str]
+    ) -> None:
+        """
+        Read the headers of the download stream as the probe
+        """
+        check_status(status_code=status_code, reason=reason, url=url, headers=headers)
+        self.meta.update(final_url=url, headers=headers)
+        self.check_content_length(
+            size=self.meta.content_length,
+            res_type=self.meta.content_type,
+            res_headers=str(headers),
+        )
+
     def get_local_file_size(
         self, assign_to_attribute: bool = True, filename: str = None
     ) -> int:
@@ -186,57 +551,499 @@ class downloader:
             self.fetched_length = file_length
         return file_length
 
-    def __retry(self):
+    @property
+    def part_path(self) -> str:
+        return self.store_path + ".part"
+
+    @property
+    def journal_path(self) -> str:
+        return self.store_path + ".part.json"
+
+    def load_journal(self) -> Dict:
+        """
+        Return the journal of an interrupted download of the same remote file
+
+        None when there is nothing to resume, or the remote file has changed
+        """
+        if self.content_length is None or self.content_length == -1:
+            return None
+        if not os.path.isfile(self.part_path) or not os.path.isfile(self.journal_path):
+            return None
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as journal_file:
+                journal = json.load(journal_file)
+        except Exception:
+            return None
+        # without a validator there is no way to know the part is still valid
+        if self.meta.etag is None and self.meta.last_modified is None:
+            return None
+        if (
+            journal.get("content_length") != self.content_length
+            or journal.get("etag") != self.meta.etag
+            or journal.get("last_modified") != self.meta.last_modified
+        ):
+            return None
+        return journal
+
+    def save_journal(
+        self, segments: List[List[int]] = None, fetched_length: int = None
+    ) -> None:
+        journal = {
+            "url": self.url,
+            "etag": self.meta.etag,
+            "last_modified": self.meta.last_modified,
+            "content_length": self.content_length,
+        }
+        if segments is not None:
+            journal["segments"] = segments
+        if fetched_length is not None:
+            journal["fetched_length"] = fetched_length
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as journal_file:
+            journal_file.write(json.dumps(journal))
+        os.replace(tmp_path, self.journal_path)
+
+    def discard_part(self) -> None:
+        for path in [self.part_path, self.journal_path]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def finalize_part(
+        self,
+        call_back: Callable = None,
+        headers: Dict[str, str] = None,
+        digest: str = None,
+    ) -> None:
+        """
+        Atomically move the completed .part file to the target path, and keep
+        it in the object store
+
+        A web page received in place of a file (login or error page) is
+        discarded instead
+        """
+        if self.content_length != -1 and not self.file_name.lower().endswith(
+            (".html", ".htm")
+        ):
+            with open(self.part_path, "rb") as part_file:
+                head = part_file.read(512)
+            if is_html(head):
+                self.discard_part()
+                raise fatal_error(
+                    f"Error! Received a web page instead of '{self.file_name}', cookie might not be valid!"
+                )
+        if digest is None:
+            digest = hash_file(self.part_path).hexdigest()
+        os.replace(self.part_path, self.store_path)
+        if os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+        self.meta.record_local(
+            local_path=self.store_path, headers=headers, digest=digest
+        )
+        # web pages are generated per request, not worth keeping
+        if self.store is not None and self.content_length != -1:
+            self.store.add(path=self.store_path, digest=digest, meta=self.meta)
+        self.downloaded = True
+        # logging.info(f"File Downloaded: {self.store_path}")
+        renderer.log(f"File Downloaded: '{self.store_path}'")
+        if call_back:
+            call_back(cursize=self.fetched_length)
+
+    @property
+    def host(self) -> str:
+        """
+        Host the file is read from, after redirects
+        """
+        return get_host(self.meta.final_url or self.url)
+
+    def add_fetched(self, length: int) -> None:
+        self.fetched_length += length
+
+    def link_from_store(self, call_back: Callable = None) -> bool:
+        """
+        Materialise the target from the object store when this version is in it
         """
-        auto-resumes up to self.retries
+        if self.store is None:
+            return False
+        digest = self.store.lookup(self.meta)
+        if digest is None:
+            return False
+        try:
+            self.store.materialise(digest=digest, path=self.store_path)
+        except Exception as e:
+            logging.warning(f"Error! Unable to link from object store: {e}")
+            return False
+        self.meta.record_local(local_path=self.store_path, digest=digest)
+        self.fetched_length = self.get_local_file_size(assign_to_attribute=False)
+        self.downloaded = True
+        renderer.log(f"[Status] File Linked from store. {self.store_path}")
+        if call_back:
+            call_back(cursize=self.fetched_length)
+        return True
+
+    def flush_journal(self) -> None:
         """
-        if self.retry_limit > self.retry_num:
-            self.retry_num += 1
-            if self.get_local_file_size() != self.content_length:
-                self.resume()
+        Record the flushed length of the stream, at most twice a sec
+        """
+        if (
+            self.content_length == -1
+            or self.encoded
+            or time() - self.journal_time < 0.5
+        ):
+            return
+        self.journal_time = time()
+        self.save_journal(fetched_length=self.fetched_length)
+
+    def use_segments(self) -> bool:
+        """
+        Whether the target is large enough, and rangeable, to be fetched in segments
+        """
+        return (
+            self.request_type == request_method.GET
+            and self.segment_count is not None
+            and self.segment_count > 1
+            and self.segment_threshold is not None
+            and self.content_length > self.segment_threshold
+            and self.content_length >= 2 * segment_min_size
+            and (self.meta.accept_ranges or "").lower() != "none"
+        )
+
+    def __download_segments(
+        self, params: Dict, call_back: Callable = None, journal: Dict = None
+    ) -> bool:
+        """
+        Fetch the target as concurrent byte ranges written at their offsets
+
+        Ranges recorded in the journal continue from their fetched length.
+        Return False, leaving the file to the single stream, when the server
+        ignores the Range header
+
+        The ranges arrive out of order, so the file is hashed from the page
+        cache behind the contiguous written prefix while they download
+        """
+        if journal is not None and "segments" in journal:
+            ranges = journal["segments"]
         else:
-            raise ConnectionError(
-                "Error! Maximum Number of Retry Reached! Unable to Download Target File!"
+            count = min(self.segment_count, self.content_length // segment_min_size)
+            segment_size = int(ceil(self.content_length / count))
+            ranges = [
+                [
+                    range_start,
+                    min(range_start + segment_size, self.content_length) - 1,
+                    0,
+                ]
+                for range_start in range(0, self.content_length, segment_size)
+            ]
+            with open(self.part_path, "wb") as file_obj:
+                if self.preallocate:
+                    preallocate_file(file_obj, self.content_length)
+                else:
+                    file_obj.truncate(self.content_length)
+
+        self.abort_signal.clear()
+        segments = []
+        for range_start, range_end, fetched_length in ranges:
+            curr_segment = segment(
+                parent=self,
+                params=params,
+                range_start=range_start,
+                range_end=range_end,
             )
+            curr_segment.fetched_length = fetched_length
+            curr_segment.flushed_length = fetched_length
+            segments.append(curr_segment)
+        for curr_segment in segments:
+            curr_segment.start()
 
-    def __download_file(
-        self, url_obj: Response, file_obj: BufferedReader, call_back: Callable = None
-    ):
+        hasher = hashlib.sha256()
+        hashed_length = 0
+        while any(curr_segment.is_alive() for curr_segment in segments):
+            for curr_segment in segments:
+                curr_segment.join(0.5)
+            # the journal may lag behind the file, never run ahead of it
+            self.save_journal(
+                segments=[
+                    [
+                        curr_segment.range_start,
+                        curr_segment.range_end,
+                        curr_segment.flushed_length,
+                    ]
+                    for curr_segment in segments
+                ]
+            )
+            hashed_length = self.hash_prefix(hasher, hashed_length, segments)
+            self.fetched_length = sum(
+                curr_segment.fetched_length for curr_segment in segments
+            )
+
+        if any(curr_segment.range_ignored for curr_segment in segments):
+            self.discard_part()
+            return False
+        for curr_segment in segments:
+            if curr_segment.error is not None:
+                raise curr_segment.error
+        # verify every range arrived in full before declaring the file complete
+        self.fetched_length = sum(
+            curr_segment.fetched_length for curr_segment in segments
+        )
+        if (
+            self.fetched_length != self.content_length
+            or self.get_local_file_size(
+                assign_to_attribute=False, filename=self.part_path
+            )
+            != self.content_length
+        ):
+            raise retryable_error(
+                f"Error! Segmented download is incomplete! {self.fetched_length}/{self.content_length} bytes fetched."
+            )
+        self.hash_prefix(hasher, hashed_length, segments)
+        self.finalize_part(call_back=call_back, digest=hasher.hexdigest())
+        return True
+
+    def hash_prefix(self, hasher: Any, hashed_length: int, segments: List) -> int:
+        """
+        Feed the written bytes from hashed_length up to the first gap into hasher
+        """
+        prefix_length = 0
+        for curr_segment in segments:
+            prefix_length = curr_segment.range_start + curr_segment.flushed_length
+            if curr_segment.flushed_length < curr_segment.length:
+                break
+        if prefix_length > hashed_length:
+            hash_file(
+                self.part_path,
+                hasher=hasher,
+                length=prefix_length - hashed_length,
+                offset=hashed_length,
+            )
+        return max(hashed_length, prefix_length)
+
+    def __download_file(self, url_obj: Response, file_obj: BufferedIOBase):
         """
         Starts the download loop
         """
-        try:
-            print()
-            for chunk in url_obj.iter_content(chunk_size=8192):
-                try:
-                    # filter out keep-alive new chunks
-                    if not chunk:
-                        continue
-                    file_obj.write(chunk)
-                    self.fetched_length += len(chunk)
-
-                    print_out, ending = progress_bar(
-                        current=self.fetched_length,
-                        total=self.content_length,
-                        string_in_front=f"Extracting File: {self.file_name:>30}",
-                    )
-                    print(print_out, end=ending)
-                except Exception:
-                    traceback.print_exc()
-                    self.__retry()
-            file_obj.close()
-            self.downloaded = True
-            # logging.info(f"File Downloaded: {self.store_path}")
-            if self.content_length == -1:
-                print()
-            # cleanup_prev_line(1)
-            print(f"File Downloaded: '{self.store_path}'")
-            if call_back:
-                call_back(cursize=self.fetched_length)
-            print()
+        read_stream(
+            res_obj=url_obj,
+            file_obj=file_obj,
+            on_read=self.add_fetched,
+            on_flush=self.flush_journal,
+            limiter=bandwidth,
+            host=self.host,
+            hasher=self.hasher,
+        )
+        file_obj.close()
+        # cleanup_prev_line(1)
+        return True
 
-        except Exception:
-            traceback.print_exc()
+    def check_local(self, call_back: Callable = None) -> bool:
+        """
+        Return the result of the download when the target needs no fetching,
+        None when it does
+
+        The local copy is current or linked from the object store (True), or
+        the target is too small to be the file (False)
+        """
+        local_size = self.get_local_file_size()
+        if self.meta.is_local_current(
+            local_path=self.store_path,
+            local_size=local_size,
+            content_length=self.content_length,
+        ):
+            renderer.log(f"[Status] File Exist, no need to download. {self.store_path}")
+            return True
+        if self.link_from_store(call_back=call_back):
+            return True
+        if self.threshold is not None and self.content_length < self.threshold:
+            renderer.log(
+                f"[Status] File too small, cookie might not be valid, remove existing json to continue "
+            )
+            return False
+        return None
+
+    def load_part(self, resumable: bool = True, segments: bool = True) -> Dict:
+        """
+        Return the journal of the .part file to continue, discarding a part
+        that can not be
+
+        A stream read as the probe (not resumable) starts over, so does a
+        segmented part unless it is fetched in segments again
+        """
+        self.progress = 0
+        self.fetched_length = 0
+        journal = None
+        if resumable:
+            journal = self.load_journal()
+        # ranges of a segmented part are not contiguous
+        if journal is not None and "segments" in journal and not segments:
+            journal = None
+        if journal is None:
+            self.discard_part()
+        else:
+            renderer.log(f"[Status] Resuming interrupted download. {self.store_path}")
+        return journal
+
+    def resume_offset(self, journal: Dict = None) -> int:
+        """
+        Length of the part a single stream continues from
+        """
+        if journal is None or "segments" in journal:
+            return 0
+        # a preallocated part is longer than what has been written to it
+        offset = self.get_local_file_size(
+            assign_to_attribute=False, filename=self.part_path
+        )
+        return min(offset, journal.get("fetched_length", offset))
+
+    def finalize_complete_part(self, offset: int, call_back: Callable = None) -> bool:
+        """
+        Finalize the part when it is already complete, return whether it was
+
+        The run stopped after the last write, before the part was renamed. A
+        range from its end would be answered with a 416
+        """
+        if offset == 0 or offset != self.content_length:
+            return False
+        self.fetched_length = offset
+        self.finalize_part(call_back=call_back)
+        return True
+
+    def range_headers(self, offset: int) -> Dict[str, str]:
+        """
+        Headers continuing the part from offset, unless the file has changed
+        """
+        if offset == 0:
+            return dict()
+        return {
+            "Range": f"bytes={offset}-",
+            "If-Range": self.meta.etag or self.meta.last_modified,
+        }
+
+    def begin_stream(
+        self,
+        status_code: int,
+        reason: str,
+        url: str,
+        headers: Dict[str, str],
+        offset: int,
+    ) -> int:
+        """
+        Check the response of the stream, return the offset it continues the
+        part from
+
+        The part already on disk is hashed once, the rest is fed to
+        self.hasher while it streams
+        """
+        check_status(status_code=status_code, reason=reason, url=url, headers=headers)
+        # a compressed body is decoded on the way, it can not be resumed
+        self.encoded = is_encoded(headers)
+        if offset > 0 and self.encoded and status_code == 206:
+            self.discard_part()
+            raise retryable_error(
+                f"Error! Range of a compressed body received, starting over: {self.url}"
+            )
+        # a full response means the part is stale or ranges are not supported
+        if offset > 0 and status_code != 206:
+            offset = 0
+        if self.content_length != -1 and not self.encoded:
+            self.save_journal(fetched_length=offset)
+        elif self.encoded and os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+
+        self.fetched_length = offset
+        self.hasher = hashlib.sha256()
+        if offset > 0:
+            hash_file(self.part_path, hasher=self.hasher, length=offset)
+        return offset
+
+    def open_part(self, offset: int) -> BufferedIOBase:
+        """
+        Open the .part file at offset, reserving the whole file on a new one
+        """
+        file_obj = open(self.part_path, "r+b" if offset > 0 else "wb")
+        file_obj.seek(offset)
+        if (
+            offset == 0
+            and self.preallocate
+            and self.content_length > 0
+            and not self.encoded
+        ):
+            preallocate_file(file_obj, self.content_length)
+        return file_obj
+
+    def end_stream(
+        self,
+        received_length: int,
+        headers: Dict[str, str],
+        call_back: Callable = None,
+    ) -> None:
+        """
+        Finalize the part once the Content-Length of the stream was received
+
+        received_length is None when the client checked it itself
+        """
+        if (
+            received_length is not None
+            and self.content_length != -1
+            and received_length != self.content_length
+        ):
+            raise retryable_error(
+                f"Error! Download is incomplete! {received_length}/{self.content_length} bytes fetched."
+            )
+        self.finalize_part(
+            call_back=call_back, headers=headers, digest=self.hasher.hexdigest()
+        )
+
+    def give_up(self, error: Exception) -> bool:
+        """
+        Report a download that will not be retried in place
+
+        A retryable error is raised again, so the scheduler can defer the job
+        """
+        logging.warning(f"Error! {error}")
+        if isinstance(error, retryable_error):
+            raise error
+        return False
+
+    def __download_stream(
+        self,
+        params: Dict,
+        res_obj: Response = None,
+        call_back: Callable = None,
+        journal: Dict = None,
+    ) -> bool:
+        """
+        Stream the target into the .part file, continuing a journaled part
+        with an If-Range request
+        """
+        offset = self.resume_offset(journal)
+        if self.finalize_complete_part(offset, call_back=call_back):
+            if res_obj is not None:
+                res_obj.close()
+            return True
+        if res_obj is None:
+            params = params.copy()
+            headers = dict(params.pop("headers", None) or {})
+            headers.update(self.range_headers(offset))
+            res_obj = self.method(stream=True, headers=headers, **params)
+        with res_obj:
+            offset = self.begin_stream(
+                status_code=res_obj.status_code,
+                reason=res_obj.reason,
+                url=res_obj.url,
+                headers=res_obj.headers,
+                offset=offset,
+            )
+            with self.open_part(offset) as file_obj:
+                if not self.__download_file(url_obj=res_obj, file_obj=file_obj):
+                    return False
+            # Content-Length of a compressed body is its encoded length
+            self.end_stream(
+                received_length=(
+                    res_obj.raw.tell() if self.encoded else self.fetched_length
+                ),
+                headers=res_obj.headers,
+                call_back=call_back,
+            )
+        return True
 
     def download(
         self,
@@ -247,57 +1054,64 @@ class downloader:
         """
         Starts the file download
 
-        Reset previous download progress if needed
+        The file is written to '<download_path>.part' and renamed once complete,
+        an interrupted part with a matching journal is resumed. Retryable
+        failures are retried in place with backoff, after the last retry the
+        retryable_error is raised so the scheduler can defer the job
         """
         if download_path != None:
             self.store_path = download_path
+        if params is not None:
+            params.update(self.params)
+        else:
+            params = self.params
+        if self.policy is None:
+            self.policy = retry_policy(retry_limit=self.retry_limit)
 
-        local_size = self.get_local_file_size()
-        if local_size >= self.content_length and self.content_length != -1:
-            print(f"[Status] File Exist, no need to download. {self.store_path}")
-            return True
-        if (
-            self.threshold is not None and self.content_length < self.threshold
-        ) or self.content_length == 170:
-            print(
-                f"[Status] File too small, cookie might not be valid, remove existing json to continue "
-            )
-            return False
-        self.start_loading_thread()
-        self.retry_num = 0
-        self.progress = 0
-        self.fetched_length = 0
         try:
-            if params is not None:
-                params.update(self.params)
-            else:
-                params = self.params
+            return self.policy.call(
+                partial(self.__download_once, params=params, call_back=call_back),
+                url=self.url,
+            )
+        except Exception as e:
+            return self.give_up(e)
+
+    def __download_once(self, params: Dict, call_back: Callable = None) -> bool:
+        res_obj: Response = None
+        if self.content_length is None:
+            res_obj = self.open_stream(params=params)
 
-            with open(self.store_path, "wb") as file_obj:
-                res_obj: Response = self.method(stream=True, **params)
-                self.stop_loading_thread()
-                self.__download_file(
-                    url_obj=res_obj, file_obj=file_obj, call_back=call_back
+        result = self.check_local(call_back=call_back)
+        if result is not None:
+            if res_obj is not None:
+                res_obj.close()
+            return result
+        segmented = res_obj is None and self.use_segments()
+        journal = self.load_part(resumable=res_obj is None, segments=segmented)
+        renderer.register(self)
+        try:
+            # a part written by a single stream is continued by one
+            if segmented and (journal is None or "segments" in journal):
+                if self.__download_segments(
+                    params=params, call_back=call_back, journal=journal
+                ):
+                    return True
+                logging.info(
+                    f"Range requests ignored, falling back to single stream: {self.url}"
                 )
-                return True
-        except Exception as e:
-            self.stop_loading_thread()
-            logging.warning(f"Error! {e}")
-            return False
+                journal = None
+            return self.__download_stream(
+                params=params, res_obj=res_obj, call_back=call_back, journal=journal
+            )
+        finally:
+            renderer.unregister(self, completed=self.downloaded)
 
     def duplicate(self, new_file_path: str):
         if not self.downloaded:
             self.download()
-        local_size = self.get_local_file_size(
-            assign_to_attribute=False, filename=new_file_path
-        )
-        if local_size >= self.content_length and self.content_length != -1:
-            print(f"[Status] File Exist, no need to duplicate. {new_file_path}")
-            return True
         try:
-            with open(self.store_path, "rb") as file_obj:
-                with open(new_file_path, "wb") as new_file_obj:
-                    new_file_obj.write(file_obj.read())
+            # hardlink/reflink where possible, streamed copy otherwise
+            link_file(self.store_path, new_file_path)
             return True
         except Exception as e:
             logging.warning(f"Error! {e}")
@@ -306,47 +1120,18 @@ class downloader:
     def resume(
         self,
         restart: bool = False,
-        method: request_method = request_method.GET,
         params: Dict = None,
         call_back: Callable = None,
     ):
         """
-        Starts the file download
+        Continue an interrupted download from its .part file
 
-        Reset previous download progress if needed
+        Restart from zero when asked to, the part is discarded by download()
+        anyway when the remote file has changed since it was written
         """
-        self.start_loading_thread()
-        self.fetched_length = self.get_local_file_size()
         if restart:
-            return self.download(method=method, params=params)
-        elif self.fetched_length >= self.content_length:
-            logging.warning(
-                "Local File Larger than Cloud File. Potential Error Found, Redownloading..."
-            )
-            return self.download(method=method, params=params)
-        elif self.fetched_length == 0:
-            return self.download(method=method, params=params)
-
-        try:
-            if params is not None:
-                params.update(self.params)
-            else:
-                params = self.params
-
-            with open(self.store_path, "a+b") as file_obj:
-                header = {"Range": f"bytes={self.fetched_length}-{self.content_length}"}
-                res_obj: Response = self.method(
-                    headers=header, stream=True, **self.params
-                )
-                self.stop_loading_thread()
-                self.__download_file(
-                    url_obj=res_obj, file_obj=file_obj, call_back=call_back
-                )
-                return True
-        except Exception as e:
-            self.stop_loading_thread()
-            logging.warning(f"Error! {e}")
-            return False
+            self.discard_part()
+        return self.download(params=params, call_back=call_back)
 
 
 # url = "https://umass.moonami.com/mod/resource/view.php?id=2038785"
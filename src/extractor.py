@@ -1,49 +1,98 @@
 from http.cookies import CookieError
+from threading import Lock
 from time import time
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import urlparse
 
-import requests
-from bs4 import BeautifulSoup, Tag
+from bs4 import BeautifulSoup, SoupStrainer, Tag
 
 from src.container import course_info, item_info, section_info
+from src.fingerprint import fingerprint, matches
 from src.module.folder import fetch_folder_params
 from src.module.lti import fetch_lti_params
+from src.parser import course_page, find_title, folder_page, lti_page, parse_html
+from src.scheduler import download_job, download_scheduler
 from src.utils import (
-    checksum,
-    cleanup_prev_line,
     launch_url,
     mod_type,
     moodle_course_url,
     terminal_cols,
     view_url,
 )
-from src.utils.func import checksum
+from src.utils.func import partial
+from src.utils.params import title_scan_size
+from src.utils.progress import renderer
 
 
 class extractor:
     extract_section_index: int
     container: course_info
+    scheduler: download_scheduler  # runs the detail page fetches concurrently
+    details: List[item_info]  # folder and lti items whose detail page is due
+    lti_lock: Lock  # echo360 info of the course is stored in one json
+    on_section: Callable  # pipelined mode, takes every section once extracted
 
     def __init__(
         self,
         container: course_info,
         extract_section_index: int = -1,
+        scheduler: download_scheduler = None,
+        on_section: Callable = None,
     ) -> None:
         self.container = container
         self.extract_section_index = extract_section_index
+        self.scheduler = scheduler
+        self.details = list()
+        self.lti_lock = Lock()
+        self.on_section = on_section
 
     def check_signin(
-        self, url: str, cookies: Dict, check_title: bool = True
+        self,
+        url: str,
+        cookies: Dict = None,
+        check_title: bool = True,
+        parse_only: SoupStrainer = None,
+    ) -> Tuple[BeautifulSoup, str]:
+        # the course cookie is already attached to the pooled session
+        with self.container.sessions.get(url).get(
+            url, cookies=cookies, stream=True
+        ) as res:
+            chunks = res.iter_content(chunk_size=title_scan_size)
+            head = next(chunks, b"")
+            # a sign in page is told apart before the rest of it is read
+            if check_title and find_title(head) is not None:
+                self.check_title(find_title(head))
+            res_cont = head + b"".join(chunks)
+        return self.parse_page(
+            res_cont=res_cont, check_title=check_title, parse_only=parse_only
+        )
+
+    def parse_page(
+        self,
+        res_cont: bytes | str,
+        check_title: bool = True,
+        parse_only: SoupStrainer = None,
     ) -> Tuple[BeautifulSoup, str]:
-        res = requests.get(url, cookies=cookies)
-        res_cont = res.content.decode(encoding="utf-8")
-        soup = BeautifulSoup(res_cont, "html.parser")
+        """
+        Parse the page with the configured backend, building only the
+        elements parse_only matches. The title is read without parsing
+        """
+        if not check_title:
+            res_title = ""
+        else:
+            if isinstance(res_cont, str):
+                res_cont = res_cont.encode("utf-8")
+            res_title = self.check_title(find_title(res_cont) or "")
+        soup = parse_html(
+            content=res_cont,
+            mode=self.container.config["html_parser"],
+            parse_only=parse_only,
+        )
         # with open("./test/test.html", "w", encoding="utf-8") as f:
         #     f.write(soup.prettify())
-        if not check_title:
-            return soup, ""
+        return soup, res_title
 
-        res_title = soup.find("title").text
+    def check_title(self, res_title: str) -> str:
         if "Sign in" in res_title:
             raise CookieError(
                 "Invalid Cookie! Please login to the Moodle First, and then try to retreive all the contents!\n"
@@ -53,18 +102,18 @@ class extractor:
             raise Exception(
                 "Invalid Course ID! Please check you have entered correct course ID!"
             )
-        return soup, res_title
+        return res_title
 
     def extract_sections(self) -> None:
         soup, page_title = self.check_signin(
             url=moodle_course_url.format(self.container.course_id),
-            cookies=self.container.course_cookie,
+            parse_only=course_page,
         )
         # with open("./test2/html.html", "w", encoding="UTF-8") as f:
         #     f.write(soup.prettify())
 
-        print("#" * int(terminal_cols * 3 / 4))
-        print(f"Retrieving Course: '{page_title.split(':')[1].strip(' ')}'")
+        renderer.log("#" * int(terminal_cols * 3 / 4))
+        renderer.log(f"Retrieving Course: '{page_title.split(':')[1].strip(' ')}'")
 
         # with open ("files/unlogin.html", 'w', encoding='utf-8') as f:
         #     f.write(soup.prettify())
@@ -77,33 +126,44 @@ class extractor:
             section_index = f"section-{index}"
 
             curr_section = None
+            prev_items = None
+            section_fingerprint = fingerprint(section)
             if section_index in self.container.contents:
                 curr_section = self.container.contents[section_index]
             if isinstance(curr_section, section_info):
+                # items of the stored section are reused while unchanged
+                prev_items = curr_section.items
                 if (
-                    curr_section.checksum != checksum(section)
+                    not matches(curr_section.checksum, section, section_fingerprint)
                     or time() >= curr_section.expirey
                 ):
                     curr_section = section_info(
-                        title=section_title, raw_content=section
+                        title=section_title, checksum=section_fingerprint
                     )
                 else:
-                    print(
+                    # replaces a legacy checksum
+                    curr_section.checksum = section_fingerprint
+                    renderer.log(
                         f"[Status] No Modification to Section {index}: {section_title}"
                     )
+                    self.section_done(index, curr_section)
                     continue
             else:
-                curr_section = section_info(title=section_title, raw_content=section)
+                curr_section = section_info(
+                    title=section_title, checksum=section_fingerprint
+                )
 
             if self.extract_section_index != -1 and self.extract_section_index != index:
                 continue
 
-            print("#" * int(terminal_cols / 2))
-            print(f"Retrieving Section {index}: '{section_title}'", end="\r")
+            renderer.log("#" * int(terminal_cols / 2))
+            renderer.status(f"Retrieving Section {index}: '{section_title}'")
 
             section_page_elements = section.find(id=f"collapse-{index}")
 
-            self.extract_section_info(section_page_elements, curr_section)
+            self.extract_section_info(
+                section_page_elements, curr_section, prev_items=prev_items
+            )
             self.container.contents[f"section-{index}"] = curr_section
             if curr_section.items_length > 0:
                 curr_section.update_expirey()
@@ -111,12 +171,16 @@ class extractor:
             else:
                 msg = f"Fail to Retrieved Section {index}: '{section_title}'.\nDetail: Section not containing files."
 
-            cleanup_prev_line()
-            print(msg)
+            renderer.clear_status()
+            renderer.log(msg)
+            self.section_done(index, curr_section)
 
-        print("#" * int(terminal_cols / 2))
-        print("Retrieval Complete! Now Downloading Files...")
-        print("#" * int(terminal_cols * 3 / 4))
+        details, self.details = self.details, list()
+        self.extract_details(details)
+
+        renderer.log("#" * int(terminal_cols / 2))
+        renderer.log("Retrieval Complete! Now Downloading Files...")
+        renderer.log("#" * int(terminal_cols * 3 / 4))
 
         # with open(os.path.join(self.store_dir, 'course_info.json'), "w", encoding="utf-8") as record:
         #     record.write(json.dumps(self.info_dict, indent=4))
@@ -124,7 +188,7 @@ class extractor:
     def extract_folder_info(self, curr_item: item_info) -> None:
         soup, page_title = self.check_signin(
             url=view_url.format(mod_type.folder.name, curr_item.id),
-            cookies=self.container.course_cookie,
+            parse_only=folder_page,
         )
         fetch_folder_params(curr_item=curr_item, soup=soup)
 
@@ -132,15 +196,102 @@ class extractor:
         # reach lti redirect form page
         soup, page_title = self.check_signin(
             url=launch_url.format(mod_type.lti.name, curr_item.id),
-            cookies=self.container.course_cookie,
             check_title=False,
+            parse_only=lti_page,
         )
-        fetch_lti_params(
-            curr_item=curr_item, soup=soup, store_dir=self.container.store_dir
+        self.extract_lti_params(curr_item=curr_item, soup=soup)
+
+    def extract_lti_params(self, curr_item: item_info, soup: BeautifulSoup) -> None:
+        # the pages are fetched concurrently, the echo360 info one at a time
+        with self.lti_lock:
+            fetch_lti_params(
+                curr_item=curr_item,
+                soup=soup,
+                store_dir=self.container.store_dir,
+                sessions=self.container.sessions,
+            )
+
+    def detail_validator(self, curr_item: item_info) -> str:
+        """
+        Validator of the detail of curr_item, the folder post params carry the
+        session key of the login, so the detail is tied to the course cookie
+        """
+        cookie = self.container.course_cookie or dict()
+        return fingerprint(f"{curr_item.checksum}|{sorted(cookie.items())}")
+
+    def extract_detail(self, curr_item: item_info) -> None:
+        if curr_item.type == mod_type.folder.name:
+            self.extract_folder_info(curr_item=curr_item)
+        elif curr_item.type == mod_type.lti.name:
+            self.extract_lti_info(curr_item=curr_item)
+        curr_item.update_detail(self.detail_validator(curr_item))
+        self.container.save_item(curr_item)
+
+    def submit_details(
+        self, details: List[item_info], scheduler: download_scheduler
+    ) -> Dict[str, download_job]:
+        """
+        Queue the detail page fetches of the items ahead of the downloads,
+        return the job of every item id
+        """
+        jobs: Dict[str, download_job] = dict()
+        for curr_item in details:
+            jobs[curr_item.id] = scheduler.submit(
+                partial(self.extract_detail, curr_item=curr_item),
+                host=urlparse(curr_item.link).netloc,
+                name=f"Detail {curr_item.title}",
+                priority=0,
+            )
+        return jobs
+
+    def extract_details(self, details: List[item_info]) -> None:
+        """
+        Fetch the detail pages of the items concurrently on the scheduler
+
+        Every job fills the detail of its own item, the first error in item
+        order is raised once all of them are done
+        """
+        if len(details) == 0:
+            return
+        scheduler = self.scheduler
+        if scheduler is None:
+            scheduler = download_scheduler(
+                max_workers=self.container.config["max_workers"],
+                max_workers_per_host=self.container.config["max_workers_per_host"],
+            )
+        jobs = list(self.submit_details(details, scheduler).values())
+        for job in jobs:
+            job.wait()
+        if self.scheduler is None:
+            scheduler.shutdown()
+        for job in jobs:
+            if job.error is not None:
+                raise job.error
+
+    def section_done(self, index: int, curr_section: section_info) -> None:
+        """
+        Save the extracted section. In pipelined mode, hand the section over to on_section, with the jobs
+        fetching the detail pages of its items, so that its downloads start
+        while the next sections are extracted
+        """
+        self.container.save_section(f"section-{index}", curr_section)
+        if self.on_section is None:
+            # the details are fetched together once every section is extracted
+            return
+        details, self.details = self.details, list()
+        if self.extract_section_index != -1 and self.extract_section_index != index:
+            return
+        self.on_section(
+            index=index,
+            section=curr_section,
+            detail_jobs=self.submit_details(details, self.scheduler),
         )
 
     def extract_section_info(
-        self, section_page_elements: Tag, curr_section: section_info
+        self,
+        section_page_elements: Tag,
+        curr_section: section_info,
+        prev_items: Dict[str, item_info] = None,
     ) -> Dict[str, Dict]:
         content: List[Tag] = section_page_elements.find_all("li")
         if len(content) == 0:
@@ -156,30 +307,50 @@ class extractor:
             item_block = elem.find("span", class_="instancename")
             if item_block is None:
                 continue
-            if elem_id in curr_section.items:
-                curr_item = curr_section.items[elem_id]
+            if prev_items is None:
+                prev_items = curr_section.items
+            if elem_id in prev_items:
+                curr_item = prev_items[elem_id]
+            elem_fingerprint = fingerprint(elem)
             if isinstance(curr_item, item_info):
-                if curr_item.checksum != checksum(elem) or time() > curr_item.expirey:
+                unchanged = matches(curr_item.checksum, elem, elem_fingerprint)
+                if unchanged and curr_item.checksum != elem_fingerprint:
+                    # a legacy checksum, the resources and detail of the item
+                    # stay valid under its fingerprint
+                    self.container.resources.rename_revision(
+                        curr_item.checksum, elem_fingerprint
+                    )
+                    detail_current = curr_item.is_detail_current(
+                        self.detail_validator(curr_item)
+                    )
+                    curr_item.checksum = elem_fingerprint
+                    if detail_current:
+                        curr_item.detail_validator = self.detail_validator(curr_item)
+                if not unchanged or time() > curr_item.expirey:
+                    prev_item = curr_item
                     curr_item = item_info(
                         id=elem_id,
                         title=elem.find("span", class_="instancename").contents[0].text,
                         type=curr_type,
                         link=view_url.format(curr_type, elem_id),
-                        raw_content=elem,
+                        checksum=elem_fingerprint,
                     )
+                    # the detail has an expirey of its own
+                    curr_item.keep_detail(prev_item)
             else:
                 curr_item = item_info(
                     id=elem_id,
                     title=elem.find("span", class_="instancename").contents[0].text,
                     type=curr_type,
                     link=view_url.format(curr_type, elem_id),
-                    raw_content=elem,
+                    checksum=elem_fingerprint,
                 )
 
-            if curr_item.type == mod_type.folder.name:
-                self.extract_folder_info(curr_item=curr_item)
-            elif curr_item.type == mod_type.lti.name:
-                self.extract_lti_info(curr_item=curr_item)
+            if curr_item.type in [
+                mod_type.folder.name,
+                mod_type.lti.name,
+            ] and not curr_item.is_detail_current(self.detail_validator(curr_item)):
+                self.details.append(curr_item)
 
             # check if there is a text to describe the link/content
             activity_instance = elem.find("div", class_="activityinstance")
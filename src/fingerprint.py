@@ -0,0 +1,91 @@
+import re
+from hashlib import blake2b
+
+from bs4 import Comment, NavigableString, Tag
+
+from src.utils.func import checksum
+
+# inputs whose value changes on every request (session key, lti oauth nonce)
+volatile_inputs = ["sesskey", "oauth_nonce", "oauth_timestamp", "oauth_signature"]
+
+# completion toggles and status, they change when the student marks an activity
+volatile_classes = ["togglecompletion", "completion-info", "autocompletion"]
+
+# ids generated by the moodle javascript on every render
+volatile_id = re.compile(r"^yui_")
+
+sesskey_param = re.compile(r"([?&])sesskey=[^&#]*&?")
+
+
+def is_volatile(node: Tag) -> bool:
+    if node.name == "input" and node.get("name") in volatile_inputs:
+        return True
+    if node.name == "form" and "togglecompletion" in node.get("action", ""):
+        return True
+    return any(name in volatile_classes for name in node.get("class", []))
+
+
+def normalise_attrs(node: Tag) -> str:
+    attrs = []
+    for name, value in sorted(node.attrs.items()):
+        if isinstance(value, list):
+            value = " ".join(value)
+        if name == "id" and volatile_id.match(value):
+            continue
+        if "sesskey=" in value:
+            value = sesskey_param.sub(r"\1", value)
+        attrs.append(f" {name}={value}")
+    return "".join(attrs)
+
+
+def fingerprint(fragment: Tag | str | bytes) -> str:
+    """
+    BLAKE2b digest of a normalised html fragment
+
+    Whitespace, attribute order, comments and volatile markup (session keys,
+    completion toggles, generated ids) do not change the fingerprint, any
+    other change of the content or its order does
+    """
+    hasher = blake2b(digest_size=16)
+    if isinstance(fragment, str):
+        fragment = fragment.encode("utf-8")
+    if isinstance(fragment, bytes):
+        hasher.update(fragment)
+        return hasher.hexdigest()
+
+    stack = [fragment]
+    while len(stack) > 0:
+        node = stack.pop()
+        if node is None:
+            hasher.update(b"</>")
+        elif isinstance(node, NavigableString):
+            if isinstance(node, Comment):
+                continue
+            text = " ".join(node.split())
+            if text != "":
+                hasher.update(text.encode("utf-8"))
+                hasher.update(b"\0")
+        elif not is_volatile(node):
+            hasher.update(f"<{node.name}{normalise_attrs(node)}>".encode("utf-8"))
+            stack.append(None)
+            stack.extend(reversed(node.contents))
+    return hasher.hexdigest()
+
+
+def is_legacy(value: str) -> bool:
+    """
+    Whether value is a checksum stored before fingerprints replaced them
+    """
+    return value is not None and len(value) == 8 and value.isdigit()
+
+
+def matches(value: str, fragment: Tag, fragment_fingerprint: str) -> bool:
+    """
+    Whether fragment is unchanged since value was recorded
+
+    A legacy checksum is compared the old way, so a course stored before the
+    fingerprints is migrated without treating every item as modified
+    """
+    if is_legacy(value):
+        return value == checksum(fragment)
+    return value == fragment_fingerprint
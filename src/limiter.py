@@ -0,0 +1,180 @@
+import logging
+import os
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+from typing import Dict
+
+from src.utils.func import load_config
+from src.utils.params import bandwidth_burst_time, bandwidth_quantum, config_path
+
+
+class token_bucket:
+    """
+    Token bucket refilled with rate bytes per sec, holding at most one burst
+
+    Takes are reservations: the tokens are taken at once and the caller sleeps
+    off the debt, so concurrent callers are served in the order they came.
+    """
+
+    rate: float
+    capacity: float
+    tokens: float
+    last_time: float
+    lock: Lock
+
+    def __init__(self, rate: int) -> None:
+        self.lock = Lock()
+        self.tokens = 0
+        self.last_time = monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate: int) -> None:
+        with self.lock:
+            self.rate = float(rate)
+            self.capacity = max(bandwidth_quantum, self.rate * bandwidth_burst_time)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def reserve(self, amount: int) -> float:
+        """
+        Take amount tokens, return how long to wait until they are covered
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.last_time) * self.rate
+            )
+            self.last_time = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+
+class bandwidth_limiter:
+    """
+    Bandwidth limit shared by every transfer, globally and per host
+
+    A host limit configured for "echo360.org" also applies to its subdomains.
+    While limited, every transfer reads at most bandwidth_quantum bytes per
+    reservation, so one large video can not starve the small files. With no
+    limit set, enabled is False and the download loop skips the limiter.
+    """
+
+    enabled: bool
+    global_bucket: token_bucket
+    host_buckets: Dict[str, token_bucket]
+    resolved: Dict[str, token_bucket]  # host -> matched host bucket, or None
+    lock: Lock
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.global_bucket = None
+        self.host_buckets = dict()
+        self.resolved = dict()
+        self.lock = Lock()
+
+    def set_limit(self, rate: int, host: str = None) -> None:
+        """
+        Limit host, or every transfer when host is None, to rate bytes per sec
+
+        A rate of 0 removes the limit. Takes effect on running transfers.
+        """
+        with self.lock:
+            if host is None:
+                if rate <= 0:
+                    self.global_bucket = None
+                elif self.global_bucket is None:
+                    self.global_bucket = token_bucket(rate)
+                else:
+                    self.global_bucket.set_rate(rate)
+            else:
+                host = host.lower()
+                if rate <= 0:
+                    self.host_buckets.pop(host, None)
+                elif host not in self.host_buckets:
+                    self.host_buckets[host] = token_bucket(rate)
+                else:
+                    self.host_buckets[host].set_rate(rate)
+                self.resolved = dict()
+            self.enabled = self.global_bucket is not None or len(self.host_buckets) > 0
+
+    def load(self, config: Dict) -> None:
+        """
+        Apply bandwidth_limit and host_bandwidth_limit of the config
+        """
+        self.set_limit(config["bandwidth_limit"])
+        host_limits = config["host_bandwidth_limit"]
+        for host in list(self.host_buckets.keys()):
+            if host not in host_limits:
+                self.set_limit(0, host=host)
+        for host, rate in host_limits.items():
+            self.set_limit(rate, host=host)
+
+    def get_host_bucket(self, host: str) -> token_bucket:
+        if host in self.resolved:
+            return self.resolved[host]
+        bucket = None
+        with self.lock:
+            name = host.split(":")[0].lower()
+            for limited_host, limited_bucket in self.host_buckets.items():
+                if name == limited_host or name.endswith("." + limited_host):
+                    bucket = limited_bucket
+                    break
+            self.resolved[host] = bucket
+        return bucket
+
+    def reserve(self, host: str, amount: int) -> float:
+        """
+        Reserve amount bytes read from host, return the secs to wait for them
+        """
+        wait = 0
+        global_bucket = self.global_bucket
+        if global_bucket is not None:
+            wait = global_bucket.reserve(amount)
+        host_bucket = self.get_host_bucket(host) if host is not None else None
+        if host_bucket is not None:
+            wait = max(wait, host_bucket.reserve(amount))
+        return wait
+
+    def consume(self, host: str, amount: int) -> None:
+        """
+        Block until amount bytes read from host fit within the limits
+        """
+        wait = self.reserve(host, amount)
+        if wait > 0:
+            sleep(wait)
+
+
+class config_watcher(Thread):
+    """
+    Reapply the bandwidth limits whenever the config file is modified
+    """
+
+    limiter: bandwidth_limiter
+    exit_signal: Event
+    interval: float
+
+    def __init__(self, limiter: bandwidth_limiter, interval: float = 2.0) -> None:
+        self.limiter = limiter
+        self.exit_signal = Event()
+        self.interval = interval
+        Thread.__init__(self=self)
+        self.daemon = True
+
+    def stop(self) -> None:
+        self.exit_signal.set()
+
+    def run(self) -> None:
+        last_modified = os.path.getmtime(config_path)
+        while not self.exit_signal.wait(self.interval):
+            try:
+                modified = os.path.getmtime(config_path)
+                if modified == last_modified:
+                    continue
+                last_modified = modified
+                self.limiter.load(load_config())
+            except Exception as e:
+                logging.warning(f"Error! Unable to reload bandwidth limits: {e}")
+
+
+bandwidth = bandwidth_limiter()
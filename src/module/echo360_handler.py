@@ -6,6 +6,7 @@ import json
 import os
 from pathlib import PurePosixPath
 from queue import Queue
+from threading import Lock
 from time import sleep, time
 from typing import Callable, Dict, List, Tuple
 from urllib.parse import unquote, urlparse
@@ -36,6 +37,12 @@ class Echo360Extractor:
     is_start_page_lesson: bool
     no_need_to_fetch_new: bool
 
+    # while sharing, one headless chrome serves the extractors of every course,
+    # they take turns on it through driver_lock
+    share_driver: bool = False
+    shared_driver: WebDriverClass = None
+    driver_lock: Lock = Lock()
+
     def __init__(self, json_store_path: str = "./echo360.json"):
         self.json_store_path = json_store_path
         self.driver = None
@@ -77,14 +84,16 @@ class Echo360Extractor:
             self.video_info["general"] = general_info
             f.write(json.dumps(self.video_info, indent=4))
 
-    def setup(self, redirect_url: str, cookie: Dict) -> None:
+    def setup(
+        self, redirect_url: str, cookie: Dict, session: requests.Session = None
+    ) -> None:
         self.no_need_to_fetch_new = self.check_existed_file()
         self.display_message(
             message=f"[Status] Need to Fetch Info: {not self.no_need_to_fetch_new}"
         )
         if self.no_need_to_fetch_new:
             return
-        self.fetch_echo360(redirect_url, cookie)
+        self.fetch_echo360(redirect_url, cookie, session)
         self.setup_driver()
         self.fix_course_url_id()
 
@@ -174,10 +183,13 @@ class Echo360Extractor:
             return ""
         return components[index]
 
-    def fetch_echo360(self, target_url: str, data: Dict) -> None:
+    def fetch_echo360(
+        self, target_url: str, data: Dict, session: requests.Session = None
+    ) -> None:
         self.display_message(message="[Ongoing] Echo360 Course Page")
+        requester = requests if session is None else session
         # fetch echo360 course url
-        tmp = requests.post(url=target_url, data=data, allow_redirects=True)
+        tmp = requester.post(url=target_url, data=data, allow_redirects=True)
         self.course_url = tmp.request.url
 
         # retreive valid cookie from tmp request
@@ -229,12 +241,17 @@ class Echo360Extractor:
             self.display_message(message=f"[Error] WebDriver has already set!")
             return False
 
-        # not show the test instance of browser
-        options = webdriver.ChromeOptions()
-        options.add_argument("--headless")
-        options.add_argument("--log-level=3")
-        # init webdriver
-        self.driver = webdriver.Chrome(options=options)
+        if Echo360Extractor.share_driver and Echo360Extractor.shared_driver is not None:
+            self.driver = Echo360Extractor.shared_driver
+        else:
+            # not show the test instance of browser
+            options = webdriver.ChromeOptions()
+            options.add_argument("--headless")
+            options.add_argument("--log-level=3")
+            # init webdriver
+            self.driver = webdriver.Chrome(options=options)
+            if Echo360Extractor.share_driver:
+                Echo360Extractor.shared_driver = self.driver
         # access echo360 for webdriver identify the pattern of cookie
         self.driver.get(self.base_url)
         # delete the current un-login cookies
@@ -395,6 +412,21 @@ class Echo360Extractor:
             message=f"[Finished] Fetching Video Info for course {self.course_id}"
         )
 
+    @classmethod
+    def start_sharing(cls) -> None:
+        """
+        Reuse one webdriver for every extractor until stop_sharing
+        """
+        cls.share_driver = True
+
+    @classmethod
+    def stop_sharing(cls) -> None:
+        with cls.driver_lock:
+            cls.share_driver = False
+            if cls.shared_driver is not None:
+                cls.shared_driver.quit()
+                cls.shared_driver = None
+
     @classmethod
     def from_json(cls, input_json: Dict) -> "Echo360Extractor":
         new_extractor = Echo360Extractor(input_json["echo360-course-store-path"])
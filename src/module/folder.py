@@ -4,8 +4,9 @@ from bs4 import BeautifulSoup, Tag
 
 from src.container import item_info
 from src.downloader import downloader
+from src.fingerprint import fingerprint
 from src.utils.enums import download_mode, request_method, zip_mode
-from src.utils.func import checksum, unzip_file
+from src.utils.func import unzip_file
 from src.utils.params import download_folder_url
 
 
@@ -21,7 +22,7 @@ def fetch_folder_params(curr_item: item_info, soup: BeautifulSoup) -> None:
             post_params[input["name"]] = input["value"]
         curr_item.detail["post_params"] = post_params
         if "checksum" not in curr_item.detail:
-            curr_item.detail["checksum"] = checksum(file_section)
+            curr_item.detail["checksum"] = fingerprint(file_section)
 
 
 def construct_folder(
@@ -39,13 +40,18 @@ def construct_folder(
         params={"data": target.detail["post_params"]},
         suppress_url_file_check=True,
         url_filename=info_param["url_filename"],
+        session=info_param["sessions"].get(download_folder_url),
+        meta=info_param["resources"].get(
+            f"{download_folder_url}?id={target.id}", revision=target.checksum
+        ),
     )
     info_param["url_file_extension"] = "zip"
 
-    file_paths = callback(curr_downloader=the_downloader)
-
-    if mode == zip_mode.UNZIP:
-        for file_path in file_paths:
-            unzip_file(target_zip=file_path, unzip_directory=file_path[:-4])
+    def post_process(file_path: str) -> List[str]:
+        if mode != zip_mode.UNZIP:
+            return [file_path]
+        unzip_file(target_zip=file_path, unzip_directory=file_path[:-4])
+        return [file_path[:-4]]
 
+    callback(curr_downloader=the_downloader, post_process=post_process)
     return the_downloader
@@ -1,17 +1,27 @@
 # Side note: I believe lti stands for Learning Tools Interoperability
 import os
 from typing import Callable, Dict
+from urllib.parse import urlparse
 
 from bs4 import BeautifulSoup, Tag
 
-from src.container import item_info
+from src.container import item_info, resource_info
 from src.downloader import downloader
+from src.fingerprint import fingerprint
 from src.module.echo360_handler import Echo360Extractor
+from src.scheduler import download_scheduler
+from src.session import session_pool
 from src.utils.enums import download_mode, video_mode
-from src.utils.func import checksum
+from src.utils.func import partial
+from src.utils.progress import renderer
 
 
-def fetch_lti_params(curr_item: item_info, soup: BeautifulSoup, store_dir: str) -> None:
+def fetch_lti_params(
+    curr_item: item_info,
+    soup: BeautifulSoup,
+    store_dir: str,
+    sessions: session_pool = None,
+) -> None:
     # retreive the form
     form: Tag = soup.find(
         "form",
@@ -20,7 +30,9 @@ def fetch_lti_params(curr_item: item_info, soup: BeautifulSoup, store_dir: str)
     # retreive the target url from form
     lti_url = form["action"]
     if "echo360" not in lti_url:
-        print(f"Only support donwloading echo360 video, but '{lti_url}' received.")
+        renderer.log(
+            f"Only support donwloading echo360 video, but '{lti_url}' received."
+        )
         return
     # retreive the post params from form
     inputs = form.find_all("input")
@@ -29,7 +41,7 @@ def fetch_lti_params(curr_item: item_info, soup: BeautifulSoup, store_dir: str)
         post_params[input["name"]] = input["value"]
     curr_item.detail["post_params"] = post_params
     if "checksum" not in curr_item.detail:
-        curr_item.detail["checksum"] = checksum(form)
+        curr_item.detail["checksum"] = fingerprint(form)
 
     if "echo360" in curr_item.detail:
         echo360_extractor = Echo360Extractor.from_json(curr_item.detail["echo360"])
@@ -37,25 +49,53 @@ def fetch_lti_params(curr_item: item_info, soup: BeautifulSoup, store_dir: str)
         echo360_extractor = Echo360Extractor(
             json_store_path=os.path.join(store_dir, "echo360.json")
         )
-    with echo360_extractor:
-        echo360_extractor.setup(redirect_url=lti_url, cookie=post_params)
+    # the webdriver may be shared with the lti items of other courses
+    with Echo360Extractor.driver_lock, echo360_extractor:
+        echo360_extractor.setup(
+            redirect_url=lti_url,
+            cookie=post_params,
+            session=None if sessions is None else sessions.get(lti_url),
+        )
         echo360_extractor.fetch_video_info()
 
     curr_item.detail["echo360"] = echo360_extractor
 
 
+def download_echo360_video(
+    url: str,
+    cookies: Dict[str, str],
+    url_filename: str,
+    callback: Callable,
+    sessions: session_pool = None,
+    meta: resource_info = None,
+) -> downloader:
+    the_downloader = downloader(
+        url=url,
+        cookies=cookies,
+        session=None if sessions is None else sessions.get(url),
+        meta=meta,
+    )
+    callback(
+        curr_downloader=the_downloader,
+        intermediate_folder="Lecture Recordings",
+        url_filename=url_filename,
+    )
+    return the_downloader
+
+
 def construct_echo360(
     target: item_info,
     mode: video_mode,
     info_param: Dict,
     callback: Callable,
     config: Dict = None,
+    scheduler: download_scheduler = None,
 ) -> downloader:
     if config is not None and config["download_mode"] == download_mode.FileOnly:
-        print(f"Ignoring external learning tool type.")
+        renderer.log(f"Ignoring external learning tool type.")
         return
     if "echo360" not in target.detail:
-        print(
+        renderer.log(
             f"Only support donwloading echo360 video for external learning tool type."
         )
         return
@@ -79,6 +119,12 @@ def construct_echo360(
                 "Error! Stored Echo360 Info is not Valid! Please clear all the JSON files to continue!"
             )
 
+    the_downloader = None
+    sessions: session_pool = info_param.get("sessions")
+    if sessions is not None:
+        sessions.attach_cookies(
+            echo360_extractor.video_download_url_head, echo360_extractor.get_cookie()
+        )
     video_sections = echo360_extractor.video_info["videos"]
     for video_section in video_sections:
 
@@ -88,15 +134,27 @@ def construct_echo360(
         videos = video_section["videos"]
         for index, video in enumerate(videos, start=1):
             curr_file_name = info_param["url_filename"] + str(index)
-            the_downloader = downloader(
-                url=echo360_extractor.video_download_url_head + video["download_link"],
-                cookies=echo360_extractor.get_cookie(),
+            video_url = (
+                echo360_extractor.video_download_url_head + video["download_link"]
             )
-            # print(the_downloader.url)
-            file_paths = callback(
-                curr_downloader=the_downloader,
-                intermediate_folder="Lecture Recordings",
+            download_video = partial(
+                download_echo360_video,
+                url=video_url,
+                cookies=echo360_extractor.get_cookie(),
                 url_filename=curr_file_name,
+                callback=partial(callback, info_param=info_param.copy()),
+                sessions=sessions,
+                meta=info_param["resources"].get(video_url),
             )
+            # every recording is a job of its own, so that the lecture videos
+            # of one lti item are downloaded in parallel
+            if scheduler is None:
+                the_downloader = download_video()
+            else:
+                scheduler.submit(
+                    download_video,
+                    host=urlparse(video_url).netloc,
+                    name=curr_file_name,
+                )
 
     return the_downloader
@@ -1,4 +1,5 @@
-from typing import Callable, Dict
+import os
+from typing import Callable, Dict, List
 
 from src.container import item_info
 from src.downloader import downloader
@@ -19,12 +20,16 @@ def construct_page(
         cookies=info_param["cookie"],
         suppress_url_file_check=True,
         url_filename=info_param["url_filename"],
+        session=info_param["sessions"].get(target.link),
+        meta=info_param["resources"].get(target.link, revision=target.checksum),
     )
     info_param["url_file_extension"] = "html"
 
-    file_paths = callback(curr_downloader=the_downloader)
+    def post_process(file_path: str) -> List[str]:
+        if mode != page_mode.PDF:
+            return [file_path]
+        html_to_pdf(html_path=file_path)
+        return [file_path, f"{os.path.splitext(file_path)[0]}.pdf"]
 
-    if mode == page_mode.PDF:
-        for file_path in file_paths:
-            html_to_pdf(html_path=file_path)
+    callback(curr_downloader=the_downloader, post_process=post_process)
     return the_downloader
@@ -7,7 +7,12 @@ from src.downloader import downloader
 def construct_file(
     target: item_info, info_param: Dict, callback: Callable, config: Dict = None
 ) -> downloader:
-    the_downloader = downloader(url=target.link, cookies=info_param["cookie"])
+    the_downloader = downloader(
+        url=target.link,
+        cookies=info_param["cookie"],
+        session=info_param["sessions"].get(target.link),
+        meta=info_param["resources"].get(target.link, revision=target.checksum),
+    )
     info_param["url_filename"] = the_downloader.file_name
     info_param["url_file_extension"] = the_downloader.file_name.split(".")[-1]
 
@@ -0,0 +1,57 @@
+import re
+from html import unescape
+from typing import Dict
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from src.utils.enums import parser_mode
+
+title_pattern = re.compile(rb"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+# bs4 tree builder of every parser_mode
+parser_features: Dict[str, str] = {
+    parser_mode.LXML.name: "lxml",
+    parser_mode.HTML.name: "html.parser",
+}
+
+
+def is_folder_node(name: str, attrs: Dict[str, str]) -> bool:
+    if name == "form":
+        return attrs.get("method", "").lower() == "post"
+    return name == "section" and attrs.get("id") == "region-main"
+
+
+# targeted parsing, only the matched elements and their children are built
+
+# sections of the course page, with their activities
+course_page = SoupStrainer("li", class_="section main clearfix")
+
+# download form and file listing of a folder page
+folder_page = SoupStrainer(is_folder_node)
+
+# launch form of an lti page
+lti_page = SoupStrainer("form", attrs={"id": "ltiLaunchForm"})
+
+
+def find_title(content: bytes) -> str:
+    """
+    Text of the <title> of the page, None when content does not reach it
+    """
+    match = title_pattern.search(content)
+    if match is None:
+        return None
+    return unescape(match.group(1).decode("utf-8", errors="replace"))
+
+
+def parse_html(
+    content: bytes | str,
+    mode: parser_mode = parser_mode.LXML,
+    parse_only: SoupStrainer = None,
+) -> BeautifulSoup:
+    """
+    Parse content with the backend of mode, building only what parse_only matches
+    """
+    params = {"features": parser_features[str(mode)], "parse_only": parse_only}
+    if isinstance(content, bytes):
+        params["from_encoding"] = "utf-8"
+    return BeautifulSoup(content, **params)
@@ -0,0 +1,186 @@
+import logging
+import random
+import socket
+from email.utils import parsedate_to_datetime
+from time import sleep, time
+from typing import Any, Callable, Dict
+
+import requests
+from requests import Response
+from urllib3.exceptions import HTTPError as urllib3_error
+
+# statuses that will not change by asking again
+fatal_status = [400, 401, 403, 404, 410]
+
+
+class retryable_error(ConnectionError):
+    """
+    Transient failure (timeout, dropped connection, 5xx, 429), worth another try
+
+    retry_after is the delay in secs the server asked for, if any
+    """
+
+    retry_after: float
+
+    def __init__(self, message: str, retry_after: float = None) -> None:
+        ConnectionError.__init__(self, message)
+        self.retry_after = retry_after
+
+
+class fatal_error(ConnectionError):
+    """
+    Failure that another try will not fix (auth, not found, bad content)
+    """
+
+
+def parse_retry_after(value: str) -> float:
+    """
+    Retry-After is either a num of secs or an HTTP date
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except Exception:
+        return None
+
+
+def check_status(
+    status_code: int,
+    reason: str,
+    url: str,
+    headers: Dict[str, str],
+    strict: bool = True,
+) -> None:
+    """
+    Raise the classified error of a failed status
+
+    Unless strict, statuses that are neither transient nor in fatal_status
+    (e.g. 405 for a HEAD request) are let through to the caller
+    """
+    if status_code < 400:
+        return
+    message = f"Error! {status_code} {reason} from '{url}'"
+    if status_code == 429 or status_code >= 500:
+        raise retryable_error(
+            message, retry_after=parse_retry_after(headers.get("Retry-After"))
+        )
+    if strict or status_code in fatal_status:
+        raise fatal_error(message)
+
+
+def check_response(res: Response, strict: bool = True) -> None:
+    """
+    Raise the classified error of a failed response
+    """
+    check_status(
+        status_code=res.status_code,
+        reason=res.reason,
+        url=res.url,
+        headers=res.headers,
+        strict=strict,
+    )
+
+
+def classify(error: Exception) -> Exception:
+    """
+    Return error as a retryable_error or a fatal_error
+    """
+    if isinstance(error, (retryable_error, fatal_error)):
+        return error
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        try:
+            check_response(error.response)
+        except (retryable_error, fatal_error) as classified:
+            return classified
+    if isinstance(
+        error,
+        (
+            requests.Timeout,
+            requests.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+            urllib3_error,
+            socket.timeout,
+            TimeoutError,
+            ConnectionError,
+        ),
+    ):
+        return retryable_error(str(error))
+    return fatal_error(str(error))
+
+
+class retry_policy:
+    """
+    Exponential backoff with jitter
+
+    Try n waits a random time between half and all of
+    min(max_delay, base_delay * 2^n), or as long as the server asked for
+    """
+
+    retry_limit: int  # num of retries after the first try
+    base_delay: float
+    max_delay: float
+
+    def __init__(
+        self, retry_limit: int = 3, base_delay: float = 1.0, max_delay: float = 30.0
+    ) -> None:
+        self.retry_limit = retry_limit
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, config: dict) -> "retry_policy":
+        return cls(
+            retry_limit=config["retry_limit"],
+            base_delay=config["retry_base_delay"],
+            max_delay=config["retry_max_delay"],
+        )
+
+    def delay(self, retry_num: int, retry_after: float = None) -> float:
+        backoff = min(self.max_delay, self.base_delay * (2**retry_num))
+        backoff = random.uniform(backoff / 2, backoff)
+        if retry_after is not None:
+            return max(backoff, min(retry_after, self.max_delay))
+        return backoff
+
+    def should_retry(self, error: Exception, retry_num: int) -> bool:
+        return isinstance(error, retryable_error) and retry_num < self.retry_limit
+
+    def backoff(
+        self,
+        error: Exception,
+        retry_num: int,
+        url: str,
+        classifier: Callable[[Exception], Exception] = classify,
+    ) -> float:
+        """
+        Delay before retrying url after error, the try retry_num went wrong
+
+        Raise the classified error when it is not worth another try
+        """
+        classified = classifier(error)
+        if not self.should_retry(classified, retry_num):
+            if classified is error:
+                raise error
+            raise classified from error
+        delay = self.delay(retry_num, classified.retry_after)
+        logging.info(
+            f"Retry {retry_num + 1}/{self.retry_limit} in {delay:.1f}s: {url}. Detail: {error}"
+        )
+        return delay
+
+    def call(self, func: Callable[[], Any], url: str) -> Any:
+        """
+        Return func(), retrying its transient failures in place with backoff
+        """
+        retry_num = 0
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                sleep(self.backoff(e, retry_num, url))
+                retry_num += 1
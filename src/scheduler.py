@@ -0,0 +1,335 @@
+import logging
+import traceback
+from threading import Condition, Event, Lock, Thread
+from typing import Any, Callable, Dict, List
+
+from src.retry import retryable_error
+
+
+class download_job:
+    """
+    Unit of work accepted by the download scheduler
+    """
+
+    func: Callable
+    host: str  # host the job talks to, used for the per-host limit
+    group: str  # course the job belongs to, used for the per-group limit
+    name: str
+    priority: int  # jobs with lower priority start first
+    done: Event
+    result: Any
+    error: Exception
+    deferred: bool  # failed with a retryable error, run again at the end
+    callbacks: List[Callable]  # called with the job every time it is done
+    lock: Lock
+
+    def __init__(
+        self,
+        func: Callable,
+        host: str = None,
+        name: str = None,
+        priority: int = 1,
+        group: str = None,
+    ) -> None:
+        self.func = func
+        self.host = host
+        self.group = group
+        self.name = name
+        self.priority = priority
+        self.done = Event()
+        self.result = None
+        self.error = None
+        self.deferred = False
+        self.callbacks = list()
+        self.lock = Lock()
+
+    def reset(self) -> None:
+        self.done.clear()
+        self.result = None
+        self.error = None
+        self.deferred = False
+
+    def run(self) -> None:
+        try:
+            self.result = self.func()
+        except retryable_error as e:
+            self.error = e
+            self.deferred = True
+            logging.warning(f"Error! Job '{self.name}' deferred. Detail: {e}")
+        except Exception as e:
+            self.error = e
+            traceback.print_exc()
+            logging.warning(f"Error! Job '{self.name}' failed. Detail: {e}")
+        finally:
+            with self.lock:
+                self.done.set()
+                callbacks = list(self.callbacks)
+            for callback in callbacks:
+                self.call(callback)
+
+    def then(self, callback: Callable[["download_job"], None]) -> None:
+        """
+        Call callback with the job once it is done, right away if it already is
+
+        A deferred job calls it again when it is retried
+        """
+        with self.lock:
+            self.callbacks.append(callback)
+            if not self.done.is_set():
+                return
+        self.call(callback)
+
+    def call(self, callback: Callable[["download_job"], None]) -> None:
+        try:
+            callback(self)
+        except Exception as e:
+            traceback.print_exc()
+            logging.warning(f"Error! Callback of job '{self.name}' failed: {e}")
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.done.wait(timeout)
+
+
+class worker(Thread):
+    scheduler: "download_scheduler"
+
+    def __init__(self, scheduler: "download_scheduler") -> None:
+        self.scheduler = scheduler
+        Thread.__init__(self=self)
+        self.daemon = True
+
+    def run(self) -> None:
+        while True:
+            job = self.scheduler.next_job()
+            if job is None:
+                return
+            try:
+                job.run()
+            finally:
+                self.scheduler.finish_job(job)
+
+
+class download_scheduler:
+    """
+    Bounded worker pool for download jobs
+
+    At most max_workers jobs run at once, and at most max_workers_per_host
+    of them talk to the same host. Jobs of a group (one course of a batch)
+    are further limited by the limit set for that group. Jobs are started by
+    priority and then in submission order, skipping over jobs whose host or
+    group is already saturated.
+    """
+
+    max_workers: int
+    max_workers_per_host: int
+    pending: List[download_job]
+    deferred: List[download_job]  # failed with a retryable error
+    running: int
+    host_running: Dict[str, int]
+    group_limits: Dict[str, int]
+    group_running: Dict[str, int]
+    workers: List[worker]
+    condition: Condition
+    closed: bool
+
+    def __init__(self, max_workers: int = 4, max_workers_per_host: int = None) -> None:
+        self.max_workers = max(1, max_workers)
+        self.max_workers_per_host = max_workers_per_host
+        if self.max_workers_per_host is None or self.max_workers_per_host < 1:
+            self.max_workers_per_host = self.max_workers
+        self.pending = list()
+        self.deferred = list()
+        self.running = 0
+        self.host_running = dict()
+        self.group_limits = dict()
+        self.group_running = dict()
+        self.workers = list()
+        self.condition = Condition()
+        self.closed = False
+
+    def __enter__(self) -> "download_scheduler":
+        return self
+
+    def __exit__(self, *args, **kwargs) -> None:
+        self.shutdown()
+
+    def start_workers(self) -> None:
+        while len(self.workers) < self.max_workers:
+            new_worker = worker(self)
+            self.workers.append(new_worker)
+            new_worker.start()
+
+    def submit(
+        self,
+        func: Callable,
+        host: str = None,
+        name: str = None,
+        priority: int = 1,
+        group: str = None,
+    ) -> download_job:
+        job = download_job(
+            func=func, host=host, name=name, priority=priority, group=group
+        )
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Error! Scheduler has been shut down!")
+            self.pending.append(job)
+            self.start_workers()
+            self.condition.notify_all()
+        return job
+
+    def is_host_available(self, host: str) -> bool:
+        if host is None:
+            return True
+        return self.host_running.get(host, 0) < self.max_workers_per_host
+
+    def set_group_limit(self, group: str, max_workers: int = None) -> None:
+        with self.condition:
+            if max_workers is None or max_workers < 1:
+                self.group_limits.pop(group, None)
+            else:
+                self.group_limits[group] = max_workers
+            self.condition.notify_all()
+
+    def is_group_available(self, group: str) -> bool:
+        if group is None or group not in self.group_limits:
+            return True
+        return self.group_running.get(group, 0) < self.group_limits[group]
+
+    def next_job(self) -> download_job:
+        """
+        Block until a runnable job is found, return None once shut down
+        """
+        with self.condition:
+            while True:
+                next_index = None
+                for index, job in enumerate(self.pending):
+                    if not self.is_host_available(job.host):
+                        continue
+                    if not self.is_group_available(job.group):
+                        continue
+                    if (
+                        next_index is None
+                        or job.priority < self.pending[next_index].priority
+                    ):
+                        next_index = index
+                if next_index is not None:
+                    job = self.pending.pop(next_index)
+                    self.running += 1
+                    if job.host is not None:
+                        self.host_running[job.host] = (
+                            self.host_running.get(job.host, 0) + 1
+                        )
+                    if job.group is not None:
+                        self.group_running[job.group] = (
+                            self.group_running.get(job.group, 0) + 1
+                        )
+                    return job
+                if self.closed and len(self.pending) == 0:
+                    return None
+                self.condition.wait()
+
+    def finish_job(self, job: download_job) -> None:
+        with self.condition:
+            self.running -= 1
+            if job.host is not None:
+                self.host_running[job.host] -= 1
+            if job.group is not None:
+                self.group_running[job.group] -= 1
+            if job.deferred:
+                self.deferred.append(job)
+            self.condition.notify_all()
+
+    def is_idle(self, group: str = None) -> bool:
+        if group is None:
+            return len(self.pending) == 0 and self.running == 0
+        return self.group_running.get(group, 0) == 0 and not any(
+            job.group == group for job in self.pending
+        )
+
+    def join(self, group: str = None) -> None:
+        """
+        Wait until every submitted job, including jobs submitted by jobs, is done
+
+        With a group, only the jobs of that group are waited for
+        """
+        with self.condition:
+            while not self.is_idle(group):
+                self.condition.wait()
+
+    def retry_deferred(self, group: str = None) -> int:
+        """
+        Queue the deferred jobs (of group) again, return how many there were
+        """
+        with self.condition:
+            jobs = [job for job in self.deferred if group is None or job.group == group]
+            self.deferred = [job for job in self.deferred if job not in jobs]
+            for job in jobs:
+                job.reset()
+                self.pending.append(job)
+            if len(jobs) > 0:
+                self.start_workers()
+                self.condition.notify_all()
+        return len(jobs)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if wait:
+            self.join()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if wait:
+            for curr_worker in self.workers:
+                curr_worker.join()
+
+
+class job_group:
+    """
+    The jobs of one course on a scheduler shared by several courses
+
+    Has the interface of download_scheduler, but joins and retries only the
+    jobs of the group, so a course can wait for its own downloads while the
+    other courses keep theirs running.
+    """
+
+    scheduler: download_scheduler
+    name: str
+    jobs: List[download_job]
+
+    def __init__(
+        self, scheduler: download_scheduler, name: str, max_workers: int = None
+    ) -> None:
+        self.scheduler = scheduler
+        self.name = name
+        self.jobs = list()
+        self.scheduler.set_group_limit(name, max_workers)
+
+    def __enter__(self) -> "job_group":
+        return self
+
+    def __exit__(self, *args, **kwargs) -> None:
+        self.shutdown()
+
+    @property
+    def deferred(self) -> List[download_job]:
+        return [job for job in self.scheduler.deferred if job.group == self.name]
+
+    def submit(
+        self, func: Callable, host: str = None, name: str = None, priority: int = 1
+    ) -> download_job:
+        job = self.scheduler.submit(
+            func=func, host=host, name=name, priority=priority, group=self.name
+        )
+        self.jobs.append(job)
+        return job
+
+    def join(self) -> None:
+        self.scheduler.join(group=self.name)
+
+    def retry_deferred(self) -> int:
+        return self.scheduler.retry_deferred(group=self.name)
+
+    def shutdown(self, wait: bool = True) -> None:
+        # the workers belong to the shared scheduler
+        if wait:
+            self.join()
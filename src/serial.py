@@ -0,0 +1,31 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    # optional, "pip install orjson" speeds up loading and saving the course state
+    orjson = None
+
+
+def encode(value: Any) -> Any:
+    # the containers, enums and the echo360 extractor serialise themselves
+    return value.to_json()
+
+
+def dumps(value: Any, indent: bool = False) -> bytes:
+    """
+    UTF-8 JSON of value, with orjson when it is installed
+    """
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(value, default=encode, option=option)
+    return json.dumps(
+        value, default=encode, indent=4 if indent else None, ensure_ascii=False
+    ).encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
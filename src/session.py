@@ -0,0 +1,97 @@
+from threading import Lock
+from typing import Dict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def get_host(url: str) -> str:
+    """
+    Return the host of url, accepting bare hosts like "umass.moonami.com"
+    """
+    if "://" not in url:
+        return url.split("/")[0]
+    return urlparse(url).netloc
+
+
+class session_pool:
+    """
+    One keep-alive requests.Session per host
+
+    Every session keeps a connection pool of pool_size connections, so the
+    concurrent downloads against one host reuse their TCP + TLS connections
+    instead of opening a new one for each request.
+    """
+
+    pool_size: int
+    sessions: Dict[str, requests.Session]
+    lock: Lock
+
+    def __init__(self, pool_size: int = 4) -> None:
+        self.pool_size = max(1, pool_size)
+        self.sessions = dict()
+        self.lock = Lock()
+
+    def __enter__(self) -> "session_pool":
+        return self
+
+    def __exit__(self, *args, **kwargs) -> None:
+        self.close()
+
+    def new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get(self, url: str) -> requests.Session:
+        host = get_host(url)
+        with self.lock:
+            if host not in self.sessions:
+                self.sessions[host] = self.new_session()
+            return self.sessions[host]
+
+    def attach_cookies(self, url: str, cookies: Dict[str, str]) -> None:
+        """
+        Attach cookies to the session of the host, scoped to that host only
+        """
+        if cookies is None:
+            return
+        domain = get_host(url).split(":")[0]
+        session = self.get(url)
+        for name, value in cookies.items():
+            session.cookies.set(name, value, domain=domain)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Number of connections opened versus reused, per host
+        """
+        result = dict()
+        with self.lock:
+            sessions = list(self.sessions.items())
+        for host, session in sessions:
+            opened, num_requests = 0, 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    opened += pool.num_connections
+                    num_requests += pool.num_requests
+            result[host] = {
+                "requests": num_requests,
+                "opened": opened,
+                "reused": max(0, num_requests - opened),
+            }
+        return result
+
+    def close(self) -> None:
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
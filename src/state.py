@@ -0,0 +1,269 @@
+import os
+import sqlite3
+from threading import Lock
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+from src.serial import dumps, loads
+
+if TYPE_CHECKING:
+    from src.container import (
+        course_info,
+        item_info,
+        manifest_entry,
+        resource_info,
+        section_info,
+    )
+
+schema = """
+create table if not exists general (
+    key text primary key,
+    value text
+);
+create table if not exists sections (
+    section_id text primary key,
+    position integer,
+    title text,
+    checksum text,
+    expirey real
+);
+create table if not exists items (
+    item_id text primary key,
+    section_id text,
+    position integer,
+    data text
+);
+create index if not exists items_section on items (section_id, position);
+create table if not exists resources (
+    url text primary key,
+    data text
+);
+create table if not exists manifest (
+    item_id text primary key,
+    data text
+);
+"""
+
+insert_item = "insert or replace into items (item_id, section_id, position, data) values (?, ?, ?, ?)"
+
+
+def to_json(value: object) -> str:
+    # same serialisation as course_info.json, without the indent
+    return dumps(value).decode("utf-8")
+
+
+class state_store:
+    """
+    Course state in SQLite, updated row by row while the course syncs
+
+    The database runs in WAL mode, so a write commits without rewriting the
+    rest of the state, and a crash loses only the row being written. One
+    connection is shared by the worker threads, every statement runs under
+    the lock.
+    """
+
+    path: str
+    connection: sqlite3.Connection
+    lock: Lock
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.lock = Lock()
+        with self.lock:
+            self.connection.execute("pragma journal_mode=wal")
+            self.connection.execute("pragma synchronous=normal")
+            self.connection.executescript(schema)
+
+    def __enter__(self) -> "state_store":
+        return self
+
+    def __exit__(self, *args, **kwargs) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            row = self.connection.execute("select count(*) from general").fetchone()
+        return row[0] == 0
+
+    def load_general(self) -> Dict:
+        with self.lock:
+            rows = self.connection.execute("select key, value from general").fetchall()
+        return {key: loads(value) for key, value in rows}
+
+    def load_sections(self) -> Dict[str, Dict]:
+        """
+        The sections with their items, in the form of "contents" of course_info.json
+        """
+        with self.lock:
+            section_rows = self.connection.execute(
+                "select section_id, title, checksum, expirey from sections order by position"
+            ).fetchall()
+            item_rows = self.connection.execute(
+                "select section_id, data from items order by section_id, position"
+            ).fetchall()
+        contents = dict()
+        for section_id, title, checksum, expirey in section_rows:
+            contents[section_id] = {
+                "title": title,
+                "checksum": checksum,
+                "expirey": expirey,
+                "items": dict(),
+            }
+        for section_id, data in item_rows:
+            if section_id not in contents:
+                continue
+            item_json = loads(data)
+            contents[section_id]["items"][item_json["id"]] = item_json
+        return contents
+
+    def load_resources(self) -> Dict[str, Dict]:
+        with self.lock:
+            rows = self.connection.execute("select url, data from resources").fetchall()
+        return {url: loads(data) for url, data in rows}
+
+    def load_manifest(self) -> Dict[str, Dict]:
+        with self.lock:
+            rows = self.connection.execute(
+                "select item_id, data from manifest"
+            ).fetchall()
+        return {item_id: loads(data) for item_id, data in rows}
+
+    def upsert_general(self, general: Dict) -> None:
+        with self.lock:
+            self.connection.executemany(
+                "insert into general (key, value) values (?, ?) "
+                + "on conflict (key) do update set value = excluded.value",
+                [(key, to_json(value)) for key, value in general.items()],
+            )
+
+    def upsert_section(
+        self, section_id: str, section: "section_info", position: int = None
+    ) -> None:
+        """
+        Write the section and every item of it, dropping the items it lost
+        """
+        rows = self.item_rows(section_id, section)
+        with self.lock:
+            self.connection.execute("begin")
+            try:
+                self.write_section(section_id, section, position)
+                self.connection.execute(
+                    "delete from items where section_id = ?", (section_id,)
+                )
+                self.connection.executemany(insert_item, rows)
+                self.connection.execute("commit")
+            except Exception:
+                self.connection.execute("rollback")
+                raise
+
+    def item_rows(
+        self, section_id: str, section: "section_info"
+    ) -> List[Tuple[str, str, int, str]]:
+        # serialised before the lock is taken, from the JSON of the items when
+        # the section has not decoded them
+        items = section.to_json()["items"]
+        return [
+            (item_id, section_id, item_index, to_json(curr_item))
+            for item_index, (item_id, curr_item) in enumerate(list(items.items()))
+        ]
+
+    def write_section(
+        self, section_id: str, section: "section_info", position: int = None
+    ) -> None:
+        if position is None:
+            row = self.connection.execute(
+                "select position from sections where section_id = ?", (section_id,)
+            ).fetchone()
+            position = int(section_id.split("-")[-1]) if row is None else row[0]
+        self.connection.execute(
+            "insert into sections (section_id, position, title, checksum, expirey) values (?, ?, ?, ?, ?) "
+            + "on conflict (section_id) do update set position = excluded.position, "
+            + "title = excluded.title, checksum = excluded.checksum, expirey = excluded.expirey",
+            (section_id, position, section.title, section.checksum, section.expirey),
+        )
+
+    def upsert_item(self, curr_item: "item_info") -> None:
+        """
+        Write the item in place, the section it belongs to is kept
+        """
+        data = to_json(curr_item)
+        with self.lock:
+            self.connection.execute(
+                "update items set data = ? where item_id = ?", (data, curr_item.id)
+            )
+
+    def upsert_resource(self, key: str, curr_resource: "resource_info") -> None:
+        data = to_json(curr_resource)
+        with self.lock:
+            self.connection.execute(
+                "insert into resources (url, data) values (?, ?) "
+                + "on conflict (url) do update set data = excluded.data",
+                (key, data),
+            )
+
+    def upsert_manifest(self, curr_entry: "manifest_entry") -> None:
+        data = to_json(curr_entry)
+        with self.lock:
+            self.connection.execute(
+                "insert into manifest (item_id, data) values (?, ?) "
+                + "on conflict (item_id) do update set data = excluded.data",
+                (curr_entry.item_id, data),
+            )
+
+    def delete_manifest(self, item_id: str) -> None:
+        with self.lock:
+            self.connection.execute(
+                "delete from manifest where item_id = ?", (item_id,)
+            )
+
+    def save_course(self, container: "course_info") -> None:
+        """
+        Write the whole course in one transaction
+        """
+        general = [
+            (key, to_json(value))
+            for key, value in container.to_json()["general"].items()
+        ]
+        sections = [
+            (section_id, section, self.item_rows(section_id, section))
+            for section_id, section in list(container.contents.items())
+        ]
+        resources = [
+            (key, to_json(value))
+            for key, value in list(container.resources.resources.items())
+        ]
+        manifest = [
+            (key, to_json(value))
+            for key, value in list(container.manifest.entries.items())
+        ]
+        with self.lock:
+            self.connection.execute("begin")
+            try:
+                self.connection.executemany(
+                    "insert or replace into general (key, value) values (?, ?)", general
+                )
+                self.connection.execute("delete from sections")
+                self.connection.execute("delete from items")
+                for position, (section_id, section, rows) in enumerate(sections):
+                    self.write_section(section_id, section, position)
+                    self.connection.executemany(insert_item, rows)
+                self.connection.executemany(
+                    "insert or replace into resources (url, data) values (?, ?)",
+                    resources,
+                )
+                self.connection.execute("delete from manifest")
+                self.connection.executemany(
+                    "insert into manifest (item_id, data) values (?, ?)", manifest
+                )
+                self.connection.execute("commit")
+            except Exception:
+                self.connection.execute("rollback")
+                raise
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+from threading import Lock
+from typing import Dict, List
+
+from src.container import resource_info
+from src.session import get_host
+from src.utils.func import link_file
+from src.utils.params import object_store_dir
+
+
+class object_store:
+    """
+    Content-addressed store of downloaded files, keyed by their SHA-256
+
+    Every downloaded file is linked into objects/<digest[:2]>/<digest>, so
+    the same content is kept once on disk however often it is linked. The
+    index maps (site, resource url, validators) to the digest, a resource
+    seen before with the same validators is linked from the store instead
+    of downloaded. Courses stored under the same root share one store.
+    """
+
+    root: str
+    index_path: str
+    index: Dict[str, str]
+    modified: bool
+    lock: Lock
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.index_path = os.path.join(root, "index.json")
+        self.index = self.load_index()
+        self.modified = False
+        self.lock = Lock()
+
+    def load_index(self) -> Dict[str, str]:
+        if not os.path.isfile(self.index_path):
+            return dict()
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as index_file:
+                return json.load(index_file)
+        except Exception as e:
+            logging.warning(f"Error! Unable to read object store index: {e}")
+            return dict()
+
+    def save(self) -> None:
+        """
+        Merge the index into the one on disk, another run may have added to it
+        """
+        with self.lock:
+            if not self.modified:
+                return
+            index = self.load_index()
+            index.update(self.index)
+            self.index = index
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as index_file:
+                index_file.write(json.dumps(self.index))
+            os.replace(tmp_path, self.index_path)
+            self.modified = False
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def keys(self, meta: resource_info) -> List[str]:
+        """
+        Index keys of the resource, none when it has no validator to trust
+        """
+        if meta.etag is None and meta.last_modified is None:
+            return []
+        validators = f"{meta.etag}|{meta.last_modified}|{meta.content_length}"
+        urls = [meta.url]
+        if meta.final_url is not None and meta.final_url != meta.url:
+            urls.append(meta.final_url)
+        return [f"{get_host(url)}|{url}|{validators}" for url in urls]
+
+    def lookup(self, meta: resource_info) -> str:
+        """
+        Digest of the stored copy of this version of the resource, if any
+        """
+        for key in self.keys(meta):
+            digest = self.index.get(key)
+            if digest is None:
+                continue
+            object_path = self.object_path(digest)
+            if not os.path.isfile(object_path):
+                continue
+            if (
+                meta.content_length is not None
+                and os.path.getsize(object_path) != meta.content_length
+            ):
+                continue
+            return digest
+        return None
+
+    def add(self, path: str, digest: str, meta: resource_info = None) -> None:
+        """
+        Keep the file at path in the store, or link path to an equal stored object
+        """
+        object_path = self.object_path(digest)
+        try:
+            if os.path.isfile(object_path):
+                link_file(object_path, path)
+            else:
+                link_file(path, object_path)
+        except Exception as e:
+            logging.warning(f"Error! Unable to add '{path}' to object store: {e}")
+            return
+        if meta is None:
+            return
+        with self.lock:
+            for key in self.keys(meta):
+                self.index[key] = digest
+                self.modified = True
+
+    def discard(self, digest: str) -> None:
+        """
+        Drop a corrupt object, index entries pointing to it are ignored after
+        """
+        object_path = self.object_path(digest)
+        if os.path.isfile(object_path):
+            os.remove(object_path)
+
+    def materialise(self, digest: str, path: str) -> None:
+        link_file(self.object_path(digest), path)
+
+
+stores: Dict[str, object_store] = dict()
+stores_lock = Lock()
+
+
+def get_store(store_dir: str) -> object_store:
+    """
+    Shared object store of every course stored next to store_dir
+    """
+    root = os.path.join(os.path.dirname(os.path.abspath(store_dir)), object_store_dir)
+    with stores_lock:
+        if root not in stores:
+            stores[root] = object_store(root)
+        return stores[root]
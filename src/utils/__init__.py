@@ -12,7 +12,13 @@ from .func import (
     checksum,
     cleanup_prev_line,
     dict_to_str,
+    hash_file,
+    is_html,
+    link_file,
+    link_path,
     load_config,
+    partial,
+    preallocate_file,
     progress_bar,
     slugify,
     unzip_file,
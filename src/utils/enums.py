@@ -28,13 +28,17 @@ class custom_enum(Enum):
 
 class request_method(custom_enum):
     GET = "GET"
+    HEAD = "HEAD"
     POST = "POST"
 
-    def get_req_method(self):
+    def get_req_method(self, session: requests.Session = None):
+        requester = requests if session is None else session
         if self == request_method.GET:
-            return requests.get
+            return requester.get
+        elif self == request_method.HEAD:
+            return requester.head
         elif self == request_method.POST:
-            return requests.post
+            return requester.post
 
 
 class video_mode(custom_enum):
@@ -75,6 +79,26 @@ class mod_type(custom_enum):
     undefined = "undefined"
 
 
+class engine_mode(custom_enum):
+    THREAD = "THREAD"
+    ASYNC = "ASYNC"
+
+
+class extractor_mode(custom_enum):
+    SCRAPE = "SCRAPE"
+    REST = "REST"
+
+
+class parser_mode(custom_enum):
+    LXML = "LXML"
+    HTML = "HTML"
+
+
+class state_mode(custom_enum):
+    JSON = "JSON"
+    SQLITE = "SQLITE"
+
+
 class container_mode(custom_enum):
     create = "create"
     read = "read"
@@ -1,3 +1,4 @@
+import hashlib
 import io
 import logging
 import os
@@ -14,12 +15,16 @@ from xhtml2pdf import pisa
 from src.utils.enums import (
     custom_enum,
     download_mode,
+    engine_mode,
+    extractor_mode,
     file_mode,
     page_mode,
+    parser_mode,
+    state_mode,
     video_mode,
     zip_mode,
 )
-from src.utils.params import config_path, terminal_cols
+from src.utils.params import config_path, terminal_cols, webservice_url
 
 
 def html_to_pdf(html_path: str) -> None:
@@ -90,6 +95,141 @@ def unzip_file(target_zip: str, unzip_directory: str):
         logging.warning(f"Error! {str(e)}")
 
 
+def partial(func, /, *args, **keywords):
+    """
+    Implementation from:
+    https://docs.python.org/3/library/functools.html#functools.partial
+    """
+
+    def newfunc(*fargs, **fkeywords):
+        newkeywords = {**keywords, **fkeywords}
+        return func(*args, *fargs, **newkeywords)
+
+    newfunc.func = func
+    newfunc.args = args
+    newfunc.keywords = keywords
+    return newfunc
+
+
+# ioctl request of linux to clone a file (reflink) on btrfs/xfs
+FICLONE = 0x40049409
+
+
+def _reflink_file(source: str, target: str) -> None:
+    import fcntl
+
+    with open(source, "rb") as source_obj, open(target, "wb") as target_obj:
+        fcntl.ioctl(target_obj.fileno(), FICLONE, source_obj.fileno())
+
+
+def _stream_copy_file(source: str, target: str) -> None:
+    """
+    Copy in kernel space with copy_file_range/sendfile, never buffer the whole file
+    """
+    if not hasattr(os, "copy_file_range"):
+        # shutil uses sendfile on linux and fcopyfile on macos when available
+        shutil.copyfile(source, target)
+        return
+    with open(source, "rb") as source_obj, open(target, "wb") as target_obj:
+        remaining = os.fstat(source_obj.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(
+                source_obj.fileno(), target_obj.fileno(), min(remaining, 1 << 30)
+            )
+            if copied == 0:
+                break
+            remaining -= copied
+    if remaining > 0:
+        shutil.copyfile(source, target)
+
+
+def link_file(source: str, target: str) -> None:
+    """
+    Materialise source at target as a hardlink, a reflink, or a streamed copy
+
+    The target is replaced atomically, an existing link to source is kept
+    """
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return
+    target_dir = os.path.dirname(target)
+    if target_dir != "":
+        os.makedirs(target_dir, exist_ok=True)
+    tmp_target = target + ".link"
+    if os.path.exists(tmp_target):
+        os.remove(tmp_target)
+    for materialise in [os.link, _reflink_file, _stream_copy_file]:
+        try:
+            materialise(source, tmp_target)
+            break
+        except Exception:
+            if os.path.exists(tmp_target):
+                os.remove(tmp_target)
+            if materialise == _stream_copy_file:
+                raise
+    os.replace(tmp_target, target)
+
+
+def link_path(source: str, target: str) -> None:
+    """
+    link_file for a file, or for every file under a directory
+    """
+    if not os.path.isdir(source):
+        return link_file(source, target)
+    for root, dirs, files in os.walk(source):
+        relative_root = os.path.relpath(root, source)
+        os.makedirs(os.path.join(target, relative_root), exist_ok=True)
+        for file in files:
+            link_file(
+                os.path.join(root, file), os.path.join(target, relative_root, file)
+            )
+
+
+def preallocate_file(file_obj: io.BufferedIOBase, length: int) -> None:
+    """
+    Reserve length bytes for file_obj up front, so its blocks are allocated once
+
+    Falls back to a sparse truncate where posix_fallocate is not supported
+    """
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(file_obj.fileno(), 0, length)
+            return
+        except OSError:
+            pass
+    file_obj.truncate(length)
+
+
+def hash_file(
+    path: str, hasher: Any = None, length: int = None, offset: int = 0
+) -> Any:
+    """
+    Feed length bytes (default all) of path from offset into hasher, sha256 by default
+    """
+    if hasher is None:
+        hasher = hashlib.sha256()
+    view = memoryview(bytearray(1024 * 1024))
+    with open(path, "rb") as file_obj:
+        file_obj.seek(offset)
+        remaining = os.fstat(file_obj.fileno()).st_size - offset
+        if length is not None:
+            remaining = min(remaining, length)
+        while remaining > 0:
+            read_size = file_obj.readinto(view[: min(remaining, len(view))])
+            if not read_size:
+                break
+            hasher.update(view[:read_size])
+            remaining -= read_size
+    return hasher
+
+
+def is_html(head: bytes) -> bool:
+    """
+    Whether the first bytes of a file are a web page, like a login or error page
+    """
+    head = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    return head.startswith((b"<!doctype html", b"<html", b"<head", b"<body"))
+
+
 def slugify(value, allow_unicode=False):
     """
     Code copied from https://github.com/django/django/blob/main/django/utils/text.py
@@ -124,6 +264,10 @@ def cleanup_prev_line(num_lines: int = 1) -> None:
 
 
 def checksum(input: str | bytes, num: int = 8) -> str:
+    """
+    Legacy byte sum of the content, only used to migrate stored checksums
+    to src.fingerprint
+    """
     if not isinstance(input, bytes):
         input = input.encode("utf-8")
     sum = 0
@@ -241,6 +385,19 @@ def parse_file_format(value: str) -> str:
     return result
 
 
+def parse_host_limits(value: str) -> Dict[str, int]:
+    """
+    Parse "host:rate,host:rate" into {host: rate}
+    """
+    result = dict()
+    for host_limit in value.split(","):
+        if host_limit.strip() == "":
+            continue
+        host, rate = host_limit.rsplit(":", 1)
+        result[host.strip().lower()] = int(rate)
+    return result
+
+
 def load_config() -> Dict[str, str | int | List]:
     with open(config_path, "r", encoding="utf-8") as config:
         config = config.readlines()
@@ -259,8 +416,33 @@ def load_config() -> Dict[str, str | int | List]:
             value = enum_conversion(value=value, type=page_mode)
         elif tag == "video_mode":
             value = enum_conversion(value=value, type=video_mode)
+        elif tag == "engine":
+            value = enum_conversion(value=value, type=engine_mode)
+        elif tag == "extractor":
+            value = enum_conversion(value=value, type=extractor_mode)
+        elif tag == "state_store":
+            value = enum_conversion(value=value, type=state_mode)
+        elif tag == "html_parser":
+            value = enum_conversion(value=value, type=parser_mode)
         elif tag == "filename_format":
             value = parse_file_format(value=value)
+        elif tag in [
+            "max_workers",
+            "max_workers_per_host",
+            "segment_threshold",
+            "segment_count",
+            "bandwidth_limit",
+            "retry_limit",
+            "deferred_retries",
+            "async_connections",
+            "max_courses",
+            "max_workers_per_course",
+        ]:
+            value = int(value)
+        elif tag in ["retry_base_delay", "retry_max_delay"]:
+            value = float(value)
+        elif tag == "host_bandwidth_limit":
+            value = parse_host_limits(value=value)
         elif value.lower() == "true":
             value = True
         elif value.lower() == "false":
@@ -281,6 +463,56 @@ def load_config() -> Dict[str, str | int | List]:
         result[
             "filename_format"
         ] = "{section_index}-{section_file_index}-{section_title}.{url_file_extension}"
+    if "engine" not in result:
+        result["engine"] = engine_mode.THREAD
+    if "extractor" not in result:
+        result["extractor"] = extractor_mode.SCRAPE
+    if "ws_url" not in result or result["ws_url"] == "":
+        result["ws_url"] = webservice_url
+    if "ws_token" not in result:
+        result["ws_token"] = ""
+    if "html_parser" not in result:
+        result["html_parser"] = parser_mode.LXML
+    if "max_workers" not in result:
+        result["max_workers"] = 4
+    if "max_workers_per_host" not in result:
+        result["max_workers_per_host"] = result["max_workers"]
+    if "state_store" not in result:
+        result["state_store"] = state_mode.JSON
+    if "pipeline" not in result:
+        result["pipeline"] = True
+    if "manifest" not in result:
+        result["manifest"] = True
+    if "reconcile" not in result:
+        result["reconcile"] = False
+    if "restore_edited" not in result:
+        result["restore_edited"] = False
+    if "verify" not in result:
+        result["verify"] = False
+    if "max_courses" not in result:
+        result["max_courses"] = 2
+    if "max_workers_per_course" not in result:
+        result["max_workers_per_course"] = result["max_workers"]
+    if "segment_threshold" not in result:
+        result["segment_threshold"] = 64 * 1024 * 1024
+    if "segment_count" not in result:
+        result["segment_count"] = 4
+    if "preallocate" not in result:
+        result["preallocate"] = True
+    if "bandwidth_limit" not in result:
+        result["bandwidth_limit"] = 0
+    if "host_bandwidth_limit" not in result:
+        result["host_bandwidth_limit"] = dict()
+    if "retry_limit" not in result:
+        result["retry_limit"] = 3
+    if "retry_base_delay" not in result:
+        result["retry_base_delay"] = 1.0
+    if "retry_max_delay" not in result:
+        result["retry_max_delay"] = 30.0
+    if "deferred_retries" not in result:
+        result["deferred_retries"] = 1
+    if "async_connections" not in result:
+        result["async_connections"] = 64
 
     return result
 
@@ -1,10 +1,13 @@
-import os
+import shutil
 
-# width of the terminal can use for printout
-terminal_cols = os.get_terminal_size().columns
+# width of the terminal can use for printout, falls back when not a TTY
+terminal_cols = shutil.get_terminal_size().columns
 
 config_path = ".config"
 
+# content-addressed store shared by the courses stored in the same root
+object_store_dir = ".moodle-store"
+
 # type, id
 view_url = "https://umass.moonami.com/mod/{}/view.php?id={}"
 
@@ -16,9 +19,57 @@ download_folder_url = "https://umass.moonami.com/mod/folder/download_folder.php"
 
 launch_url = "https://umass.moonami.com/mod/{}/launch.php?id={}"
 
+# moodle web services, REST protocol
+webservice_url = "https://umass.moonami.com/webservice/rest/server.php"
+
+# progress renderer redraws this many times per second
+progress_frame_rate = 4
+
+# max num of per-file progress bars shown at once
+progress_max_lines = 8
+
+# download write buffer starts at the min size and doubles while it fills
+# faster than chunk_grow_time, halves when it takes longer than chunk_shrink_time
+chunk_min_size = 64 * 1024
+chunk_max_size = 4 * 1024 * 1024
+chunk_grow_time = 0.1
+chunk_shrink_time = 1.0
+
+# limited transfers reserve bandwidth this many bytes at a time, and a bucket
+# can save up at most bandwidth_burst_time secs of its rate
+bandwidth_quantum = 64 * 1024
+bandwidth_burst_time = 0.25
+
+# the async engine writes a transfer out once this many bytes are buffered
+async_buffer_size = 256 * 1024
+
+# segmented downloads never split a file into ranges smaller than this
+segment_min_size = 8 * 1024 * 1024
 
 # extract info is valid for one day
 modified_expire_time = 60 * 60 * 24
 
+# the title of a fetched page is looked for in its first bytes, to tell a
+# sign in page apart before the rest of it is read
+title_scan_size = 16 * 1024
+
+# detail page info (folder post params) is valid for one day, as long as the
+# item and the login session are unchanged
+detail_expire_time = 60 * 60 * 24
+
+# probed resource metadata is trusted for ten mins, after that it is revalidated
+# with a conditional request
+probe_expire_time = 60 * 10
+
+# config keys left out of the saved course state
+secret_config_keys = ["ws_token"]
+
+# version of the course state layout, the state of earlier versions has none
+state_schema_version = 2
+
+# the local files of an unchanged item are trusted for one day without a request,
+# after that the server is asked again
+manifest_expire_time = 60 * 60 * 24
+
 # video cookie only valid for ten mins
 video_expire_time = 60 * 10
@@ -0,0 +1,183 @@
+import sys
+from threading import Event, Lock, Thread
+from time import time
+from typing import Any, Dict, List
+
+from src.utils.func import cleanup_prev_line, get_unit, progress_bar
+from src.utils.params import progress_frame_rate, progress_max_lines
+
+
+class progress_renderer:
+    """
+    One thread drawing the progress of every active transfer at a fixed frame rate
+
+    A transfer is any object exposing file_name, fetched_length and
+    content_length (-1 when unknown); the renderer samples them, so the
+    download loops never print. Every begin() starts a new drawing thread,
+    joined by end(). When stdout is not a TTY no thread is started and log
+    messages are printed as they come. Anything printed while the thread
+    runs goes through log() or status(), a print of its own would be drawn
+    over.
+    """
+
+    thread: Thread  # None until the first begin()
+    transfers: Dict[int, Any]
+    messages: List[str]
+    lock: Lock
+    exit_signal: Event
+    title: str
+    completed_files: int
+    completed_length: int
+    drawn_lines: int
+    throughput: float
+    last_sample: tuple
+
+    def __init__(self) -> None:
+        self.thread = None
+        self.transfers = dict()
+        self.messages = list()
+        self.lock = Lock()
+        self.exit_signal = Event()
+        self.title = ""
+        self.completed_files = 0
+        self.completed_length = 0
+        self.drawn_lines = 0
+        self.throughput = 0.0
+        self.last_sample = (time(), 0)
+
+    def is_alive(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    @property
+    def is_tty(self) -> bool:
+        return sys.stdout.isatty()
+
+    def begin(self, title: str = "") -> None:
+        with self.lock:
+            self.title = title
+            self.completed_files = 0
+            self.completed_length = 0
+            self.throughput = 0.0
+            self.last_sample = (time(), 0)
+        if self.is_tty and not self.is_alive():
+            # a thread runs once, a new one is started for every course
+            self.exit_signal.clear()
+            self.drawn_lines = 0
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def end(self) -> None:
+        if self.is_alive():
+            self.exit_signal.set()
+            self.thread.join()
+        else:
+            self.flush_messages()
+
+    def register(self, transfer: Any) -> None:
+        with self.lock:
+            self.transfers[id(transfer)] = transfer
+
+    def unregister(self, transfer: Any, completed: bool = True) -> None:
+        with self.lock:
+            if self.transfers.pop(id(transfer), None) is None:
+                return
+            if completed:
+                self.completed_files += 1
+            self.completed_length += max(0, transfer.fetched_length)
+
+    def log(self, message: str = "") -> None:
+        """
+        Print a permanent line above the progress block
+        """
+        if not self.is_alive():
+            print(message)
+            return
+        with self.lock:
+            self.messages.append(message)
+
+    def status(self, message: str) -> None:
+        """
+        Print a line the next one replaces, left out while the progress
+        block is drawn
+        """
+        if not self.is_alive():
+            print(message, end="\r")
+
+    def clear_status(self) -> None:
+        if not self.is_alive():
+            cleanup_prev_line()
+
+    def flush_messages(self) -> None:
+        with self.lock:
+            messages, self.messages = self.messages, list()
+        for message in messages:
+            print(message)
+
+    def render_transfer(self, transfer: Any) -> str:
+        name = f"{transfer.file_name:>30}"[-30:]
+        fetched = max(0, transfer.fetched_length)
+        total = transfer.content_length
+        if total is None or total <= 0 or fetched > total:
+            return f"{name}: {' '.join(get_unit(fetched))}"
+        print_out, _ = progress_bar(current=fetched, total=total, string_in_front=name)
+        return print_out
+
+    def render(self) -> List[str]:
+        with self.lock:
+            transfers = list(self.transfers.values())
+            completed_files = self.completed_files
+            completed_length = self.completed_length
+
+        now = time()
+        fetched = completed_length + sum(
+            max(0, transfer.fetched_length) for transfer in transfers
+        )
+        prev_time, prev_fetched = self.last_sample
+        if now > prev_time:
+            rate = max(0, fetched - prev_fetched) / (now - prev_time)
+            self.throughput = 0.7 * self.throughput + 0.3 * rate
+        self.last_sample = (now, fetched)
+
+        remaining = sum(
+            transfer.content_length - transfer.fetched_length
+            for transfer in transfers
+            if transfer.content_length is not None and transfer.content_length > 0
+        )
+        eta = "--:--"
+        if self.throughput > 0:
+            eta_secs = int(max(0, remaining) / self.throughput)
+            eta = f"{eta_secs // 60:02d}:{eta_secs % 60:02d}"
+
+        lines = [
+            self.render_transfer(transfer)
+            for transfer in transfers[:progress_max_lines]
+        ]
+        if len(transfers) > progress_max_lines:
+            lines.append(f"... and {len(transfers) - progress_max_lines} more")
+        lines.append(
+            f"{self.title} {completed_files} done, {len(transfers)} active | "
+            + "{} {} | {} {}/s | ETA {}".format(
+                *get_unit(fetched), *get_unit(int(self.throughput)), eta
+            )
+        )
+        return lines
+
+    def draw(self, final: bool = False) -> None:
+        lines = [] if final else self.render()
+        with self.lock:
+            messages, self.messages = self.messages, list()
+        # move back over the previous frame and clear it in a single write
+        output = "\033[F\033[K" * self.drawn_lines
+        output += "".join(f"{message}\n" for message in messages)
+        output += "".join(f"\033[K{line}\n" for line in lines)
+        self.drawn_lines = len(lines)
+        sys.stdout.write(output)
+        sys.stdout.flush()
+
+    def run(self) -> None:
+        while not self.exit_signal.wait(1 / progress_frame_rate):
+            self.draw()
+        self.draw(final=True)
+
+
+renderer = progress_renderer()
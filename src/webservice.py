@@ -0,0 +1,246 @@
+import json
+import os
+from http.cookies import CookieError
+from time import time
+from typing import Any, Callable, Dict, List
+
+from src.container import course_info, item_info, section_info
+from src.extractor import extractor
+from src.fingerprint import fingerprint
+from src.parser import parse_html
+from src.retry import check_response
+from src.scheduler import download_scheduler
+from src.utils import mod_type, terminal_cols, view_url
+from src.utils.progress import renderer
+
+# modules without a page of their own, the course page shows them inline
+inline_modules = ["label"]
+
+# fields of a module that change when the student marks it as done
+volatile_fields = ["completiondata"]
+
+# fields of a module file kept in the item detail
+file_fields = ["filename", "filepath", "filesize", "fileurl", "timemodified"]
+
+
+def stable_json(value: Any) -> str:
+    """
+    JSON of a web service value with the volatile fields left out
+    """
+
+    def strip(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {
+                key: strip(sub_value)
+                for key, sub_value in value.items()
+                if key not in volatile_fields
+            }
+        if isinstance(value, list):
+            return [strip(sub_value) for sub_value in value]
+        return value
+
+    return json.dumps(strip(value), sort_keys=True, ensure_ascii=False)
+
+
+class ws_extractor(extractor):
+    """
+    extractor reading the course from the moodle web services (REST) api
+
+    One core_course_get_contents call returns every section and module of
+    the course, the course page is not fetched. The folder and lti detail
+    pages are still fetched, the download form and the launch form are
+    only found there.
+    """
+
+    ws_url: str
+    ws_token: str
+
+    def __init__(
+        self,
+        container: course_info,
+        extract_section_index: int = -1,
+        scheduler: download_scheduler = None,
+        on_section: Callable = None,
+    ) -> None:
+        extractor.__init__(
+            self,
+            container=container,
+            extract_section_index=extract_section_index,
+            scheduler=scheduler,
+            on_section=on_section,
+        )
+        self.ws_url = container.config["ws_url"]
+        self.ws_token = container.config["ws_token"] or os.environ.get(
+            "MOODLE_WS_TOKEN", ""
+        )
+        if self.ws_token == "":
+            raise ValueError(
+                "Error! Missing web service token, set WS_TOKEN in '.config' or the MOODLE_WS_TOKEN environment variable!"
+            )
+
+    def call(self, function: str, **params: Any) -> Any:
+        """
+        Call the web service function, return its decoded JSON result
+        """
+        data = {
+            "wstoken": self.ws_token,
+            "wsfunction": function,
+            "moodlewsrestformat": "json",
+            **params,
+        }
+        with self.container.sessions.get(self.ws_url).post(
+            self.ws_url, data=data
+        ) as res:
+            check_response(res)
+            result = res.json()
+        # errors are answered with 200 and an exception object
+        if isinstance(result, dict) and "exception" in result:
+            if result.get("errorcode") in ["invalidtoken", "accessexception"]:
+                raise CookieError(
+                    f"Invalid Web Service Token! {result.get('message', '')}"
+                )
+            raise Exception(
+                f"Error! Web service '{function}' failed: {result.get('message', result['exception'])}"
+            )
+        return result
+
+    def fetch_course_title(self) -> str:
+        result = self.call(
+            "core_course_get_courses_by_field",
+            field="id",
+            value=self.container.course_id,
+        )
+        courses = result.get("courses", [])
+        if len(courses) == 0:
+            raise Exception(
+                "Invalid Course ID! Please check you have entered correct course ID!"
+            )
+        # same form as the title of the course page
+        return f"Course: {courses[0]['fullname']}"
+
+    def extract_sections(self) -> None:
+        page_title = self.fetch_course_title()
+        sections: List[Dict] = self.call(
+            "core_course_get_contents", courseid=self.container.course_id
+        )
+
+        renderer.log("#" * int(terminal_cols * 3 / 4))
+        renderer.log(f"Retrieving Course: '{page_title.split(':', 1)[1].strip(' ')}'")
+
+        if self.container.course_title != page_title:
+            self.container.course_title = page_title
+        for section in sections:
+            if not section.get("uservisible", True):
+                continue
+            index = section["section"]
+            section_title = section["name"]
+            section_index = f"section-{index}"
+
+            curr_section = None
+            prev_items = None
+            section_fingerprint = fingerprint(stable_json(section))
+            if section_index in self.container.contents:
+                curr_section = self.container.contents[section_index]
+            if isinstance(curr_section, section_info):
+                prev_items = curr_section.items
+                if (
+                    curr_section.checksum != section_fingerprint
+                    or time() >= curr_section.expirey
+                ):
+                    curr_section = section_info(
+                        title=section_title, checksum=section_fingerprint
+                    )
+                else:
+                    renderer.log(
+                        f"[Status] No Modification to Section {index}: {section_title}"
+                    )
+                    self.section_done(index, curr_section)
+                    continue
+            else:
+                curr_section = section_info(
+                    title=section_title, checksum=section_fingerprint
+                )
+
+            if self.extract_section_index != -1 and self.extract_section_index != index:
+                continue
+
+            renderer.log("#" * int(terminal_cols / 2))
+            renderer.status(f"Retrieving Section {index}: '{section_title}'")
+
+            self.extract_modules(
+                section.get("modules", []), curr_section, prev_items=prev_items
+            )
+            self.container.contents[section_index] = curr_section
+            if curr_section.items_length > 0:
+                curr_section.update_expirey()
+                msg = f"Retrieved Section {index}: '{section_title}'"
+            else:
+                msg = f"Fail to Retrieved Section {index}: '{section_title}'.\nDetail: Section not containing files."
+
+            renderer.clear_status()
+            renderer.log(msg)
+            self.section_done(index, curr_section)
+
+        details, self.details = self.details, list()
+        self.extract_details(details)
+
+        renderer.log("#" * int(terminal_cols / 2))
+        renderer.log("Retrieval Complete! Now Downloading Files...")
+        renderer.log("#" * int(terminal_cols * 3 / 4))
+
+    def extract_modules(
+        self,
+        modules: List[Dict],
+        curr_section: section_info,
+        prev_items: Dict[str, item_info] = None,
+    ) -> section_info:
+        if prev_items is None:
+            prev_items = curr_section.items
+        for module in modules:
+            if module["modname"] in inline_modules:
+                continue
+            if not module.get("uservisible", True):
+                continue
+            module_id = str(module["id"])
+            curr_type = module["modname"]
+
+            curr_item = prev_items.get(module_id)
+            module_fingerprint = fingerprint(stable_json(module))
+            if (
+                not isinstance(curr_item, item_info)
+                or curr_item.checksum != module_fingerprint
+                or time() > curr_item.expirey
+            ):
+                prev_item = curr_item
+                curr_item = item_info(
+                    id=module_id,
+                    title=module["name"],
+                    type=curr_type,
+                    link=view_url.format(curr_type, module_id),
+                    checksum=module_fingerprint,
+                )
+                if isinstance(prev_item, item_info):
+                    curr_item.keep_detail(prev_item)
+
+            if "contents" in module:
+                curr_item.detail["files"] = [
+                    {key: file.get(key) for key in file_fields}
+                    for file in module["contents"]
+                    if file.get("type") == "file"
+                ]
+
+            if curr_item.type in [
+                mod_type.folder.name,
+                mod_type.lti.name,
+            ] and not curr_item.is_detail_current(self.detail_validator(curr_item)):
+                self.details.append(curr_item)
+
+            curr_item.content = list()
+            if module.get("description"):
+                description = parse_html(
+                    content=module["description"],
+                    mode=self.container.config["html_parser"],
+                )
+                curr_item.content.append(description.get_text().replace("\xa0", ""))
+            curr_section.items[module_id] = curr_item
+        return curr_section